@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+asyncwritepop
+=============
+Write the populations on the SQLite database in a background thread, while
+the evolver computes the next generation.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+import threading
+import Queue
+import logging
+import sqlite3 as sqlite
+
+from pystepx.basewritepop import BaseWritePop
+
+
+class AsyncPopWriter(object):
+    """
+    Background writer of the populations.
+
+    The thread owns its own sqlite connection (a connection can not be
+    shared between threads). The populations to write are given through a
+    bounded queue: when the writer is late of maxsize populations, the
+    evolver waits for it. The barrier method waits until everything given
+    before has been committed on disc.
+    """
+
+    def __init__(self, dbname, maxsize=2):
+        """
+        Start the writer thread.
+
+        @param dbname: path of the database
+        @param maxsize: max number of populations waiting to be written
+        """
+        self._dbname = dbname
+        self._queue = Queue.Queue(maxsize)
+        self._error = None
+
+        self._thread = threading.Thread(target=self._run, name='AsyncPopWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """Loop of the writer thread."""
+        con = sqlite.connect(self._dbname)
+        popwriter = BaseWritePop(con)
+
+        while True:
+            order = self._queue.get()
+            try:
+                if order[0] == 'write':
+                    popwriter.create_new_table(order[1])
+                    popwriter.add_new_individuals(order[2], order[1], True)
+                    popwriter.flush()
+            except Exception, e:
+                logging.error('Error while writing %s' % order[1])
+                logging.error(e)
+                self._error = e
+            finally:
+                if order[0] in ('barrier', 'stop'):
+                    order[1].set()
+                self._queue.task_done()
+
+            if order[0] == 'stop':
+                con.close()
+                return
+
+    def _check(self):
+        """Raise in the caller thread the last error of the writer."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, tablename, individuals):
+        """
+        Ask to write a population in a new table.
+        Waits when the queue is full.
+
+        @param tablename: name of the table to create
+        @param individuals: list of (o_id, tree, tree mapping, tree depth,
+        evaluated, fitness) tuples. They must not be modified after the call.
+        """
+        self._check()
+        self._queue.put(('write', tablename, individuals))
+
+    def barrier(self):
+        """
+        Durability barrier: waits until all the populations given before are
+        committed on disc.
+        """
+        done = threading.Event()
+        self._queue.put(('barrier', done))
+        done.wait()
+        self._check()
+
+    def close(self):
+        """Write the remaining populations and stop the thread."""
+        done = threading.Event()
+        self._queue.put(('stop', done))
+        done.wait()
+        self._thread.join()
+        self._check()
@@ -33,12 +33,15 @@ import pprint
 import math
 import logging
 import copy
+import random
+import time
 import numpy as np
 
 
 from pystepx.geneticoperators import selection, crossutil
 from pystepx.tree import buildtree
 import pystepx.writepop as writepop
+from pystepx.asyncwritepop import AsyncPopWriter
 
 cimport numpy as np
 
@@ -63,6 +66,33 @@ class PopSizeError(EvolutionException):
     """Exception related to pop size"""
 
 
+# Offsprings of a crossover kept in the new population
+OFFSPRING_POLICIES = ('both', 'random', 'best')
+
+# Number of parents treated together with the low memory footprint
+LOW_MEMORY_BATCH_SIZE = 50
+
+
+class FitnessEvaluation(object):
+    """
+    Fitness function given to the executor: a tree which can not be
+    evaluated gets an infinite fitness. It can be pickled (to evaluate the
+    trees in other processes) when the fitness function can be pickled.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, tree):
+        try:
+            return self.function(tree)
+        except Exception, e:
+            logging.error('Error while evaluating a tree')
+            logging.error(e)
+            logging.error(tree)
+            return float('inf')
+
+
 cdef class BaseEvolver(object):
     """Evolver object.
     Launch the fitness computing on the trees.
@@ -74,7 +104,8 @@ cdef class BaseEvolver(object):
         :param maxdepth: max depth of trees in new generation (should be >=3)
         :param buildmethod: which Koza method is used to build the trees (either
         'AddHalfNode' or 'AddFullNode' or 'AddGrowNodeMin' respectively for
-        Ramped Half-n-Half, Full, or Half)
+        Ramped Half-n-Half, Full, or Half), or 'AddPTC2Node' for the
+        Probabilistic Tree Creation 2 (trees of min_size to max_size nodes)
         :param max_nb_runs: the search will gon on until a maximum number of generations
         is reached
         :param fitness_criterion: the search will stop if the fitness found is <= to
@@ -84,8 +115,29 @@ cdef class BaseEvolver(object):
         :param mutation_prob: probability of crossover (will determine what proportion of
         the population will be replaced by mutation-generated offsprings)
         :param dbname: path to database e.g. r'D:\3d_work\pythongp\pySTGP_0.51\src\pop_db'
+        :param min_size: min number of nodes of the initial trees (PTC2 only)
+        :param max_size: max number of nodes of the initial trees (PTC2 only)
+        :param offspring_policy: offsprings of a crossover kept in the new
+        population: 'both' (they fill two slots), 'random' (one of them chosen
+        at random, the other one is not evaluated) or 'best' (the one with the
+        lowest fitness)
+        :param max_nodes: max number of nodes of the offsprings (0 for no
+        limit). The typed crossover respects it by construction. The subtree
+        mutation chooses a new subtree whose smallest expansion fits, and
+        keeps the old subtree when PTC2 does not build one within the limit.
+        The Koza crossover works by rejection: the bigger offsprings are
+        refused, and the parents are copied when no crossover fits. The trees
+        never grow over max_nodes (the initial trees are not limited).
+        :param lexicographic_parsimony: if True, the smallest tree wins the
+        tournaments between individuals of same fitness
+        :param tarpeian_rate: probability to kill an offspring bigger than the
+        average of its parents population (Tarpeian method): it gets an infinite
+        fitness without being evaluated
+        :param double_tournament: if not null, probability to select the
+        smallest of the winners of two fitness tournaments (double tournament)
     """
 
+    cdef public int _minsize, _maxsize, _maxnodes
     cdef public int _popsize, _mindepth, _maxdepth, _max_nb_runs, _size, _last_generation
     cdef public float _crossover_prob, _mutation_prob, _prob_selection, _fitness_criterion, _current_best_fitness
     cdef public str __db_name__
@@ -110,6 +162,34 @@ cdef class BaseEvolver(object):
     # Grammar of the trees
     cdef public dict __rules__
 
+    # Statistics of the last computed generation
+    cdef public dict _generation_stats
+
+    # Offsprings kept by the crossover and fitness of the trees already
+    # evaluated during the generation
+    cdef public str _offspring_policy
+    cdef public dict _fitness_cache
+
+    # Object with a map method used to evaluate the offsprings (None for
+    # the builtin map)
+    cdef public _executor
+
+    # With the asynchronous writing, the populations are written by a
+    # background thread and the last one is kept in memory (by o_id)
+    cdef public bint _async_write
+    cdef public _writer
+    cdef public str _population_table
+    cdef public dict _population
+    cdef public list _next_population
+
+    # Parsimony pressure in the selection and average size of the parents
+    cdef public bint _lexicographic
+    cdef public float _tarpeian_rate, _double_tournament, _average_size
+
+    # Fingerprints of the trees which must not be bred again (see
+    # crossutil.GetTreeFingerprint)
+    cdef public set _rejected_fingerprints
+
     def __init__( self,
                   int popsize = 200,
                   root_node = (0, 1, 'root'),
@@ -122,7 +202,14 @@ cdef class BaseEvolver(object):
                   float mutation_prob = 0.49,
                   int size = 7,
                   float prob_selection = 0.8,
-                  str dbname = '/tmp/pySTEPX.sqlite'
+                  str dbname = '/tmp/pySTEPX.sqlite',
+                  int min_size = 1,
+                  int max_size = 0,
+                  str offspring_policy = 'best',
+                  int max_nodes = 0,
+                  bint lexicographic_parsimony = False,
+                  float tarpeian_rate = 0.0,
+                  float double_tournament = 0.0
                   ):
         """
         Initialize the evolution object with the various parameters
@@ -130,6 +217,14 @@ cdef class BaseEvolver(object):
 
         assert popsize > size, \
                 "Population size (%d) cannot be inferior to size of tournament (%d)" % (popsize, size)
+        assert buildmethod != 'AddPTC2Node' or 1 <= min_size <= max_size, \
+                "PTC2 needs 1 <= min_size (%d) <= max_size (%d)" % (min_size, max_size)
+        assert offspring_policy in OFFSPRING_POLICIES, \
+                "Unknown offspring policy %s" % offspring_policy
+        assert 0 <= tarpeian_rate <= 1, \
+                "Tarpeian rate (%f) must be a probability" % tarpeian_rate
+        assert double_tournament == 0 or 0.5 <= double_tournament <= 1, \
+                "Double tournament (%f) must be null or in [0.5, 1]" % double_tournament
 
         self._set_start_from_scratch( False)
 
@@ -139,6 +234,14 @@ cdef class BaseEvolver(object):
         self._mindepth    = min_depth
         self._maxdepth    = max_depth
         self._buildmethod = buildmethod
+        self._minsize     = min_size
+        self._maxsize     = max_size
+        self._maxnodes    = max_nodes
+        self._lexicographic     = lexicographic_parsimony
+        self._tarpeian_rate     = tarpeian_rate
+        self._double_tournament = double_tournament
+        self._average_size      = 0
+        self._offspring_policy = offspring_policy
         self._max_nb_runs = max_nb_runs
         self._fitness_criterion   = fitness_criterion
         self._crossover_prob      = crossover_prob
@@ -161,6 +264,125 @@ cdef class BaseEvolver(object):
         self._current_best_fitness = 0
 
         self._last_generation = -1
+        self._generation_stats = {}
+        self._fitness_cache = {}
+        self._executor = None
+        self._async_write = False
+        self._writer = None
+        self._population_table = None
+        self._population = None
+        self._next_population = []
+        self._rejected_fingerprints = set()
+
+    def _set_executor(self, executor):
+        """
+        Set the executor used to evaluate the offsprings: any object with
+        a map(function, iterable) method (e.g. a multiprocessing.Pool),
+        or None for the builtin map.
+        """
+        self._executor = executor
+
+    def _set_async_write(self, value):
+        """
+        Set if the populations are written in the database by a background
+        thread (see AsyncPopWriter) while the next generation is computed
+        from the copy kept in memory.
+        """
+        self._async_write = value
+
+    def sync(self):
+        """
+        Durability barrier: waits until all the computed populations are
+        written in the database.
+        """
+        if self._writer is not None:
+            self._writer.barrier()
+
+    def _release_population(self):
+        """
+        Write the population kept in memory and forget it (it is read again
+        from the database by the next generation). Called before modifying
+        the last population in the database.
+        """
+        self.sync()
+        self._population_table = None
+        self._population = None
+
+    def _close_writer(self):
+        """Write the remaining populations and stop the background writer."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        """
+        Write the remaining populations, stop the background writer and
+        close the database.
+        """
+        try:
+            self._close_writer()
+        finally:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def get_fitness_criterion(self):
+        """Returns the fitness under which the solution is found."""
+        return self._fitness_criterion
+
+    def _load_population(self, str tablename):
+        """Read a population from the database to keep it in memory."""
+        keys = selection.GetDBKeysAndFitness(self._con, tablename)
+        self._population = self._popwriter.get_individuals(tablename,
+                [elem[0] for elem in keys])
+        self._population_table = tablename
+
+    def _set_population(self, str tablename, list individuals):
+        """
+        Keep the new population in memory (the individuals are numbered from
+        1) and give it to the background writer.
+        """
+        cdef int i
+
+        individuals = [(i + 1,) + individuals[i][1:] for i in xrange(len(individuals))]
+        self._population = dict((individual[0], individual[1:]) for individual in individuals)
+        self._population_table = tablename
+        self._writer.write(tablename, individuals)
+
+    def _get_keys_and_fitness(self, str tablename):
+        """Returns the ordered ids, fitnesses and sizes of a population
+        (see selection.GetDBKeysAndFitness)."""
+        if tablename == self._population_table:
+            return selection.GetKeysAndFitness(self._population)
+        return selection.GetDBKeysAndFitness(self._con, tablename)
+
+    def _get_individuals(self, str tablename, keys):
+        """Returns the required individuals by o_id (see WritePop.get_individuals)."""
+        if tablename == self._population_table:
+            return dict((int(key), self._population[key]) for key in keys)
+        return self._popwriter.get_individuals(tablename, keys)
+
+    def _get_average_size(self, str tablename):
+        """Returns the average number of nodes of the trees of a population."""
+        if tablename == self._population_table:
+            return np.mean([crossutil.GetSizeFromIndicesMapping(individual[1])
+                            for individual in self._population.itervalues()])
+        return self._popwriter.get_average_size(tablename)
+
+    def _get_population_summary(self, str tablename):
+        """Returns the number of trees of a population, their average size
+        and depth, and the number of distinct trees
+        (see WritePop.get_population_summary)."""
+        if tablename == self._population_table:
+            individuals = self._population.values()
+            if not individuals:
+                return (0, 0, 0, 0)
+            return (len(individuals),
+                    np.mean([crossutil.GetSizeFromIndicesMapping(individual[1])
+                             for individual in individuals]),
+                    np.mean([individual[2] for individual in individuals]),
+                    len(set([str(individual[0]) for individual in individuals])))
+        return self._popwriter.get_population_summary(tablename)
 
     def _set_low_memory_footprint(self, value):
         self.__low_memory_footprint__ = value
@@ -218,15 +440,21 @@ cdef class BaseEvolver(object):
         XXX move in the popwritter
         """
 
+        if self._async_write:
+            # written at the end of the generation by the background writer
+            self._next_population.extend(self._new_pop)
+            del self._new_pop[:]
+            return
+
         self._popwriter.add_new_individuals(self._new_pop, tablename)
 
 
         del self._new_pop[:]
         del self._trees[:]
+        if self.__low_memory_footprint__:
+            self._fitness_cache.clear()
         self._popwriter.flush()
 
-
-
     cpdef _build_initial_population(self):
         """
         Generate the initial population, 
@@ -259,24 +487,32 @@ cdef class BaseEvolver(object):
         self._tablename.append('pop0')
 
         # Build the initial trees and compute their fitness
+        # (the trees are generated by batches, see BuildTree.generate)
         trees, fitnesses = [], []
         i = 0
-        method  = getattr(buildtree.BuildTree(self.__rules__), self._buildmethod)
+        builder = buildtree.BuildTree(self.__rules__)
 
         if not self.__low_memory_footprint__:
 
             #Classical way of creating
+            known = set()
             while i < self._popsize:
-                # create a tree individual
-                my_tree = method(   self._root_node,
-                                    0,
-                                    self._mindepth,
-                                    self._maxdepth)
-
-                if my_tree not in trees:
-                    trees.append(my_tree)
-                    fitnesses.append(self.__FitnessFunction(my_tree))
-                    i = i+1
+                batch = builder.generate(self._popsize - i,
+                                         self._buildmethod,
+                                         self._mindepth,
+                                         self._maxdepth,
+                                         self._root_node,
+                                         minsize=self._minsize,
+                                         maxsize=self._maxsize)
+                for index in xrange(len(batch)):
+                    # create a tree individual
+                    gptree = batch.tree(index)
+                    if gptree not in known:
+                        known.add(gptree)
+                        my_tree = gptree.to_list()
+                        trees.append(my_tree)
+                        fitnesses.append(self.__FitnessFunction(my_tree))
+                        i = i+1
 
             # Store them in database
             self._popwriter.write_initial_population(  trees,
@@ -288,21 +524,25 @@ cdef class BaseEvolver(object):
             self._popwriter.create_new_table(self._tablename[0])
 
             while i < self._popsize:
-                my_tree = method(   self._root_node,
-                                    0,
-                                    self._mindepth,
-                                    self._maxdepth)
+                batch = builder.generate(min(self._popsize - i, 50),
+                                         self._buildmethod,
+                                         self._mindepth,
+                                         self._maxdepth,
+                                         self._root_node,
+                                         minsize=self._minsize,
+                                         maxsize=self._maxsize)
 
                 #XXX Check if tree already exists ?
+                for index in xrange(len(batch)):
+                    my_tree = batch.to_list(index)
 
-                i = i + 1
-                fitness = self.__FitnessFunction(my_tree)
-                self._popwriter.add_to_initial_population( my_tree, fitness, self._tablename[0])
+                    i = i + 1
+                    fitness = self.__FitnessFunction(my_tree)
+                    self._popwriter.add_to_initial_population( my_tree, fitness, self._tablename[0])
 
-                del my_tree[:]
+                    del my_tree[:]
 
-                if i % 50 == 0:
-                    self._popwriter.flush() #write db on disc to avoid swapping
+                self._popwriter.flush() #write db on disc to avoid swapping
 
             self._popwriter.flush() #write the final pop
 
@@ -320,6 +560,13 @@ cdef class BaseEvolver(object):
         """
         return self._last_generation
 
+    def get_generation_stats(self):
+        """
+        Returns the statistics of the last computed generation
+        (counters of the genetic operators).
+        """
+        return dict(self._generation_stats)
+
     def get_best_individual(self, all=False):
         """
         Returns information about the best individual.
@@ -327,16 +574,14 @@ cdef class BaseEvolver(object):
         @todo use a method in writepop and optimize
         """
 
-        cdef np.ndarray db_list = selection.GetDBKeysAndFitness(
-                               self._con,
-                               self._selected_table)
+        cdef np.ndarray db_list = self._get_keys_and_fitness(self._selected_table)
         chosen = selection.SelectDBOneFittest(db_list)
 
         if all is False:
             return chosen
         else:
-            
-            res = self._popwriter.get_individual(self._tablename[-1],chosen[0])
+            self.sync()
+            res = self.load_tree(self._selected_table, chosen[0])
             return chosen[0], chosen[1], res[1]
 
     def print_end_generation(self, generation, chosen_one, verbose, print_tree):
@@ -355,6 +600,7 @@ cdef class BaseEvolver(object):
                             str(chosen_one[1])])
 
             if print_tree is True:
+                self.sync()
                 data = self._popwriter.get_individual( self._tablename[generation], chosen_one[0], True)
                 pprint.pprint(data[1])
 
@@ -362,6 +608,8 @@ cdef class BaseEvolver(object):
         """Method called when a generation is over."""
 
         if self.__end_of_generation_handler__ is not None:
+            # the handler can read the database
+            self.sync()
             self.__end_of_generation_handler__()
 
 
@@ -393,6 +641,8 @@ cdef class BaseEvolver(object):
         while True:
             tablename = 'pop%d' % i
             if self._popwriter.is_generation_computed(tablename):
+                # the databases of the older versions have no treesize
+                self._popwriter.add_missing_treesize(tablename)
                 self._tablename.append(tablename)
                 self._last_generation = i
                 i = i+1
@@ -459,7 +709,7 @@ cdef class BaseEvolver(object):
         """
         Returns the real popsize
         """
-        db_list = selection.GetDBKeysAndFitness(self._con, self._selected_table)
+        db_list = self._get_keys_and_fitness(self._selected_table)
         return len(db_list)
 
 
@@ -495,7 +745,7 @@ cdef class BaseEvolver(object):
 
         cdef int crossover_size, mutation_size, reproduction_size
         cdef int i
-        cdef np.ndarray db_list, reprod, cross, mut
+        cdef np.ndarray db_list, reprod, cross, cross2, mut
 
         (crossover_size,
         mutation_size,
@@ -505,11 +755,36 @@ cdef class BaseEvolver(object):
                                 popsize
                             )
 
-        self._popwriter.create_new_table(tablename2)
+        if self._async_write:
+            assert not self.__low_memory_footprint__, \
+                    "The asynchronous writing keeps the population in memory"
+            if self._writer is None:
+                self._writer = AsyncPopWriter(self.__db_name__)
+            if tablename != self._population_table:
+                self._load_population(tablename)
+            self._next_population = []
+        else:
+            self._popwriter.create_new_table(tablename2)
+        self._generation_stats = {'crossover_failed_attempts': 0,
+                                  'evaluations': 0,
+                                  'evaluations_saved': 0,
+                                  'tarpeian_kills': 0,
+                                  'duplicates_rejected': 0,
+                                  'time_select': 0,
+                                  'time_fetch': 0,
+                                  'time_breed': 0,
+                                  'time_dedup': 0,
+                                  'time_evaluate': 0,
+                                  'time_write': 0}
+        self._fitness_cache.clear()
+        self.__crossover_operator__.reset_statistics()
+        self.__mutator__.reset_statistics()
 
         logging.info('Get couples of fitness/keys')
+        start = time.time()
         # get the ordered list of fitnesses with identifier keys
-        db_list = selection.GetDBKeysAndFitness(con, tablename)
+        db_list = self._get_keys_and_fitness(tablename)
+        self._average_size = self._get_average_size(tablename)
 
         # start by selecting fittest parents for reproduction
         # then select parents for crossover
@@ -517,244 +792,320 @@ cdef class BaseEvolver(object):
         logging.info('Select for reproduction')
         selected  = selection.SelectDBSeveralFittest(   int(reproduction_size), db_list)
 
-        logging.info('Apply reproduction')
-        self._do_reproduction_for(selected, tablename, tablename2)
-
-        # Apply cross over
-        logging.info('Apply cross-over')
         logging.info('%d individuals to generate and select them in a '
                      'trournament of  %d individuals'
                      ' in a population of %d individuals' % \
                         (int(crossover_size), size, len(db_list)))
-        selected = selection.TournamentSelectDBSeveral(
+        cross = selection.TournamentSelectDBSeveral(
                       int(crossover_size),
                       size,
                       prob_selection,
-                      db_list)
-        self._do_crossover_for(selected, tablename, tablename2, db_list)
-
-        logging.info('Apply mutation')
-        selected = selection.TournamentSelectDBSeveral(
+                      db_list,
+                      lexicographic=self._lexicographic,
+                      double_tournament=self._double_tournament)
+        # second parents of the crossovers
+        cross2 = selection.TournamentSelectDBSeveral(
+                      int(crossover_size),
+                      7, #TODO configure that
+                      0.8,
+                      db_list,
+                      lexicographic=self._lexicographic,
+                      double_tournament=self._double_tournament)
+        mut = selection.TournamentSelectDBSeveral(
                       int(mutation_size),
                       size,
                       prob_selection,
-                      db_list)
-        self._do_mutation_for(selected, tablename, tablename2)
+                      db_list,
+                      lexicographic=self._lexicographic,
+                      double_tournament=self._double_tournament)
+        self._generation_stats['time_select'] += time.time() - start
+
+        logging.info('Apply reproduction')
+        start = time.time()
+        self._do_reproduction_for(selected, tablename, tablename2)
+        self._generation_stats['time_write'] += time.time() - start
 
+        logging.info('Apply cross-over and mutation')
+        self._do_offsprings_for(cross, cross2, mut, tablename, tablename2)
+        if self._async_write:
+            start = time.time()
+            self._set_population(tablename2, self._next_population)
+            self._next_population = []
+            self._generation_stats['time_write'] += time.time() - start
+        self._generation_stats['average_size'] = self._get_average_size(tablename2)
 
-        self._write_computed_population_to_db(tablename2)
+        for key, value in self.__crossover_operator__.get_statistics().iteritems():
+            self._generation_stats['crossover_' + key] = value
+        for key, value in self.__mutator__.get_statistics().iteritems():
+            self._generation_stats['mutation_' + key] = value
+        logging.info('Generation statistics %s' % str(self._generation_stats))
 
 
 
     cpdef _do_reproduction_for(self, np.ndarray reprod, str tablename, str tablename2):
         """Apply the reproduction operator on this programs."""
 
-        self._popwriter.copy_individuals_from_to(reprod, tablename, tablename2)
-
-
-    def _do_mutation_for(self, np.ndarray mut, str tablename, str tablename2):
-        """Apply the mutation operator on these programs."""
-
-        cdef int nb_iter = 0
-        cdef float result_fitness
-        cdef long o_id
-        cdef bint same_tree
-
-        cdef list my_tree, my_tree_mapping
-        cdef int my_treedepth
+        if self._async_write:
+            self._next_population.extend([(elem[0],) + self._population[elem[0]]
+                                          for elem in reprod])
+        else:
+            self._popwriter.copy_individuals_from_to(reprod, tablename, tablename2)
 
-        for elem in mut:
-            logging.debug('Mutation of %s', str(elem))
 
-            o_id = elem[0]
-            myresult, my_tree, \
-                my_tree_mapping, my_treedepth, \
-                my_evaluated, my_fitness = self._popwriter.get_individual(tablename, o_id, extract=True)
-            same_tree       = True
+    def get_tree(self, str tablename, int o_id):
+        """Return the required tree.
+        :TODO: move this in the right class
+        """
 
-            # First test of mutation, fail if the same or already exists
-            mt = self.__mutator__.mutate(
-                self._maxdepth,
-                my_tree,
-                my_tree_mapping,
-                my_treedepth)
-            same_tree = mt[0]
+        return self._popwriter.get_individual( tablename, o_id)
 
-            if mt in self._trees:
-                same_tree = True
-            # make sure to try another mutation if the offspring is identical to the parent
-            if same_tree == True:
-                while same_tree == True:
-                    mt = self.__mutator__.mutate(
-                        self._maxdepth,
-                        my_tree,
-                        my_tree_mapping,
-                        my_treedepth)
-                    same_tree = mt[0]
 
+    def load_tree(self, str tablename, int o_id):
+        """Load the information of the tree"""
 
-            mt_map    = crossutil.GetIndicesMappingFromTree(mt[1])
-            mt_depth  = crossutil.GetDepthFromIndicesMapping(mt_map)
-            mt_evaluated = 1
+        return self._popwriter.get_individual( tablename, o_id, extract=True)
 
-            # get fitness of the tree
-            try:
-                result_fitness = self.__FitnessFunction(mt[1])
-            except Exception, e:
-                logging.error('Error while evaluating a mutated tree')
-                logging.error(e)
-                logging.error(mt[1])
 
-            self._new_pop.append((o_id, mt[1], mt_map, mt_depth, mt_evaluated, result_fitness))
+    def _do_offsprings_for(self, np.ndarray cross, np.ndarray cross2, np.ndarray mut,
+                           str tablename, str tablename2):
+        """
+        Build, evaluate and write the offsprings of the crossovers and of the
+        mutations. The parents are treated by batches (the whole generation,
+        or LOW_MEMORY_BATCH_SIZE parents with the low memory footprint), each
+        batch going through the stages:
+         - fetch: the parents are read from the database in one query
+         - breed: the genetic operators build all the offsprings
+         - dedup: the offsprings already evaluated during the generation
+           (or killed by the Tarpeian method) are not evaluated again
+         - evaluate: the fitness function is mapped on the remaining
+           offsprings with the executor (see _set_executor)
+         - write: the offsprings are written in the database in bulk
+        The time spent in each stage is added to the generation statistics.
+
+        :param cross: first parents of the crossovers
+        :param cross2: second parents of the crossovers
+        :param mut: parents of the mutations
+        """
+        cdef list tasks, batch, groups
+        cdef dict parents, pending
+        cdef int batch_size, first
+        # with the 'both' policy, each crossover fills two slots
+        cdef int needed = len(cross)
+
+        tasks = [('crossover', cross[i][0], cross2[i][0]) for i in xrange(len(cross))] \
+                + [('mutation', elem[0], None) for elem in mut]
+        batch_size = LOW_MEMORY_BATCH_SIZE if self.__low_memory_footprint__ else len(tasks)
+
+        for first in xrange(0, len(tasks), max(1, batch_size)):
+            # the crossovers which are not needed anymore are not done
+            batch = [task for task in tasks[first:first + batch_size]
+                     if task[0] == 'mutation' or needed > 0]
+            if not batch:
+                continue
+
+            start = time.time()
+            parents = self._get_individuals(tablename,
+                    [task[1] for task in batch] + [task[2] for task in batch
+                                                   if task[2] is not None])
+            self._generation_stats['time_fetch'] += time.time() - start
+
+            start = time.time()
+            groups = []
+            for task in batch:
+                if task[0] == 'crossover' and needed > 0:
+                    group = self._breed_crossover(parents[task[1]], parents[task[2]], needed)
+                    needed -= len(group[0]) if not group[1] else 1
+                elif task[0] == 'mutation':
+                    group = self._breed_mutation(parents[task[1]])
+                else:
+                    continue
+                groups.append((task[1],) + group)
+            self._generation_stats['time_breed'] += time.time() - start
+
+            start = time.time()
+            pending = self._dedup_offsprings(groups)
+            self._generation_stats['time_dedup'] += time.time() - start
+
+            start = time.time()
+            self._evaluate_offsprings(pending)
+            self._generation_stats['time_evaluate'] += time.time() - start
+
+            start = time.time()
+            self._collect_offsprings(groups)
+            self._write_computed_population_to_db(tablename2)
+            self._generation_stats['time_write'] += time.time() - start
 
-            nb_iter = nb_iter + 1
-            if self.__low_memory_footprint__ and nb_iter%50 == 0:
-                self._write_computed_population_to_db(tablename2)
 
-        if self.__low_memory_footprint__:
-            self._write_computed_population_to_db(tablename2)
+    cdef tuple _breed_crossover(self, tuple parent1, tuple parent2, int needed):
+        """
+        Apply the crossover on two parents.
 
+        :param parent1: (tree, mapping, depth, evaluated, fitness) of the first parent
+        :param parent2: same for the second parent
+        :param needed: number of crossover offsprings still needed
 
-    def get_tree(self, str tablename, int o_id):
-        """Return the required tree.
-        :TODO: move this in the right class
+        :return: a tuple (candidates, best) where candidates is the list of
+        the (key, tree, mapping, depth) of the offsprings and best is True if
+        only the best candidate must be kept
+        """
+        cdef tuple cs
+        cdef list candidates
+        cdef int i = 0
+        cdef bint legal = False
+
+        # an offspring identical to a parent is not evaluated again
+        self._fitness_cache[str(parent1[0])] = parent1[4]
+        self._fitness_cache[str(parent2[0])] = parent2[4]
+
+        cs = ([0, 0, 0, 0],)
+        if self.__crossover_operator__.is_typed_crossover():
+            # The points are legal by construction: only one try
+            cs = self.__crossover_operator__.TypedCrossover(
+                              self._maxdepth,
+                              parent1[0],
+                              parent2[0],
+                              parent1[1],
+                              parent2[1],
+                              self._maxnodes)
+            legal = cs[0] == [1, 1, 1, 1]
+
+        #Try the crossover at maximum 100 times
+        while not legal and i < 100 \
+                and not self.__crossover_operator__.is_typed_crossover():
+
+            cs = self.__crossover_operator__.Koza1PointCrossover(
+                              self._maxdepth,
+                              parent1[0],
+                              parent2[0],
+                              parent1[1],
+                              parent2[1],
+                              parent1[2],
+                              parent2[2],
+                              True)
+            # the offsprings bigger than max_nodes are refused
+            legal = cs[0] == [1, 1, 1, 1] and (self._maxnodes <= 0 \
+                    or max(crossutil.GetSizeFromIndicesMapping(cs[3]),
+                           crossutil.GetSizeFromIndicesMapping(cs[5])) <= self._maxnodes)
+            if not legal:
+                self._generation_stats['crossover_failed_attempts'] += 1
+            i = i + 1
+
+        # if after trying 100 times , the crossover cannot give a correct offspring, then
+        # create a new offspring using mutation...
+        if not legal and self.__Substitute_Mutation == True:
+            return self._breed_mutation(parent1)
+
+        # the crossover operator gives the mappings and the depths of the offsprings
+        if legal:
+            candidates = [(str(cs[1]), cs[1], cs[3], cs[4]),
+                          (str(cs[2]), cs[2], cs[5], cs[6])]
+        else:
+            # no legal offspring (rules, depth or size): the parents are copied
+            candidates = [(str(parent1[0]), parent1[0], parent1[1], parent1[2]),
+                          (str(parent2[0]), parent2[0], parent2[1], parent2[2])]
+
+        # Only the kept offsprings are evaluated: both of them, one
+        # chosen at random, or both to keep the best one (the fitness
+        # is minimized)
+        if self._offspring_policy == 'random':
+            self._generation_stats['evaluations_saved'] += 1
+            return ([random.choice(candidates)], False)
+        if self._offspring_policy == 'both':
+            return (candidates[:needed], False)
+        return (candidates, True)
+
+
+    cdef tuple _breed_mutation(self, tuple parent):
         """
+        Apply the mutation on a parent.
 
-        return self._popwriter.get_individual( tablename, o_id)
+        :param parent: (tree, mapping, depth, evaluated, fitness) of the parent
 
+        :return: a tuple (candidates, best), see _breed_crossover
+        """
+        # make sure to try another mutation if the offspring is identical to the parent
+        mt = self.__mutator__.mutate(self._maxdepth, parent[0], parent[1], parent[2], True,
+                                     self._maxnodes)
+        while mt[0] == True:
+            mt = self.__mutator__.mutate(self._maxdepth, parent[0], parent[1], parent[2], True,
+                                         self._maxnodes)
 
-    def load_tree(self, str tablename, int o_id):
-        """Load the information of the tree"""
+        # the mutator gives the mapping and the depth of the mutated tree
+        return ([(str(mt[1]), mt[1], mt[2], mt[3])], False)
 
-        return self._popwriter.get_individual( tablename, o_id, extract=True)
- 
 
-    cdef _do_crossover_for(self, np.ndarray cross, str tablename, str tablename2, np.ndarray db_list):
+    cdef dict _dedup_offsprings(self, list groups):
         """
-        Operate the crossover for the selected population.
+        Returns the offsprings which must be evaluated, by key.
+
+        The offsprings already evaluated during the generation (e.g. identical
+        to one of their parents) or present twice are evaluated only once.
+        With the Tarpeian method, an offspring bigger than the average of the
+        parents population is killed with the tarpeian rate probability: it
+        gets an infinite fitness and the fitness function is not called.
+        The offsprings whose fingerprint is rejected are killed the same way.
         """
-        cdef int i
-        cdef int o_id, o_id2
-        cdef np.ndarray parent2
-        cdef np.ndarray elem, elem2
-        cdef tuple cs
+        cdef dict pending = {}
+        cdef tuple group, candidate
+
+        for group in groups:
+            for candidate in group[1]:
+                if candidate[0] in self._fitness_cache or candidate[0] in pending:
+                    self._generation_stats['evaluations_saved'] += 1
+                elif self._rejected_fingerprints \
+                        and crossutil.GetTreeFingerprint(candidate[0]) in self._rejected_fingerprints:
+                    self._generation_stats['duplicates_rejected'] += 1
+                    self._fitness_cache[candidate[0]] = float('inf')
+                elif self._tarpeian_rate > 0 \
+                        and crossutil.GetSizeFromIndicesMapping(candidate[2]) > self._average_size \
+                        and random.random() < self._tarpeian_rate:
+                    self._generation_stats['tarpeian_kills'] += 1
+                    self._fitness_cache[candidate[0]] = float('inf')
+                else:
+                    pending[candidate[0]] = candidate[1]
+        return pending
+
+
+    cpdef _evaluate_offsprings(self, dict pending):
+        """
+        Evaluate the offsprings with the executor and store their fitness
+        in the cache of the generation.
 
-        cdef int nb_iter = 0
-        cdef float offspring1_result_fitness = float('inf')
-        cdef float offspring2_result_fitness = float('inf')
-
-        cdef int my_evaluated1, my_evaluated2
-        cdef int my_tree1depth, my_tree2depth
-        cdef float my_fitness1,my_fitness2
-
-        # Get the list of trees to treat
-        trees = self._popwriter.get_individuals_iterator(tablename, cross, extract=True)
-
-        # Loop over all trees and apply crossover
-        idx_parent = -1 # pointer to obtain real o_id
-        for (myresult1, cp_my_tree1, cp_my_tree1_mapping, my_tree1depth, my_evaluated1, my_fitness1)  in trees:
-
-            idx_parent = idx_parent + 1
-            # TODO remove this ugly management with idw_parent
-
-
-            # select the second parent using tournament selection
-            parent2 = selection.TournamentSelectDBSeveral(2, 7, 0.8, db_list, unique=True)
-            #TODO configure that
-
-            # make sure parent2 is different from parent1
-#            if np.all(elem == parent2[0]):
-#                elem2 = parent2[1]
-#            else:
-#                elem2 = parent2[0]
-
-
-            o_id = cross[idx_parent][0]
-            o_id2 = parent2[0][0]
-
-            (myresult2,
-                    cp_my_tree2,
-                    cp_my_tree2_mapping,
-                    my_tree2depth,
-                    my_evaluated2,
-                    my_fitness2) = self.load_tree(tablename, o_id2)
- 
-            # get fitness of the tree
-            cs_evaluated = 1
-            cs = ([0, 0, 0, 0],)
-            i = 0
-
-            #Try the crossover at maximum 100 times
-            while cs[0] != [1, 1, 1, 1] and i < 100 :
-
-                cs = self.__crossover_operator__.Koza1PointCrossover(
-                                  self._maxdepth,
-                                  cp_my_tree1,
-                                  cp_my_tree2,
-                                  cp_my_tree1_mapping,
-                                  cp_my_tree2_mapping,
-                                  my_tree1depth,
-                                  my_tree2depth)
-                i = i + 1
-
-            # if after trying 100 times , the crossover cannot give a correct offspring, then
-            # create a new offspring using mutation...
-            if cs[0] != [1, 1, 1, 1] and self.__Substitute_Mutation == True:
-                mt = self.__mutator__.mutate(
-                                self._maxdepth,
-                                cp_my_tree1,
-                                cp_my_tree1_mapping,
-                                my_tree1depth)
-                mt_map        = crossutil.GetIndicesMappingFromTree(mt[1])
-                mt_depth      = crossutil.GetDepthFromIndicesMapping(mt_map)
-                mt_evaluated  = 1
-                # get fitness of the tree
-                result_fitness = self.__FitnessFunction(mt[1])
-                self._new_pop.append( (o_id, mt[1], mt_map, mt_depth, mt_evaluated, result_fitness))
-
-            else: #No mutation required
-                try:
-                    offspring1_result_fitness = self.__FitnessFunction(cs[1])
-                except Exception, e:
-                    logging.error(e)
-                    logging.error('pb when applying fitness function to result 1 of crossover')
-                    logging.error(cs[1])
-                    logging.error(cs[0])
-
-                try:
-                    offspring2_result_fitness = self.__FitnessFunction(cs[2])
-                except Exception, e:
-                    logging.error(e)
-                    logging.error('pb when applying fitness function to result 2 of crossover')
-                    logging.error(cs[2])
-                    logging.error(cs[0])
-
-
-                if offspring1_result_fitness >= offspring2_result_fitness:
-                    cs_map    = crossutil.GetIndicesMappingFromTree(cs[1])
-                    cs_depth  = crossutil.GetDepthFromIndicesMapping(cs_map)
-                    self._new_pop.append((o_id,
-                                cs[1],
-                                cs_map,
-                                cs_depth,
-                                cs_evaluated,
-                                offspring1_result_fitness))
-                if offspring1_result_fitness < offspring2_result_fitness:
-                    cs_map    = crossutil.GetIndicesMappingFromTree(cs[2])
-                    cs_depth  = crossutil.GetDepthFromIndicesMapping(cs_map)
-                    self._new_pop.append((o_id,
-                                cs[2],
-                                cs_map,
-                                cs_depth,
-                                cs_evaluated,
-                                offspring2_result_fitness))
-
-            nb_iter = nb_iter + 1
-            if self.__low_memory_footprint__ and nb_iter%25 == 0:
-                self._write_computed_population_to_db(tablename2)
+        :param pending: offsprings to evaluate, by key
+        """
+        cdef list keys = pending.keys()
+        cdef list fitnesses
+
+        if not keys:
+            return
+        function = FitnessEvaluation(self.__FitnessFunction)
+        trees = [pending[key] for key in keys]
+        if self._executor is None:
+            fitnesses = map(function, trees)
+        else:
+            fitnesses = list(self._executor.map(function, trees))
 
-        if self.__low_memory_footprint__:
-            self._write_computed_population_to_db(tablename2)
+        self._fitness_cache.update(zip(keys, fitnesses))
+        self._generation_stats['evaluations'] += len(keys)
 
 
-   
+    cdef _collect_offsprings(self, list groups):
+        """
+        Add the kept offsprings of each group to the new population.
+        """
+        cdef tuple group, candidate
+        cdef list candidates
+        cdef dict cache = self._fitness_cache
+
+        for group in groups:
+            candidates = group[1]
+            if group[2]:
+                # the first one is kept when the fitnesses are equal
+                candidates = [min(candidates, key=lambda candidate: cache[candidate[0]])]
+            for candidate in candidates:
+                self._new_pop.append((group[0],
+                                      candidate[1],
+                                      candidate[2],
+                                      candidate[3],
+                                      1,
+                                      self._fitness_cache[candidate[0]]))
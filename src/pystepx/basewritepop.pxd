@@ -8,11 +8,15 @@ cdef class BaseWritePop(object):
     cpdef ClearDBTable(self, table)
     cpdef is_generation_computed(self, tablename)
     cpdef create_new_table(self, tablename)
+    cpdef add_missing_treesize(self, tablename)
     cpdef add_to_initial_population(self, list tree, float fitness, str tablename, bint commit=*)
     cpdef add_new_individual(self, tuple indiv, str tablename)
-    cpdef add_new_individuals(self, individuals, str tablename)
+    cpdef add_new_individuals(self, individuals, str tablename, bint with_ids=*)
+    cpdef delete_individuals(self, keys, str tablename)
     cpdef copy_individuals_from_to(self, np.ndarray list, str source, str dest)
     cpdef get_individual(self, str tablename, int o_id, bint extract=*)
+    cpdef float get_average_size(self, str tablename)
+    cpdef tuple get_population_summary(self, str tablename)
     cpdef get_best_individual(self, str tablename, bint extract=*)
     cpdef flush(self)
     cpdef write_initial_population(self, trees, fitnesses, tablename)
@@ -141,11 +141,33 @@ cdef class BaseWritePop(object):
              tree TEXT,
              tree_mapping TEXT,
              treedepth INTEGER,
+             treesize INTEGER,
              evaluated INTEGER,
              fitness FLOAT)
             """ % tablename)
 
 
+    cpdef add_missing_treesize(self, tablename):
+        """Add the treesize column to a table created by an older version,
+        and compute the size of its trees from their mapping.
+
+        @param tablename: name of the table to upgrade
+        @return: True if the column has been added
+        """
+        columns = [elem[1] for elem in
+                   self._con_.execute("PRAGMA table_info(%s)" % tablename).fetchall()]
+        if 'treesize' in columns:
+            return False
+
+        logging.info('Add the treesize column to %s' % tablename)
+        self._con_.execute("ALTER TABLE %s ADD COLUMN treesize INTEGER" % tablename)
+        mappings = self._con_.execute(
+                "SELECT o_id, tree_mapping FROM %s" % tablename).fetchall()
+        self._con_.executemany("UPDATE %s SET treesize=? WHERE o_id=?" % tablename,
+                [ (crossutil.GetSizeFromIndicesMapping(db_to_list(mapping)), o_id) \
+                    for o_id, mapping in mappings])
+        self.flush()
+        return True
 
     cpdef add_to_initial_population(self, list tree, float fitness, str tablename, bint commit=False):
         """Add the individual to the initial population.
@@ -157,15 +179,17 @@ cdef class BaseWritePop(object):
 
         my_tree_indices = crossutil.GetIndicesMappingFromTree(tree)
         depth = crossutil.GetDepthFromIndicesMapping(my_tree_indices)
+        size = crossutil.GetSizeFromIndicesMapping(my_tree_indices)
 
         
         try:
             self._con_.execute("""
-                INSERT INTO %s(o_id, tree, tree_mapping, treedepth, evaluated, fitness)
-                VALUES (NULL,?,?,?,?,?)
+                INSERT INTO %s(o_id, tree, tree_mapping, treedepth, treesize, evaluated, fitness)
+                VALUES (NULL,?,?,?,?,?,?)
                 """ % tablename, ( list_to_db(tree),
                                    list_to_db(my_tree_indices),
                                   depth,
+                                  size,
                                   1,
                                   fitness))
         except sqlite3.InterfaceError, e:
@@ -181,28 +205,52 @@ cdef class BaseWritePop(object):
         """Add the new individual to requires generation"""
 
         self._con_.execute("""
-            INSERT INTO %s(o_id,tree,tree_mapping,treedepth,evaluated,fitness)
-            VALUES (NULL,?,?,?,?,?)
+            INSERT INTO %s(o_id,tree,tree_mapping,treedepth,treesize,evaluated,fitness)
+            VALUES (NULL,?,?,?,?,?,?)
             """ % tablename,
             ( list_to_db(indiv[1]),
               list_to_db(indiv[2]),
               indiv[3],
+              crossutil.GetSizeFromIndicesMapping(indiv[2]),
               indiv[4],
               indiv[5]))
 
         
-    cpdef add_new_individuals(self, individuals, str tablename):
+    cpdef add_new_individuals(self, individuals, str tablename, bint with_ids=False):
         """Add the new individuals to the required generation.
+        The individuals are written in bulk.
         
         @params individuals: list of tuples containing the information
         @param tablename: Name of table to use
+        @param with_ids: if True, the first element of each tuple is used as
+        the o_id of the individual, else a new o_id is given
         """
  
         logging.info('Write pop : %d indiv' % len(individuals))
 
         cdef tuple indiv
-        for indiv in individuals:
-            self.add_new_individual( indiv, tablename)
+        self._con_.executemany("""
+            INSERT INTO %s(o_id,tree,tree_mapping,treedepth,treesize,evaluated,fitness)
+            VALUES (?,?,?,?,?,?,?)
+            """ % tablename,
+            [( indiv[0] if with_ids else None,
+               list_to_db(indiv[1]),
+               list_to_db(indiv[2]),
+               indiv[3],
+               crossutil.GetSizeFromIndicesMapping(indiv[2]),
+               indiv[4],
+               indiv[5]) for indiv in individuals])
+
+    cpdef delete_individuals(self, keys, str tablename):
+        """Remove individuals from the required generation.
+        The individuals are removed in bulk.
+
+        @param keys: o_id of the individuals to remove
+        @param tablename: Name of table to use
+        """
+
+        self._con_.executemany("DELETE FROM %s WHERE o_id=?" % tablename,
+                               [(int(key),) for key in keys])
 
     cpdef copy_individuals_from_to(self, np.ndarray list, str source, str dest):
         """Copy individuals from source to destination.
@@ -210,8 +258,8 @@ cdef class BaseWritePop(object):
         """
         cdef np.ndarray elem
         cdef str query = """
-          INSERT INTO %s (tree, tree_mapping, treedepth, evaluated, fitness)
-            SELECT tree, tree_mapping, treedepth, evaluated, fitness
+          INSERT INTO %s (tree, tree_mapping, treedepth, treesize, evaluated, fitness)
+            SELECT tree, tree_mapping, treedepth, treesize, evaluated, fitness
             FROM %s
             WHERE o_id in (%s) 
           """ % ( dest, 
@@ -255,6 +303,34 @@ cdef class BaseWritePop(object):
 
             return myresult, my_tree, my_tree_mapping, my_treedepth, my_evaluated, my_fitness
 
+    cpdef float get_average_size(self, str tablename):
+        """Returns the average number of nodes of the trees.
+
+        @param tablename: Source table
+        """
+
+        cur = self._con_.cursor()
+        cur.execute("SELECT AVG(treesize) FROM %s" % tablename)
+        myresult = cur.fetchone()
+        cur.close()
+
+        return myresult[0] or 0
+
+    cpdef tuple get_population_summary(self, str tablename):
+        """Returns the number of trees, their average size and depth, and
+        the number of distinct trees.
+
+        @param tablename: Source table
+        """
+
+        cur = self._con_.cursor()
+        cur.execute("""SELECT COUNT(*), AVG(treesize), AVG(treedepth),
+                              COUNT(DISTINCT tree) FROM %s""" % tablename)
+        myresult = cur.fetchone()
+        cur.close()
+
+        return (myresult[0], myresult[1] or 0, myresult[2] or 0, myresult[3])
+
     cpdef get_best_individual(self, str tablename, bint extract=False):
         """Returns the best individual.
 
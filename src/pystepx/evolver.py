@@ -22,7 +22,8 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
         @param maxdepth: max depth of trees in new generation (should be >=3)
         @param buildmethod: which Koza method is used to build the trees (either
         'AddHalfNode' or 'AddFullNode' or 'AddGrowNodeMin' respectively for
-        Ramped Half-n-Half, Full, or Half)
+        Ramped Half-n-Half, Full, or Half), or 'AddPTC2Node' for the
+        Probabilistic Tree Creation 2 (trees of min_size to max_size nodes)
         @param max_nb_runs: the search will gon on until a maximum number of generations
         is reached
         @param fitness_criterion: the search will stop if the fitness found is <= to
@@ -32,6 +33,18 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
         @param mutation_prob: probability of crossover (will determine what proportion of
         the population will be replaced by mutation-generated offsprings)
         @param dbname: path to database e.g. r'D:\3d_work\pythongp\pySTGP_0.51\src\pop_db'
+        @param min_size: min number of nodes of the initial trees (PTC2 only)
+        @param max_size: max number of nodes of the initial trees (PTC2 only)
+        @param offspring_policy: offsprings of a crossover kept in the new
+        population ('both', 'random' or 'best')
+        @param max_nodes: max number of nodes of the crossover and mutation
+        offsprings (0 for no limit)
+        @param lexicographic_parsimony: if True, the smallest tree wins the
+        tournaments between individuals of same fitness
+        @param tarpeian_rate: probability to kill (without evaluation) an
+        offspring bigger than the average
+        @param double_tournament: probability to select the smallest of two
+        fitness tournament winners (0 for a single tournament)
     """
 
 
@@ -46,7 +59,14 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
                   crossover_prob = 0.5,
                   mutation_prob = 0.49,
                   size = 7,
-                  prob_selection = 0.8
+                  prob_selection = 0.8,
+                  min_size = 1,
+                  max_size = 0,
+                  offspring_policy = 'best',
+                  max_nodes = 0,
+                  lexicographic_parsimony = False,
+                  tarpeian_rate = 0.0,
+                  double_tournament = 0.0
                   ):
         super(Evolver, self).__init__( 
             popsize = popsize,
@@ -59,7 +79,14 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
 			      crossover_prob = crossover_prob,
 			      mutation_prob = mutation_prob,
 			      size = size,
-			      prob_selection = prob_selection)
+			      prob_selection = prob_selection,
+			      min_size = min_size,
+			      max_size = max_size,
+			      offspring_policy = offspring_policy,
+			      max_nodes = max_nodes,
+			      lexicographic_parsimony = lexicographic_parsimony,
+			      tarpeian_rate = tarpeian_rate,
+			      double_tournament = double_tournament)
 
     def Run(self, verbose=True, print_tree=False):
         """Launch the evolution.
@@ -76,6 +103,7 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
 
             #Check problem resolved
             if  res[1] <= self._fitness_criterion:
+                self.sync()
                 print ''.join(['found solution at generation ',
                                     str(self._last_generation),
                                     ', with fitness:',
@@ -92,6 +120,8 @@ class Evolver(pystepx.baseevolver.BaseEvolver):
                                     str(self._last_generation)])
                 break
 
+        # durability barrier of the end of the run
+        self._close_writer()
         data = self._popwriter.get_individual( self._tablename[self._last_generation], res[0], True)
         print(data[1])
 
@@ -1,7 +1,10 @@
 
 cdef class AbstractGeneticOperator(object):
     cpdef __rules__
+    cdef public __grammar__
+    cdef public bint __copy_on_write__
     cpdef set_tree_rules(self,dict rules)
+    cpdef tuple get_context_tables(self, list tree)
     cpdef check_configuration(self)
 
 
@@ -23,6 +23,9 @@ http://www.opensource.org/licenses/mit-license.html
 Abstract genetic operation.
 """
 
+from pystepx.tree import grammar
+from pystepx.geneticoperators import crossutil
+
 
 cdef class AbstractGeneticOperator(object):
     """
@@ -31,12 +34,49 @@ cdef class AbstractGeneticOperator(object):
     def __init__(self):
         """Do nothing"""
         self.__rules__ = None
+        self.__grammar__ = None
+        self.__copy_on_write__ = True
 
     cpdef set_tree_rules(self, dict rules):
         """
         Defines the tree rules to respect when doing the genetic operations.
+        The rules are also compiled in a grammar giving an integer indexed
+        access to the allowed children of the nodes.
         """
         self.__rules__ = rules
+        self.__grammar__ = grammar.compile_rules(rules)
+
+    def get_grammar(self):
+        """
+        Returns the compiled version of the tree rules.
+        """
+        return self.__grammar__
+
+    cpdef tuple get_context_tables(self, list tree):
+        """
+        Returns the tables shared by the operators which choose their points
+        by context (see crossutil.GetContextIndex):
+         - the compact version of the tree, encoded with the grammar
+         - the positions of the nodes indexed by (parent symbol, slot)
+         - the slot of each position
+        """
+        gptree = self.__grammar__.encode(tree)
+        index, slots = crossutil.GetContextIndex(gptree)
+        return (gptree, index, slots)
+
+    def set_copy_on_write(self, value):
+        """
+        Set if the offsprings are built by copying only the nodes from the
+        root to the modified point (True, the default) instead of a deep copy
+        of the parents. With the copy on write, the offsprings share their
+        unmodified subtrees with their parents: trees must never be modified
+        in place once they are built.
+        """
+        self.__copy_on_write__ = value
+
+    def is_copy_on_write(self):
+        """Returns True if the offsprings share the subtrees of their parents."""
+        return self.__copy_on_write__
 
     cpdef check_configuration(self):
         """
@@ -1,3 +1,4 @@
+cimport numpy as np
 
 cimport abstractoperator
 
@@ -6,9 +7,21 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
 
     cpdef bint __strongly_typed_crossover_degree__
     cpdef list __crossover_mapping__
+    cdef public bint __typed__
+    cdef public bint __size_fair__
+    cdef public dict __statistics__
 
 
     cpdef set_strongly_typed_crossover_degree(self, bint value)
     cpdef set_crossover_mapping(self, list mapping)
-    cpdef Koza1PointCrossover(self, int maxdepth, list p1, list p2, list p1_mp, list p2_mp, int p1_depth, int p2_depth)
+    cpdef set_typed_crossover(self, bint value)
+    cpdef bint is_typed_crossover(self)
+    cpdef set_size_fair(self, bint value)
+    cpdef bint is_size_fair(self)
+    cpdef dict get_statistics(self)
+    cpdef reset_statistics(self)
+    cpdef TypedCrossover(self, int maxdepth, list p1, list p2, list p1_map=*, list p2_map=*, int maxsize=*)
+    cdef int _size_fair_choice(self, list legal, np.ndarray sizes, int size) except -2
+    cdef dict _get_renaming(self, list fragment_nodes, list context_functions)
+    cpdef Koza1PointCrossover(self, int maxdepth, list p1, list p2, list p1_mp, list p2_mp, int p1_depth, int p2_depth, bint with_mappings=*)
     cpdef Koza2PointsCrossover(self, int maxdepth, list parent1, list parent2, list p1_map, list p2_map, int p1_depth, int p2_depth)
@@ -34,10 +34,15 @@ import copy
 
 import crossutil
 from pystepx.tree import treeutil, buildtree
+from pystepx.tree.gptree cimport GPTree
+from pystepx.tree.grammar cimport Grammar
 from pystepx.geneticoperators.abstractoperator import AbstractGeneticOperator
 cimport abstractoperator
 from pystepx.tree.treeconstants import *
 
+cimport numpy as np
+ctypedef np.int32_t ID_TYPE_t
+
 cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
     """
     Embed all crossover related operations.
@@ -46,6 +51,10 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
     are compliant with multiple rules and constraints set by the user.
     In the present version, only a strongly-typed version of Koza 1 point
     crossover is supported.
+
+    When the typed crossover is activated (the default), the crossover
+    points are chosen only among the legal ones (see TypedCrossover)
+    instead of retrying Koza1PointCrossover until it gives compliant offsprings.
     """
 
 
@@ -55,6 +64,9 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
 
         self.set_strongly_typed_crossover_degree(False)
         self.set_crossover_mapping(None)
+        self.set_typed_crossover(True)
+        self.set_size_fair(False)
+        self.reset_statistics()
 
     cpdef check_configuration(self):
         """
@@ -80,9 +92,206 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
         """
         self.__crossover_mapping__ = mapping
 
+    cpdef set_typed_crossover(self, bint value):
+        """
+        Set if the crossover points are chosen in the type-indexed tables
+        (TypedCrossover) instead of being checked after the crossover
+        (Koza1PointCrossover).
+        """
+        self.__typed__ = value
 
+    cpdef bint is_typed_crossover(self):
+        """
+        Returns True if the typed crossover is used. It is not when the
+        strongly typed crossover degree is set with a crossover mapping: only
+        Koza1PointCrossover renames the symbols exchanged between the main
+        tree and the ADF branches.
+        """
+        return self.__typed__ and not (self.__strongly_typed_crossover_degree__
+                                       and self.__crossover_mapping__)
 
-    cpdef Koza1PointCrossover(self, int maxdepth, list p1, list p2, list p1_mp, list p2_mp, int p1_depth, int p2_depth):
+    cpdef set_size_fair(self, bint value):
+        """
+        Set if the second point of the typed crossover is chosen relatively
+        to the size of the first subtree (size-fair crossover, see
+        _size_fair_choice) instead of uniformly among the legal points.
+        """
+        self.__size_fair__ = value
+
+    cpdef bint is_size_fair(self):
+        """Returns True if the size-fair crossover is used."""
+        return self.__size_fair__
+
+    cpdef dict get_statistics(self):
+        """
+        Returns the counters of the typed crossover since the last reset:
+         - crossovers: number of crossovers done
+         - illegal_points_avoided: number of (first point, second point)
+           couples which have not been tried because they are not legal
+           (with the blind choice, each of them could have been a failed attempt)
+         - no_legal_pair: number of crossovers without any legal couple of points
+        """
+        return dict(self.__statistics__)
+
+    cpdef reset_statistics(self):
+        """Reset the counters of the typed crossover."""
+        self.__statistics__ = {'crossovers': 0,
+                               'illegal_points_avoided': 0,
+                               'no_legal_pair': 0}
+
+    cpdef TypedCrossover(self, int maxdepth, list p1, list p2, list p1_map=None, list p2_map=None, int maxsize=0):
+        """
+        Strongly-typed Koza 1 point crossover.
+
+        Each parent is indexed by context (symbol of the parent node, child
+        slot, see crossutil.GetContextIndex). A first point is chosen at random
+        in the first parent, then the second point is chosen only among the
+        nodes of the second parent whose subtree is allowed by the rules in
+        the context of the first point, whose context allows the first
+        subtree, and which keep both offsprings under maxdepth (and under
+        maxsize nodes). The first point is chosen again only when it has no
+        legal second point. The limits are thus respected by construction.
+
+        :param maxdepth: maximum depth of the offsprings
+        :param p1: parent tree 1
+        :param p2: parent tree 2
+        :param p1_map: optional index mapping of the parent tree 1
+        :param p2_map: optional index mapping of the parent tree 2
+        :param maxsize: maximum number of nodes of the offsprings (0 for no limit)
+
+        :return: a tuple containing 3 elements, as Koza1PointCrossover
+            - [1,1,1,1] when the offsprings are built, [0,0,0,0] when there
+              is no legal couple of points (the offsprings are then the parents)
+            - The first offspring
+            - The second offspring
+            When the mappings of the parents are given, the tuple also contains
+            the index mapping and the depth of the first offspring, then the ones
+            of the second offspring (see Koza1PointCrossover).
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef GPTree tree1, tree2
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes1, nodes2, parents1, depths1, depths2
+        cdef np.ndarray[ID_TYPE_t, ndim=1] heights1, heights2, slots1
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes1, sizes2
+        cdef dict index2
+        cdef list points, legal, positions, path1, path2
+        cdef tuple result
+        cdef int point1, point2, context_symbol, context_slot, symbol1
+        cdef int length1, length2
+        cdef long avoided = 0
+
+        tree1, _, slots1 = self.get_context_tables(p1)
+        tree2, index2, _ = self.get_context_tables(p2)
+        nodes1, nodes2 = tree1.nodes, tree2.nodes
+        parents1 = tree1.parents
+        depths1, depths2 = tree1.depths, tree2.depths
+        heights1, heights2 = tree1.heights(), tree2.heights()
+        sizes1, sizes2 = tree1.sizes, tree2.sizes
+        length1, length2 = len(tree1), len(tree2)
+
+        self.__statistics__['crossovers'] += 1
+
+        points = range(1, len(tree1))
+        random.shuffle(points)
+        legal = []
+        for point1 in points:
+            context_symbol = nodes1[parents1[point1]]
+            context_slot = slots1[point1]
+            symbol1 = nodes1[point1]
+
+            for (symbol, slot), positions in index2.iteritems():
+                # the first subtree must be allowed in the context of the second point
+                if not grammar.is_allowed(symbol, slot, symbol1):
+                    continue
+                for point2 in positions:
+                    if grammar.is_allowed(context_symbol, context_slot, nodes2[point2]) \
+                            and depths1[point1] + heights2[point2] <= maxdepth \
+                            and depths2[point2] + heights1[point1] <= maxdepth \
+                            and (maxsize <= 0 \
+                                 or (length1 - sizes1[point1] + sizes2[point2] <= maxsize \
+                                     and length2 - sizes2[point2] + sizes1[point1] <= maxsize)):
+                        legal.append(point2)
+
+            avoided += length2 - 1 - len(legal)
+            if legal and self.__size_fair__:
+                point2 = self._size_fair_choice(legal, sizes2, sizes1[point1])
+                if point2 < 0:
+                    legal = []
+                    continue
+                break
+            elif legal:
+                point2 = random.choice(legal)
+                break
+
+        self.__statistics__['illegal_points_avoided'] += avoided
+        if not legal:
+            self.__statistics__['no_legal_pair'] += 1
+            result = ([0, 0, 0, 0], p1, p2)
+            if p1_map is not None and p2_map is not None:
+                result += (p1_map, tree1.depth(), p2_map, tree2.depth())
+            return result
+
+        path1, path2 = tree1.path(point1), tree2.path(point2)
+        if self.__copy_on_write__:
+            result = ([1, 1, 1, 1],
+                      crossutil.SpliceSubtreeAtPath(p1, path1, crossutil.GetSubtreeAtPath(p2, path2)),
+                      crossutil.SpliceSubtreeAtPath(p2, path2, crossutil.GetSubtreeAtPath(p1, path1)))
+        else:
+            result = ([1, 1, 1, 1],
+                      tree1.replace(point1, tree2.subtree(point2)).to_list(),
+                      tree2.replace(point2, tree1.subtree(point1)).to_list())
+
+        if p1_map is not None and p2_map is not None:
+            result += crossutil.SpliceIndicesMapping(p1_map, path1, p2_map, path2) \
+                    + crossutil.SpliceIndicesMapping(p2_map, path2, p1_map, path1)
+        return result
+
+    cdef int _size_fair_choice(self, list legal, np.ndarray sizes, int size) except -2:
+        """
+        Size-fair choice of the second point (Langdon, 2000).
+
+        The subtrees bigger than 2 * size + 1 nodes are not considered. A
+        subtree of the same size than the first one is chosen with the
+        probability 1 / size, otherwise a smaller or a bigger one is chosen
+        with the probabilities which keep the mean size change null. The
+        point is then chosen uniformly in the chosen group.
+
+        :param legal: legal positions of the second tree
+        :param sizes: sizes of the subtrees of the second tree
+        :param size: size of the first subtree
+
+        :return: the chosen position, -1 when no position is fair
+        """
+        cdef list smaller = [], equal = [], larger = []
+        cdef int point
+        cdef float mean_smaller, mean_larger, p_larger
+
+        for point in legal:
+            if sizes[point] < size:
+                smaller.append(point)
+            elif sizes[point] == size:
+                equal.append(point)
+            elif sizes[point] <= 2 * size + 1:
+                larger.append(point)
+
+        if equal and (random.random() < 1.0 / size or not (smaller or larger)):
+            return random.choice(equal)
+        if not smaller and not larger:
+            return -1
+        if not smaller:
+            return random.choice(larger)
+        if not larger:
+            return random.choice(smaller)
+
+        mean_smaller = float(sum([sizes[point] for point in smaller])) / len(smaller)
+        mean_larger = float(sum([sizes[point] for point in larger])) / len(larger)
+        p_larger = (size - mean_smaller) / (mean_larger - mean_smaller)
+        if random.random() < p_larger:
+            return random.choice(larger)
+        return random.choice(smaller)
+
+
+    cpdef Koza1PointCrossover(self, int maxdepth, list p1, list p2, list p1_mp, list p2_mp, int p1_depth, int p2_depth, bint with_mappings=False):
         """
         create 2 offsprings from 2 parents using a modified version of Koza-1-point
         crossover. This version try to produce offsprings compliant with the
@@ -96,8 +305,10 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
         :param p2_mp: parent tree index mapping e.g a_map=crossutil.get_indices_mapping_from_tree(a)
         :param p1_depth: parent tree depth e.g. a_depth=crossutil.get_depth_from_indices_mapping(a_map)
         :param p2_depth: parent tree depth e.g. a_depth=crossutil.get_depth_from_indices_mapping(a_map)
+        :param with_mappings: if True, the index mappings and the depths of
+            the offsprings are also returned
 
-        :return: a tuple containing 3 elements
+        :return: a tuple containing 3 elements (7 with with_mappings)
             - The first one is a list of 1 and 0 indicating if the first and second offspring are rule
             compliant.
             [1,1,1,1] frag2_leaf_compatible_p1 and frag1_leaf_compatible_p2 and frag2_branch_compatible_p1 and frag1_branch_compatible_p2
@@ -106,6 +317,11 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
             and so on... This information can be use to decide if we want to introduce non-compliant offsprings into the population.
             - The second one is the first offspring
             - The third one is the second offspring
+            - with_mappings adds the index mapping and the depth of the first
+              offspring, then the ones of the second offspring. They are
+              obtained from the mappings of the parents (the fragments are
+              moved from one mapping to the other) without going through the
+              offsprings.
         """
 
         logging.debug('New crossover')
@@ -115,14 +331,14 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
         cdef int p1_cross_depth, p2_cross_depth
         cdef int fragment_p1_depth, fragment_p2_depth
         cdef tuple firstnode_p1, firstnode_p2
-        cdef str subtree1_parent_s, subtree2_parent_s
+        cdef list subtree1_parent_path, subtree2_parent_path
         cdef list context_p1, context_p2
         cdef bint frag1_leaf_compatible_p2, frag2_leaf_compatible_p1, frag1_branch_compatible_p2, frag2_branch_compatible_p1
         cdef list frag1, frag2
-        cdef str temp1, temp2
 
-        p1_map = copy.deepcopy(p1_mp)
-        p2_map = copy.deepcopy(p2_mp)
+        # GetPackedListIndicesAtDepth removes the first element of the map
+        p1_map = list(p1_mp)
+        p2_map = list(p2_mp)
 
         # get a random depth for parent1
         p1_cross_depth = random.randint(1, p1_depth - 1)
@@ -146,10 +362,14 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
         p1_point  = random.choice(mychoice1)
         p2_point = random.choice(mychoice2)
 
-        parent1_clone = copy.deepcopy(p1)
-        parent2_clone = copy.deepcopy(p2)
-        fragment_p1 = eval("parent1_clone%s" % crossutil.IndexLstToIndexStr2(p1_point), globals(), locals())
-        fragment_p2 = eval("parent2_clone%s" % crossutil.IndexLstToIndexStr2(p2_point), globals(), locals())
+        # with the copy on write, the parents are never modified
+        if self.__copy_on_write__:
+            parent1_clone, parent2_clone = p1, p2
+        else:
+            parent1_clone = copy.deepcopy(p1)
+            parent2_clone = copy.deepcopy(p2)
+        fragment_p1 = crossutil.GetSubtreeAtPath(parent1_clone, p1_point)
+        fragment_p2 = crossutil.GetSubtreeAtPath(parent2_clone, p2_point)
 
         # Having selected a sub tree, we need to check structural integrity and compatibility
         # first we want to know if the sub-tree is located under a specific ADF defining branch
@@ -166,17 +386,16 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
             firstnode_p2 = fragment_p2
 
         # get the parent node of each sub tree (context of each parent)
-        subtree1_parent_s = crossutil.IndexLstToIndexStr2(p1_point)
+        subtree1_parent_path = p1_point
         if firstnode_p1[NODE_TYPE] != ADF_DEFINING_BRANCH:
-            subtree1_parent_s = subtree1_parent_s[:-3]
+            subtree1_parent_path = p1_point[:-1]
 
-        subtree2_parent_s = crossutil.IndexLstToIndexStr2(p2_point)
+        subtree2_parent_path = p2_point
         if firstnode_p2[NODE_TYPE] != ADF_DEFINING_BRANCH:
-            subtree2_parent_s = subtree2_parent_s[:-3]
+            subtree2_parent_path = p2_point[:-1]
 
-        subtree1_parent, subtree2_parent = None, None
-        subtree1_parent = eval("parent1_clone%s" % subtree1_parent_s, globals(), locals())
-        subtree2_parent = eval("parent2_clone%s" % subtree2_parent_s, globals(), locals())
+        subtree1_parent = crossutil.GetSubtreeAtPath(parent1_clone, subtree1_parent_path)
+        subtree2_parent = crossutil.GetSubtreeAtPath(parent2_clone, subtree2_parent_path)
 
 
         # get the context from grammar rules for each parent
@@ -255,37 +474,24 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
 
         # if the automatic replacement of compatible branch operators is authorized
         # do it to make the offspring compatible wit hthe grammar rules...
-        copy_fragment_p1 = copy.deepcopy(fragment_p1)
-        copy_fragment_p2 = copy.deepcopy(fragment_p2)
+        # (RenameSymbols gives a renamed copy)
+        copy_fragment_p1 = fragment_p1
+        copy_fragment_p2 = fragment_p2
 
         #TODO write inline functions
         if  frag1_branch_compatible_p2 == False \
             and frag1_leaf_compatible_p2 == True \
             and self.__strongly_typed_crossover_degree__ == True:
 
-            frag1 = list(set(frag1))
-            temp1 = str(copy_fragment_p1)
-            for elem_frag1 in frag1:
-                for elem_p2 in context_p2[p2_point[-1]-1][0]:
-                    for elem_crossover_mapping in self.__crossover_mapping__:
-                        if elem_crossover_mapping[1] == str(elem_p2[2]) \
-                            and elem_crossover_mapping[0] == str(elem_frag1[2]):
-                            temp1 = temp1.replace(elem_crossover_mapping[0], elem_crossover_mapping[1])
-            copy_fragment_p1 = eval("%s"%temp1,  globals(), locals())
+            copy_fragment_p1 = crossutil.RenameSymbols(copy_fragment_p1,
+                    self._get_renaming(frag1, context_p2[p2_point[-1]-1][0]))
 
         if  frag2_branch_compatible_p1 == False \
            and frag2_leaf_compatible_p1 == True \
            and self.__strongly_typed_crossover_degree__ == True:
 
-            frag2 = list(set(frag2))
-            temp2 = str(copy_fragment_p2)
-            for elem_frag2 in frag2:
-                for elem_p1 in context_p1[p1_point[-1]-1][0]:
-                    for elem_crossover_mapping in self.__crossover_mapping__:
-                        if elem_crossover_mapping[1] == str(elem_p1[2])\
-                                and elem_crossover_mapping[0] == str(elem_frag2[2]):
-                            temp2 = temp2.replace(elem_crossover_mapping[0], elem_crossover_mapping[1])
-            copy_fragment_p2 = eval("%s" %temp2, globals(), locals())
+            copy_fragment_p2 = crossutil.RenameSymbols(copy_fragment_p2,
+                    self._get_renaming(frag2, context_p1[p1_point[-1]-1][0]))
 
 
         frag1_leaf_compatible_p2 = True
@@ -384,11 +590,39 @@ cdef class CrossoverOperator(abstractoperator.AbstractGeneticOperator):
                 and not frag1_branch_compatible_p2 :
              pattern = [0, 1, 0, 0]
 
-        exec("parent1_clone%s=fragment_p2" % crossutil.IndexLstToIndexStr2(p1_point))  in globals(), locals()
-        exec("parent2_clone%s=fragment_p1" % crossutil.IndexLstToIndexStr2(p2_point))  in globals(), locals()
+        # the renamed copies are used when the renaming has been done
+        if self.__copy_on_write__:
+            parent1_clone = crossutil.SpliceSubtreeAtPath(p1, p1_point, copy_fragment_p2)
+            parent2_clone = crossutil.SpliceSubtreeAtPath(p2, p2_point, copy_fragment_p1)
+        else:
+            crossutil.ReplaceSubtreeAtPath(parent1_clone, p1_point, copy.deepcopy(copy_fragment_p2))
+            crossutil.ReplaceSubtreeAtPath(parent2_clone, p2_point, copy.deepcopy(copy_fragment_p1))
 
+        if with_mappings:
+            return (pattern, parent1_clone, parent2_clone) \
+                    + crossutil.SpliceIndicesMapping(p1_mp, p1_point, p2_mp, p2_point) \
+                    + crossutil.SpliceIndicesMapping(p2_mp, p2_point, p1_mp, p1_point)
         return (pattern, parent1_clone, parent2_clone)
 
+    cdef dict _get_renaming(self, list fragment_nodes, list context_functions):
+        """
+        Returns the renaming of the nodes of a fragment allowed by the
+        crossover mapping: a branch node of the fragment is renamed in
+        one of the function nodes allowed in the new context.
+
+        :param fragment_nodes: the branch nodes of the fragment
+        :param context_functions: the function nodes allowed in the new context
+        """
+        cdef dict names = {}
+        cdef set fragment_names = set([str(node[NODE_NAME]) for node in fragment_nodes])
+        cdef set context_names = set([str(node[NODE_NAME]) for node in context_functions])
+
+        for elem_crossover_mapping in self.__crossover_mapping__:
+            if elem_crossover_mapping[0] in fragment_names \
+                    and elem_crossover_mapping[1] in context_names:
+                names[elem_crossover_mapping[0]] = elem_crossover_mapping[1]
+        return names
+
     cpdef Koza2PointsCrossover(self, int maxdepth,list parent1, list parent2, list p1_map, list p2_map, int p1_depth, int p2_depth):
         """???"""
         first_p_cross = []
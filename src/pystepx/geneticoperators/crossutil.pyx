@@ -24,6 +24,16 @@ THE SOFTWARE.
 from collections import deque
 from copy import copy
 import string
+import struct
+import hashlib
+
+import numpy as np
+cimport numpy as np
+
+from pystepx.tree.gptree cimport GPTree
+from pystepx.tree.gptree import ID_TYPE
+
+ctypedef np.int32_t ID_TYPE_t
 
 
 def BillSubtreeIndices( list tree_rep ):
@@ -129,6 +139,21 @@ cpdef int GetDepthFromIndicesMapping(list list_indices):
 
     return max([len(x[0]) for x in list_indices]) + 1
 
+cpdef int GetSizeFromIndicesMapping(list list_indices):
+    """
+    Gives the number of nodes of the nested list from the index mapping
+
+    :param list_indices: a nested list representing the indexes of the nested lists by depth
+
+    :return: number of nodes
+
+    """
+    cpdef tuple x
+
+    # each nested list holds a node and its children, the root is the only
+    # node which is not a child
+    return 1 + sum([x[1] - 1 for x in list_indices])
+
 # only if the map of indices has been done
 cpdef list GetPackedListIndicesAtDepth(list list_indices, int depth):
     """
@@ -167,6 +192,63 @@ cpdef list GetPackedListIndicesAtDepth(list list_indices, int depth):
         return [x for x in list_indices if len(x[0]) == depth]
 
 
+cpdef tuple SpliceIndicesMapping(list mapping, path, list fragment_mapping, fragment_path):
+    """
+    Gives the index mapping and the depth of the tree obtained by replacing
+    the subtree at path by the fragment, without going through the new tree:
+    the entries of the mapping under path are removed and the entries of
+    fragment_mapping under fragment_path are added under path.
+    The result is the one of GetIndicesMappingFromTree (same order).
+
+    The first entry of a mapping, ([0], len), stands for the root: the
+    mapping of a fragment built alone is used with an empty fragment_path.
+
+    :param mapping: index mapping of the tree
+    :param path: path of the replaced subtree (not the root)
+    :param fragment_mapping: index mapping of a tree containing the fragment
+    :param fragment_path: path of the fragment in this tree
+
+    :return: a tuple (index mapping, depth)
+    """
+    cdef list result = [mapping[0]]
+    cdef list indices
+    cdef tuple elem
+    cdef int length = len(path)
+    cdef int fragment_length = len(fragment_path)
+    cdef int i
+    cdef int maxlen = 1
+
+    path = list(path)
+    fragment_path = list(fragment_path)
+
+    for i in xrange(1, len(mapping)):
+        elem = mapping[i]
+        indices = elem[0]
+        if indices[:length] != path:
+            result.append(elem)
+            if len(indices) > maxlen:
+                maxlen = len(indices)
+
+    for i in xrange(len(fragment_mapping)):
+        elem = fragment_mapping[i]
+        indices = [] if i == 0 else elem[0]
+        if (i == 0 and fragment_length == 0) \
+                or (i > 0 and indices[:fragment_length] == fragment_path):
+            indices = path + indices[fragment_length:]
+            result.append((indices, elem[1]))
+            if len(indices) > maxlen:
+                maxlen = len(indices)
+
+    # breadth first order of GetIndicesMappingFromTree
+    result[1:] = sorted(result[1:], key=_mapping_order)
+    return (result, maxlen + 1)
+
+
+def _mapping_order(tuple elem):
+    """Sort key of the index mapping entries (breadth first)."""
+    return (len(elem[0]), elem[0])
+
+
 cpdef list UnpackIndicesFromList(list map_indices):
     """
     unpack_indices_from_list. e.g. ([([1], 6), ([2], 4)])
@@ -246,3 +328,139 @@ cpdef str IndexLstToIndexStr2(index):
     return "[%s]" % string.join(map(str, index), "][")
 
 
+cpdef GetSubtreeAtPath(list tree, path):
+    """
+    Gives the subtree at the path, e.g. tree[1][2] for the path [1, 2]
+    (the path is the index list used by IndexLstToIndexStr2).
+    It replaces eval("tree%s" % IndexLstToIndexStr2(path)).
+
+    :param tree: a nested list representing a tree
+    :param path: a flat list of indexes
+
+    :return: the subtree (a list) or the leaf (a tuple)
+    """
+    cdef object subtree = tree
+    cdef int index
+
+    for index in path:
+        subtree = (<list>subtree)[index]
+    return subtree
+
+
+cpdef ReplaceSubtreeAtPath(list tree, path, fragment):
+    """
+    Replaces in place the subtree at the path by the fragment.
+    It replaces exec("tree%s=fragment" % IndexLstToIndexStr2(path)).
+
+    :param tree: a nested list representing a tree
+    :param path: a flat list of indexes
+    :param fragment: the new subtree (a list) or leaf (a tuple)
+
+    :return: the modified tree, or the fragment when the path is empty
+    """
+    cdef list parent
+    cdef int length = len(path)
+
+    if length == 0:
+        return fragment
+    parent = GetSubtreeAtPath(tree, path[:length - 1])
+    parent[path[length - 1]] = fragment
+    return tree
+
+
+cpdef SpliceSubtreeAtPath(list tree, path, fragment):
+    """
+    Gives a new tree where the subtree at the path is replaced by the
+    fragment. Only the lists from the root to the path are copied: the other
+    subtrees are shared between the tree and the result, so both of them must
+    not be modified in place afterwards.
+
+    :param tree: a nested list representing a tree
+    :param path: a flat list of indexes
+    :param fragment: the new subtree (a list) or leaf (a tuple)
+
+    :return: the new tree, or the fragment when the path is empty
+    """
+    cdef list result, spine, child
+    cdef int length = len(path)
+    cdef int i
+
+    if length == 0:
+        return fragment
+
+    result = list(tree)
+    spine = result
+    for i in xrange(length - 1):
+        child = list(<list>spine[path[i]])
+        spine[path[i]] = child
+        spine = child
+    spine[path[length - 1]] = fragment
+    return result
+
+
+cpdef RenameSymbols(fragment, dict names):
+    """
+    Gives a copy of the fragment where the nodes are renamed.
+    It replaces the replacement of the names in str(fragment) followed by
+    eval: only complete names are replaced.
+
+    :param fragment: a subtree (a list) or a leaf (a tuple)
+    :param names: dictionary giving the new name of the nodes by their old name
+
+    :return: the renamed copy of the fragment
+    """
+    cdef tuple node
+
+    if isinstance(fragment, tuple):
+        node = <tuple>fragment
+        if node[2] in names:
+            return (node[0], node[1], names[node[2]])
+        return node
+    return [RenameSymbols(elem, names) for elem in fragment]
+
+
+cpdef GetTreeFingerprint(tree):
+    """
+    Gives the fingerprint of a tree: 64 bits of the hash of its canonical
+    string (str of the nested lists, the key of the trees in the evolver).
+
+    :param tree: the tree, or its canonical string
+
+    :return: the fingerprint (an unsigned integer)
+    """
+    if not isinstance(tree, str):
+        tree = str(tree)
+    return struct.unpack('<Q', hashlib.md5(tree).digest()[:8])[0]
+
+
+cpdef tuple GetContextIndex(GPTree tree):
+    """
+    Index the nodes of the tree by their context: the symbol of their parent
+    and their rank in the children of this parent (the child slot of the
+    tree rules).
+
+    :param tree: the compact version of the tree
+
+    :return: a tuple of
+      - a dictionary giving for each (parent symbol, slot) the list of the
+        positions of the nodes in this context
+      - the array of the slot of each position (-1 for the root node)
+    """
+    cdef np.ndarray[ID_TYPE_t, ndim=1] nodes = tree.nodes
+    cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = tree.sizes
+    cdef np.ndarray[ID_TYPE_t, ndim=1] slots = np.empty(sizes.shape[0], dtype=ID_TYPE)
+    cdef dict index = {}
+    cdef int position, child, slot, end
+
+    slots[0] = -1
+    for position in xrange(sizes.shape[0]):
+        end = position + sizes[position]
+        child = position + 1
+        slot = 0
+        while child < end:
+            index.setdefault((nodes[position], slot), []).append(child)
+            slots[child] = slot
+            child = child + sizes[child]
+            slot = slot + 1
+
+    return index, slots
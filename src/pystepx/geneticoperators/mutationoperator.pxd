@@ -1,4 +1,16 @@
 
 cimport abstractoperator
 cdef class Mutator(abstractoperator.AbstractGeneticOperator):
-    cpdef mutate(self, int maxdepth, parent, p1_map,int p1_depth)
+    cdef public __builder__
+    cdef public list __probabilities__
+    cdef public dict __statistics__
+
+    cpdef set_tree_rules(self, dict rules)
+    cpdef dict get_statistics(self)
+    cpdef reset_statistics(self)
+    cdef str _choose_mutation(self)
+    cpdef mutate(self, int maxdepth, parent, p1_map,int p1_depth, bint with_mappings=*, int maxsize=*)
+    cpdef tuple subtree_mutation(self, int maxdepth, parent, p1_map, int p1_depth, int maxsize=*)
+    cpdef tuple point_mutation(self, list parent)
+    cpdef tuple hoist_mutation(self, list parent)
+    cpdef tuple shrink_mutation(self, list parent)
@@ -21,6 +21,19 @@ http://www.opensource.org/licenses/mit-license.html
 
 """
 Basic mutation operations.
+
+Besides the Koza subtree mutation, the mutator can do cheaper mutations
+which never grow the tree (they help to control the bloat):
+ - point mutation: a node is replaced by another node of the same arity,
+   allowed in its context and allowing its children
+ - hoist mutation: a subtree is replaced by one of its own subtrees
+ - shrink mutation: a subtree is replaced by a terminal
+
+The kind of each mutation is chosen following the probabilities given to
+`Mutator.set_mutation_probabilities`. All the kinds choose their points in
+the context tables of the operators (see
+`AbstractGeneticOperator.get_context_tables`), so the mutated trees respect
+the tree rules.
 """
 
 import copy
@@ -30,46 +43,165 @@ from pystepx.tree import buildtree
 from pystepx.geneticoperators.abstractoperator import AbstractGeneticOperator
 import pystepx.geneticoperators.crossutil as crossutil
 
+from pystepx.tree.gptree cimport GPTree
+from pystepx.tree.grammar cimport Grammar
 cimport abstractoperator
 
+cimport numpy as np
+ctypedef np.int32_t ID_TYPE_t
+
+
+# The kinds of mutation
+MUTATIONS = ('subtree', 'point', 'hoist', 'shrink')
+
+# Number of subtrees built by the subtree mutation to respect the max size
+MAX_SIZE_TRIES = 10
+
+
 cdef class Mutator(abstractoperator.AbstractGeneticOperator):
     """
     Class doing mutation with respect of the tree rule
     """
 
+    def __init__(self):
+        """"""
+        super(Mutator, self).__init__()
 
-    cpdef mutate(self, int maxdepth, parent, p1_map,int p1_depth):
+        self.__builder__ = None
+        self.set_mutation_probabilities()
+        self.reset_statistics()
+
+    cpdef set_tree_rules(self, dict rules):
+        """
+        Defines the tree rules and builds once the tree builder used
+        by the subtree mutation.
+        """
+        abstractoperator.AbstractGeneticOperator.set_tree_rules(self, rules)
+        # the builder shares the grammar of the mutator
+        self.__builder__ = buildtree.BuildTree(rules, self.__grammar__)
+
+    def set_mutation_probabilities(self, subtree=1.0, point=0.0, hoist=0.0, shrink=0.0):
+        """
+        Set the probability of each kind of mutation (they are normalized).
+        By default, only the subtree mutation is done.
+        """
+        cdef list probabilities = [subtree, point, hoist, shrink]
+        cdef float total = sum(probabilities)
+        assert total > 0 and min(probabilities) >= 0, \
+                "The mutation probabilities must be positive"
+
+        self.__probabilities__ = []
+        cumulated = 0.0
+        for probability in probabilities:
+            cumulated += probability / total
+            self.__probabilities__.append(cumulated)
+
+    cpdef dict get_statistics(self):
+        """
+        Returns the number of mutations of each kind since the last reset
+        (the subtree mutation is also used when another kind does not find
+        any legal point).
+        """
+        return dict(self.__statistics__)
+
+    cpdef reset_statistics(self):
+        """Reset the counters of the mutations."""
+        self.__statistics__ = dict([(kind, 0) for kind in MUTATIONS])
+
+    cdef str _choose_mutation(self):
+        """Returns a kind of mutation chosen following the probabilities."""
+        cdef float value = random.random()
+        cdef int i
+
+        for i in xrange(len(MUTATIONS) - 1):
+            if value < self.__probabilities__[i]:
+                return MUTATIONS[i]
+        return MUTATIONS[len(MUTATIONS) - 1]
+
+    cpdef mutate(self, int maxdepth, parent, p1_map,int p1_depth, bint with_mappings=False,
+                 int maxsize=0):
         """
         create a mutated individual from a parent tree using Koza styled mutation
+        (or one of the other kinds of mutation, following their probabilities)
 
         :param maxdepth: maximum depth of the mutated offspring
         :param parent: parent tree e.g. a=buildtree.buildTree().AddHalfNode((0,2,'root'),0,2,7)
         :param p1_map: parent tree index mapping e.g a_map=crossutil.get_indices_mapping_from_tree(a)
         :param p1_depth: parent tree depth e.g. a_depth=crossutil.get_depth_from_indices_mapping(a_map)
+        :param with_mappings: if True, the index mapping and the depth of
+            the mutated tree are also returned
+        :param maxsize: maximum number of nodes of the mutated offspring (0
+            for no limit), only the subtree mutation grows the tree
 
         :return: a tuple containing two elements.
             - The first one is a boolean indicating if the mutated tree is identical to the parent
                 (if identical, returns True)
             - The second one is the mutated tree
+            - with_mappings adds the index mapping and the depth of the mutated
+              tree, obtained from the ones of the parent and of the mutant fragment
+
+        """
+        cdef tuple change = None
+        cdef str kind = self._choose_mutation()
+
+        if kind == 'point':
+            change = self.point_mutation(parent)
+        elif kind == 'hoist':
+            change = self.hoist_mutation(parent)
+        elif kind == 'shrink':
+            change = self.shrink_mutation(parent)
+
+        # the subtree mutation is also used when no legal point has been found
+        if change is None:
+            kind = 'subtree'
+            change = self.subtree_mutation(maxdepth, parent, p1_map, p1_depth, maxsize)
+        self.__statistics__[kind] += 1
+
+        p1_point, fragment_p1, mutant_fragment = change
+
+        # with the copy on write, the parent is never modified
+        if self.__copy_on_write__:
+            parent1_clone = crossutil.SpliceSubtreeAtPath(parent, p1_point, mutant_fragment)
+        else:
+            parent1_clone = crossutil.ReplaceSubtreeAtPath(copy.deepcopy(parent), p1_point,
+                                                           copy.deepcopy(mutant_fragment))
+
+        identical = False
+        if mutant_fragment == fragment_p1:
+            identical = True
+        # no branch nor leaf compatible from fragment to parent nodes
+        if with_mappings:
+            mutant_map, mutant_depth = crossutil.SpliceIndicesMapping(p1_map, p1_point,
+                    crossutil.GetIndicesMappingFromTree(mutant_fragment)
+                        if isinstance(mutant_fragment, list) else [],
+                    [])
+            return (identical, parent1_clone, mutant_map, mutant_depth)
+        return (identical, parent1_clone)
 
+    cpdef tuple subtree_mutation(self, int maxdepth, parent, p1_map, int p1_depth, int maxsize=0):
+        """
+        Koza subtree mutation: a random subtree is replaced by a new one
+        built with the tree rules.
+        With maxsize, the new subtree is built with PTC2 and has at most the
+        nodes left by the rest of the tree: its top node is chosen among the
+        nodes whose smallest subtree fits (see Grammar.min_size), and the old
+        subtree is kept when no new one fits after MAX_SIZE_TRIES tries.
+
+        :return: a tuple (path of the mutation point, old fragment, new fragment)
         """
         #Generated vars
         fragment_p1     = None
         subtree1_parent = None
 
-        # get a random depth for parent1
-        if p1_depth >= 1:
-            p1_mutation_depth = 1
-        else:
-            p1_mutation_depth = random.randint(1, p1_depth-1)
+        # get a random depth for parent1, leaving room for the mutant
+        # fragment under maxdepth
+        p1_mutation_depth = random.randint(1, max(1, min(p1_depth - 1, maxdepth - 3)))
 
-        # get a random depth in p2 such that the resulting
-        # offspring lenght is <= offspring maxdepth
+        # GetPackedListIndicesAtDepth removes the first element of the map
         mychoice1 = crossutil.UnpackIndicesFromList(\
-                crossutil.GetPackedListIndicesAtDepth(p1_map, p1_mutation_depth))
+                crossutil.GetPackedListIndicesAtDepth(list(p1_map), p1_mutation_depth))
         p1_point = random.choice(mychoice1)
-        parent1_clone = copy.deepcopy(parent)
-        fragment_p1 = eval("parent1_clone%s" %crossutil.IndexLstToIndexStr2(p1_point), globals(), locals())
+        fragment_p1 = crossutil.GetSubtreeAtPath(parent, p1_point)
 
         # first we need to extract the top node of each subtree
         if isinstance(fragment_p1, list):
@@ -77,53 +209,177 @@ cdef class Mutator(abstractoperator.AbstractGeneticOperator):
         if isinstance(fragment_p1, tuple):
             firstnode_p1 = fragment_p1
         # get the parent node of each sub tree (context of each parent)
-        subtree1_parent_s = crossutil.IndexLstToIndexStr2(p1_point)
-        # if the first node is not an ADF, the string version of the
-        # index of the subtree is just the index of upper node in the tree
+        subtree1_parent_path = p1_point
+        # if the first node is not an ADF, the path of the
+        # context is just the path of upper node in the tree
         if firstnode_p1[0] != 2:
-            subtree1_parent_s = subtree1_parent_s[:-3]
-        # get the subtree using the index we just obtained
-        subtree1_parent = eval("parent1_clone%s" % subtree1_parent_s, globals(), locals())
+            subtree1_parent_path = p1_point[:-1]
+        # get the subtree using the path we just obtained
+        subtree1_parent = crossutil.GetSubtreeAtPath(parent, subtree1_parent_path)
         # get the flat list of permitted nodes for the parent tree
         # for that first get the list of permitted branch nodes...
         context_p1 = self.__rules__[subtree1_parent[0][2]]
-        context = copy.deepcopy(context_p1)
         # and extend to it the list of permitted leaf nodes
-        context[p1_point[-1]-1][0].extend( context[p1_point[-1]-1][1])
-        if len(context[p1_point[-1]-1][0])>1 and firstnode_p1[0]==2:
-            context[p1_point[-1]-1][0].remove(firstnode_p1)
+        context = context_p1[p1_point[-1]-1][0] + context_p1[p1_point[-1]-1][1]
+        if len(context)>1 and firstnode_p1[0]==2:
+            context.remove(firstnode_p1)
         # get the context from grammar rules for each parent
 
         # min_mutation_depth for the subtree has to be extracted by looking when is the next child with a terminal
         min_mutation_depth = 1
-        #print context[p1_point[-1]-1][0]
-        #flag = random.choice(context[p1_point[-1]-1][0])
         if not self.__rules__[subtree1_parent[0][2]][p1_point[-1]-1][1]:
             min_mutation_depth = 2
-        #print flag
 
-        mutant_fragment = buildtree.BuildTree(self.__rules__).AddHalfNode(\
-                random.choice(  context[p1_point[-1]-1][0]) ,
-                                p1_mutation_depth,
-                                p1_mutation_depth + min_mutation_depth,
-                                maxdepth)
+        # the mutant fragment starts at the depth of the mutation point
+        if maxsize > 0:
+            # nodes left by the rest of the tree (at least the ones of the
+            # old fragment, so the tree does not grow)
+            if isinstance(fragment_p1, list):
+                budget = crossutil.GetSizeFromIndicesMapping(
+                        crossutil.GetIndicesMappingFromTree(fragment_p1))
+            else:
+                budget = 1
+            budget = max(budget, maxsize - crossutil.GetSizeFromIndicesMapping(p1_map) + budget)
+            # the smallest subtree of the top node must fit in the budget
+            grammar = self.__grammar__
+            fitting = [(node, grammar.min_size(grammar.intern(node))) for node in context]
+            fitting = [elem for elem in fitting if elem[1] <= budget]
+            mutant_fragment = None
+            # PTC2 may exceed the budget near maxdepth: a few more tries
+            for i in xrange(MAX_SIZE_TRIES if fitting else 0):
+                top, minsize = random.choice(fitting)
+                fragment = self.__builder__.AddPTC2Node(top,
+                                                        len(p1_point),
+                                                        minsize,
+                                                        budget,
+                                                        maxdepth)
+                if len(fragment) == 1 \
+                        or crossutil.GetSizeFromIndicesMapping(
+                            crossutil.GetIndicesMappingFromTree(fragment)) <= budget:
+                    mutant_fragment = fragment
+                    break
+            if mutant_fragment is None:
+                # no subtree fits: the old one is kept (the mutation gives
+                # an offspring identical to the parent)
+                return (p1_point, fragment_p1, fragment_p1)
+        else:
+            mutant_fragment = self.__builder__.AddHalfNode(\
+                    random.choice(context) ,
+                                    len(p1_point),
+                                    min(len(p1_point) + min_mutation_depth, maxdepth),
+                                    maxdepth)
 
         # make sure that the mutant fragment is different from the previous fragment
         if len(mutant_fragment) ==1 and isinstance(mutant_fragment[0], tuple):
             mutant_fragment = mutant_fragment[0]
 
+        return (p1_point, fragment_p1, mutant_fragment)
 
+    cpdef tuple point_mutation(self, list parent):
+        """
+        Point mutation: a node is replaced by another node of the same arity
+        allowed in its context, whose slots allow the children of the node.
 
-        exec("parent1_clone%s=mutant_fragment" % crossutil.IndexLstToIndexStr2(p1_point)) in  globals(), locals()
+        :return: a tuple (path of the mutation point, old fragment, new
+            fragment), or None when no node can be replaced
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef GPTree tree
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes, parents, slots
+        cdef list positions, candidates, children, path
+        cdef int position, symbol, candidate, arity, i
 
-        identical = False
-        if mutant_fragment == fragment_p1:
-            identical = True
-        # no branch nor leaf compatible from fragment to parent nodes
-        return (identical, parent1_clone)
+        tree, _, slots = self.get_context_tables(parent)
+        nodes, parents = tree.nodes, tree.parents
 
+        positions = range(1, len(tree))
+        random.shuffle(positions)
+        for position in positions:
+            symbol = nodes[position]
+            arity = grammar.arities[symbol]
+            children = tree.children(position)
+            if arity == 0:
+                allowed = grammar.get_terminals(nodes[parents[position]], slots[position])
+            else:
+                allowed = grammar.get_functions(nodes[parents[position]], slots[position])
 
+            candidates = []
+            for candidate in allowed:
+                if candidate == symbol or grammar.arities[candidate] != arity \
+                        or grammar.nb_slots(candidate) < len(children):
+                    continue
+                for i in xrange(len(children)):
+                    if not grammar.is_allowed(candidate, i, nodes[children[i]]):
+                        break
+                else:
+                    candidates.append(candidate)
 
+            if candidates:
+                path = tree.path(position)
+                fragment = crossutil.GetSubtreeAtPath(parent, path)
+                node = grammar.node(random.choice(candidates))
+                if isinstance(fragment, list):
+                    return (path, fragment, [node] + fragment[1:])
+                return (path, fragment, node)
+        return None
 
+    cpdef tuple hoist_mutation(self, list parent):
+        """
+        Hoist mutation: a subtree is replaced by one of its own subtrees
+        allowed in its context.
+
+        :return: a tuple (path of the mutation point, old fragment, new
+            fragment), or None when no subtree can be hoisted
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef GPTree tree
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes, sizes, parents, slots
+        cdef list positions, candidates, path
+        cdef int position, descendant, context_symbol, context_slot
+
+        tree, _, slots = self.get_context_tables(parent)
+        nodes, sizes, parents = tree.nodes, tree.sizes, tree.parents
+
+        positions = [position for position in xrange(1, len(tree)) if sizes[position] > 1]
+        random.shuffle(positions)
+        for position in positions:
+            context_symbol = nodes[parents[position]]
+            context_slot = slots[position]
+            candidates = [descendant
+                          for descendant in xrange(position + 1, position + sizes[position])
+                          if grammar.is_allowed(context_symbol, context_slot, nodes[descendant])]
+            if candidates:
+                path = tree.path(position)
+                return (path,
+                        crossutil.GetSubtreeAtPath(parent, path),
+                        crossutil.GetSubtreeAtPath(parent, tree.path(random.choice(candidates))))
+        return None
+
+    cpdef tuple shrink_mutation(self, list parent):
+        """
+        Shrink mutation: a subtree is replaced by a terminal allowed in its
+        context.
+
+        :return: a tuple (path of the mutation point, old fragment, new
+            fragment), or None when no subtree can be replaced
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef GPTree tree
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes, sizes, parents, slots
+        cdef list positions, path
+        cdef np.ndarray terminals
+        cdef int position
 
+        tree, _, slots = self.get_context_tables(parent)
+        nodes, sizes, parents = tree.nodes, tree.sizes, tree.parents
 
+        positions = [position for position in xrange(1, len(tree)) if sizes[position] > 1]
+        random.shuffle(positions)
+        for position in positions:
+            terminals = grammar.get_terminals(nodes[parents[position]], slots[position])
+            if len(terminals):
+                path = tree.path(position)
+                return (path,
+                        crossutil.GetSubtreeAtPath(parent, path),
+                        grammar.node(random.choice(terminals)))
+        return None
@@ -30,6 +30,7 @@ import numpy as np
 cimport numpy as np
 
 from pystepx.fitness import evalfitness
+from pystepx.geneticoperators import crossutil
 #import pystepx.wchoice as wchoice
 
 cpdef GetDBKeysAndFitness(con, str tablename):
@@ -42,13 +43,14 @@ cpdef GetDBKeysAndFitness(con, str tablename):
     :param tablename: name of the databse table
 
     :returns: the list of fitnesses with associated unique ids obtained
-    from the database
+    from the database, and the sizes of the trees. The individuals of
+    same fitness are ordered by size.
 
     """
     SELECT = """
-      SELECT o_id, fitness 
+      SELECT o_id, fitness, treesize
       FROM %s 
-      ORDER BY fitness ASC
+      ORDER BY fitness ASC, treesize ASC
       """ %tablename
  #   SELECT = "SELECT o_id, fitness FROM %s " %tablename
 
@@ -62,6 +64,22 @@ cpdef GetDBKeysAndFitness(con, str tablename):
 
 
 
+cpdef GetKeysAndFitness(dict individuals):
+    """
+    Same as GetDBKeysAndFitness for a population kept in memory.
+
+    :param individuals: dictionary giving the (tree, tree mapping, tree depth,
+    evaluated, fitness) tuple of each id
+
+    :returns: the list of the ids with the fitnesses and the sizes of the
+    trees, ordered by fitness then by size
+    """
+    result = sorted([(o_id, individual[4], crossutil.GetSizeFromIndicesMapping(individual[1]))
+                     for o_id, individual in individuals.iteritems()],
+                    key=operator.itemgetter(1, 2))
+    return np.array(result)
+
+
 def SelectFileFittest(pop_file):
     """
     Select the fittest individual from a file
@@ -240,12 +258,42 @@ cdef np.ndarray _get_weight(int size, float prob_selection):
     return _weight_cache[ (size, prob_selection)]
 
 
+cdef _tournament(int size, float prob_selection, db_list, np.ndarray selection, bint lexicographic):
+    """
+    Returns the winner of one tournament of size individuals.
+
+    :param selection: cumulated weights of the ranks (see _get_weight)
+    :param lexicographic: if True, the smallest tree wins between individuals
+    of same fitness (lexicographic parsimony pressure)
+    """
+    cdef float val
+    cdef int pos
+
+    #Get size random samples ordered by fitness
+    ref_sample = random.sample(db_list, size)
+    if lexicographic:
+        ref_sample = sorted(ref_sample, key=operator.itemgetter(1, 2))
+    else:
+        ref_sample = sorted(ref_sample, key=operator.itemgetter(1))
+    #assert len(ref_sample) == size
+
+    if prob_selection == 1:
+        return ref_sample[0]
+
+    #Get individual depending on probabilities
+    val = random.random()
+    pos = np.searchsorted(selection, val)
+    return ref_sample[pos]
+
+
 cpdef np.ndarray TournamentSelectDBSeveral(
         int nb_outputs,
         int size,
         float prob_selection,
         np.ndarray db_list,
-        unique=False):
+        unique=False,
+        bint lexicographic=False,
+        float double_tournament=0.0):
     """
     Select several individuals from a database using Tournament selection
 
@@ -255,6 +303,11 @@ cpdef np.ndarray TournamentSelectDBSeveral(
     :param prob_selection: prob of selecting the fittest of the group
     :param db_list: the list of fitnesses with associated unique ids obtained from the database
     :param unique: if True, an individual can only be selected one time
+    :param lexicographic: if True, the smallest tree wins between individuals
+    of same fitness (needs the sizes of GetDBKeysAndFitness)
+    :param double_tournament: if not null, probability to select the smallest
+    of the winners of two fitness tournaments (double tournament, should be
+    between 0.5 and 1), else one fitness tournament is used
 
     :return: return a list nb_outputs of references of individuals selected by
     tournament
@@ -269,23 +322,15 @@ cpdef np.ndarray TournamentSelectDBSeveral(
 
 
     cdef int i = 0
-    cdef float val
-    cdef int pos
 
     while i < nb_outputs:
-        #Get size random samples ordered by fitness
-        print size, len(db_list)
-        ref_sample = random.sample(db_list, size)
-        ref_sample = sorted(ref_sample, key=operator.itemgetter(1))
-        #assert len(ref_sample) == size
+        selected_individual = _tournament(size, prob_selection, db_list, selection, lexicographic)
 
-        if prob_selection == 1:
-            selected_individual = [ref_sample[0]]
-        else:
-            #Get individual depending on probabilities
-            val = random.random()
-            pos = np.searchsorted(selection, val)
-            selected_individual = ref_sample[pos]
+        if double_tournament > 0:
+            # the size tournament between the winners of two fitness tournaments
+            other = _tournament(size, prob_selection, db_list, selection, lexicographic)
+            if (other[2] < selected_individual[2]) == (random.random() < double_tournament):
+                selected_individual = other
 
         if unique == False or selected_individual[0] not in selection_result:
             #Add to list
@@ -296,8 +341,3 @@ cpdef np.ndarray TournamentSelectDBSeveral(
             i = i+1
 
     return selection_result
-
-
-
-
-
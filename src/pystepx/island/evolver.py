@@ -27,11 +27,21 @@ Specialized evolver in the case of distributed GP
 
 import math
 import copy
-import marshal
-import compiler
+import sqlite3 as sqlite
+from collections import deque
+
+import numpy as np
 
 import pystepx.evolver 
-from pystepx.geneticoperators import selection
+import pystepx.writepop as writepop
+from pystepx.geneticoperators import selection, crossutil
+from pystepx.island import migrants
+
+# statistics of the generation copied in the records
+GENERATION_RECORD_STATS = ('evaluations', 'evaluations_saved',
+                           'duplicates_rejected', 'time_select',
+                           'time_fetch', 'time_breed', 'time_dedup',
+                           'time_evaluate', 'time_write')
 
 
 class DistributedEvolver(pystepx.evolver.Evolver):
@@ -52,102 +62,424 @@ class DistributedEvolver(pystepx.evolver.Evolver):
                   crossover_prob = 0.5,
                   mutation_prob = 0.49,
                   size = 7,
-                  prob_selection = 0.8):
-
-        super(DistributedEvolver, self).__init__(popsize,
-                root_node,
-                min_depth,
-                max_depth,
-                buildmethod,
-                max_nb_runs,
-                fitness_criterion,
-                crossover_prob,
-                mutation_prob,
-                size,
-                prob_selection)
+                  prob_selection = 0.8,
+                  min_size = 1,
+                  max_size = 0,
+                  offspring_policy = 'best',
+                  max_nodes = 0,
+                  lexicographic_parsimony = False,
+                  tarpeian_rate = 0.0,
+                  double_tournament = 0.0):
+
+        super(DistributedEvolver, self).__init__(popsize = popsize,
+                root_node = root_node,
+                min_depth = min_depth,
+                max_depth = max_depth,
+                buildmethod = buildmethod,
+                max_nb_runs = max_nb_runs,
+                fitness_criterion = fitness_criterion,
+                crossover_prob = crossover_prob,
+                mutation_prob = mutation_prob,
+                size = size,
+                prob_selection = prob_selection,
+                min_size = min_size,
+                max_size = max_size,
+                offspring_policy = offspring_policy,
+                max_nodes = max_nodes,
+                lexicographic_parsimony = lexicographic_parsimony,
+                tarpeian_rate = tarpeian_rate,
+                double_tournament = double_tournament)
         #self._oid_to_replace = [] # Store the list of oid of leaving trees
                                  # needed to store new ones
+        self._migration_statistics = {'emigrants': 0,
+                                      'immigrants': 0,
+                                      'bytes_sent': 0,
+                                      'bytes_received': 0,
+                                      'immigrants_rejected': 0,
+                                      'emigrants_filtered': 0,
+                                      'payloads_dropped': 0}
+        self.set_duplicate_suppression(False)
+
+    def set_duplicate_suppression(self, value, island=None, memory=3):
+        """
+        Set the suppression of the duplicates between the islands. The
+        payloads of the emigrants carry the fingerprints of the population of
+        the island (see crossutil.GetTreeFingerprint), so:
+         - the immigrants already present in the population are rejected
+         - the emigrants already present in the destination (at the last
+           migration from it) are not sent
+         - the offsprings identical to recent immigrants are rejected before
+           their evaluation
+
+        :param value: True to suppress the duplicates
+        :param island: number of the island (sent with the fingerprints)
+        :param memory: number of migrations during which the immigrants
+                       are recent
+        """
+        self._duplicate_suppression = value
+        self._island = -1 if island is None else island
+        self._neighbour_fingerprints = {} # fingerprints by source island
+        self._recent_immigrants = deque(maxlen=memory)
+        self._rejected_fingerprints = set()
 
-    def select_and_remove_individuals(self, prob, compiled_objects=True):
+    def _get_fingerprints(self, db_list):
+        """
+        Returns the fingerprint of each individual of the last population,
+        by o_id.
+
+        :param db_list: ids, fitnesses and sizes of the population
+        """
+        individuals = self._get_individuals(self._tablename[-1],
+                                            [int(elem[0]) for elem in db_list])
+        return dict((key, crossutil.GetTreeFingerprint(individual[0])) \
+                        for key, individual in individuals.iteritems())
+
+    def _reject_duplicates(self, trees, db_list):
+        """
+        Returns the immigrants which are neither in the population nor
+        twice in the batch, and remember them as recent immigrants.
+
+        :param trees: decoded immigrants (see migrants.decode_migrants)
+        :param db_list: ids, fitnesses and sizes of the population
+        """
+        present = set(self._get_fingerprints(db_list).itervalues())
+        kept, arrived = [], set()
+        for tree in trees:
+            fingerprint = crossutil.GetTreeFingerprint(tree[0])
+            if fingerprint in present or fingerprint in arrived:
+                continue
+            arrived.add(fingerprint)
+            kept.append(tree)
+        self._migration_statistics['immigrants_rejected'] += len(trees) - len(kept)
+
+        self._recent_immigrants.append(arrived)
+        self._rejected_fingerprints = set().union(*self._recent_immigrants)
+        return kept
+
+    def select_and_remove_individuals(self, prob):
         """
         Select several individuals from the population, remove them from the
         island and returns them.
 
-        Instead of returning the object, we return a compiled version in order
-        to decrease memory usage.
+        The individuals are returned in the binary format of
+        pystepx.island.migrants (trees and fitnesses only).
 
         :param prob: probability of selection of individuals for migration
-        :param compiled_objects: if True, instead of returning the list of trees,
-                                 return a compiled version of the list of trees.
-
 
-        Return the tree objects and the number of trees to move
+        Return the payload and the number of trees to move
         """
 
         migration_size = max(2, math.ceil(self._popsize * prob))
 
+        # the population is modified in the database
+        self._release_population()
+
 
         db_list = selection.GetDBKeysAndFitness(
                                self._con,
                                self._tablename[-1])
         #Select several uniq individuals
-        migration = selection.TournamentSelectDBSeveral(
-                      int(migration_size),
-                      10, #tournament size
-                      0.8, #selection probability
-                      db_list,
-                      unique=True)
+        keys = self._choose_keys(db_list, int(migration_size), 'tournament')
+        individuals = self._popwriter.get_individuals(self._tablename[-1], keys)
+        payload = migrants.encode_migrants(
+                    [individuals[key][0] for key in keys],
+                    [individuals[key][4] for key in keys])
 
+        self._popwriter.delete_individuals(keys, self._tablename[-1])
+        self._popwriter.flush()
 
+        self._migration_statistics['emigrants'] += len(keys)
+        self._migration_statistics['bytes_sent'] += len(payload)
+        return payload, len(keys)
+
+    def add_new_trees(self, payloads):
+        """
+        Import new individual from other islands.
+        Do not compute again their threshold.
+
+        :param payloads: list of payloads (see pystepx.island.migrants) sent
+                         to the island
+
+        Return the number of imported trees
+        """
         trees = []
-        #self._oid_to_replace = [] # Reset
-        for elem in migration:
-            o_id = elem[0]
-            #self._oid_to_repace.append(elem)
-
-            #Read from table
-            myresult, my_tree, \
-                my_tree_mapping, my_treedepth, \
-                my_evaluated, my_fitness = self._popwriter.get_individual(self._tablename[-1], o_id, True)
- 
-            #Add in the returning set
-            trees.append( ( my_tree,
-                            my_tree_mapping,
-                            my_treedepth,
-                            my_evaluated,
-                            my_fitness))
-
-            #todo ask to popwriter to do that
-            self._con.execute("DELETE FROM %s WHERE o_id=%d;" % (self._tablename[-1], o_id))
+        for payload in payloads:
+            trees.extend(migrants.decode_migrants(payload))
+            self._migration_statistics['bytes_received'] += len(payload)
 
-        self._con.commit()
+        # the population is modified in the database
+        self._release_population()
+        # the trees have no o_id (a new one is given)
+        self._popwriter.add_new_individuals([(None,) + tree for tree in trees],
+                                            self._tablename[-1])
 
+        self._popwriter.flush()
+        # the next generation is bred with the size of the population of the
+        # island: the asynchronous islands, which do not receive as many
+        # immigrants as they send emigrants, do not shrink
+        self._migration_statistics['immigrants'] += len(trees)
+        return len(trees)
+
+    def _choose_keys(self, db_list, nb, policy, tournament_size=10, tournament_prob=0.8):
+        """
+        Choose individuals in a population.
 
+        :param db_list: ids, fitnesses and sizes of the population, ordered
+                        by fitness (see selection.GetDBKeysAndFitness)
+        :param nb: number of individuals to choose
+        :param policy: 'best', 'worst', 'random' or 'tournament'
+        :param tournament_size: size of the tournaments of the 'tournament'
+                                policy
+        :param tournament_prob: selection probability of the tournaments
 
-        if compiled_objects:
-            return compiler.compile(str(trees), '<string>', 'eval'), len(trees)
+        Return the o_id of the chosen individuals
+        """
+        nb = min(nb, len(db_list))
+        if policy == 'best':
+            chosen = db_list[:nb]
+        elif policy == 'worst':
+            chosen = db_list[len(db_list) - nb:]
+        elif policy == 'random':
+            chosen = db_list[np.random.permutation(len(db_list))[:nb]]
+        elif policy == 'tournament':
+            chosen = selection.TournamentSelectDBSeveral(
+                      nb,
+                      min(tournament_size, len(db_list)),
+                      tournament_prob,
+                      db_list,
+                      unique=True)
         else:
-            return trees, len(trees)
+            raise ValueError('Unknown migration policy %s' % policy)
+        return [int(elem[0]) for elem in chosen]
 
-    def add_new_trees(self, trees, compiled_objects=True):
+    def select_emigrants(self, prob, policy='tournament', destination=None,
+                         tournament_size=10, tournament_prob=0.8):
         """
-        Import new individual from other islands.
-        Do not compute again their threshold.
+        Select several individuals from the population and returns a copy of
+        them. The population is not modified.
 
-        :param trees: set of trees to import
-        :param compiled_objects: if True, instead of getting the list of trees,
-                                 get a compiled version of the list of trees.
+        :param prob: probability of selection of individuals for migration
+        :param policy: 'best', 'random' or 'tournament'
+        :param destination: number of the destination island (used by the
+                            duplicate suppression)
+        :param tournament_size: size of the tournaments of the 'tournament'
+                                policy
+        :param tournament_prob: selection probability of the tournaments
+
+        Return the payload (see pystepx.island.migrants) and the number of
+        emigrants
+        """
+        migration_size = int(max(2, math.ceil(self._popsize * prob)))
+
+        db_list = self._get_keys_and_fitness(self._tablename[-1])
+        keys = self._choose_keys(db_list, migration_size, policy,
+                                 tournament_size, tournament_prob)
+        fingerprints = {}
+        if self._duplicate_suppression:
+            fingerprints = self._get_fingerprints(db_list)
+            known = self._neighbour_fingerprints.get(destination, ())
+            selected = len(keys)
+            keys = [key for key in keys if fingerprints[key] not in known]
+            self._migration_statistics['emigrants_filtered'] += selected - len(keys)
+
+        individuals = self._get_individuals(self._tablename[-1], keys)
+        payload = migrants.encode_migrants(
+                    [individuals[key][0] for key in keys],
+                    [individuals[key][4] for key in keys],
+                    fingerprints.values(),
+                    self._island)
+
+        self._migration_statistics['emigrants'] += len(keys)
+        self._migration_statistics['bytes_sent'] += len(payload)
+        return payload, len(keys)
+
+    def replace_with_immigrants(self, payloads, policy='worst'):
+        """
+        Import new individual from other islands in place of individuals of
+        the population: the size of the population does not change.
+        When there are more immigrants than individuals, only the best
+        immigrants are kept.
+
+        :param payloads: list of payloads (see pystepx.island.migrants) sent
+                         to the island
+        :param policy: individuals replaced by the immigrants ('worst' or
+                       'random')
 
+        Return the number of imported trees
         """
-        #assert len(self._oid_to_repace) == len(trees), \
-        #        "You must have as well as emigrant as imigrants"
+        trees = []
+        for payload in payloads:
+            trees.extend(migrants.decode_migrants(payload))
+            self._migration_statistics['bytes_received'] += len(payload)
+            if self._duplicate_suppression:
+                source, fingerprints = migrants.decode_fingerprints(payload)
+                if source >= 0:
+                    self._neighbour_fingerprints[source] = set(fingerprints)
+
+        # the population is modified in the database
+        self._release_population()
+        db_list = selection.GetDBKeysAndFitness(self._con, self._tablename[-1])
+        if self._duplicate_suppression:
+            trees = self._reject_duplicates(trees, db_list)
+        if len(trees) > len(db_list):
+            trees = sorted(trees, key=lambda tree: tree[4])[:len(db_list)]
+
+        self._popwriter.delete_individuals(
+                self._choose_keys(db_list, len(trees), policy),
+                self._tablename[-1])
+        self._popwriter.add_new_individuals([(None,) + tree for tree in trees],
+                                            self._tablename[-1])
+        self._popwriter.flush()
 
+        self._migration_statistics['immigrants'] += len(trees)
+        return len(trees)
 
-        if compiled_objects:
-            trees = eval(trees)
+    def checkpoint(self, epoch):
+        """
+        Take a snapshot of the last population, tagged with a global epoch.
+        Only the snapshots of the epoch and of the previous one are kept
+        (the last epoch may not be complete on all the islands).
 
-        for tree in trees:
-            self._popwriter.add_new_individual(tree, self._tablename[-1])
+        :param epoch: number of the checkpoint
 
-        self._popwriter.flush()
-        self._popsize = self.get_real_popsize()
+        Return the generation of the snapshot
+        """
+        # the population must be written before the copy
+        self._release_population()
+
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints
+            (epoch INTEGER PRIMARY KEY, generation INTEGER, tablename TEXT)""")
+        self._con.execute("DROP TABLE IF EXISTS checkpoint%d" % epoch)
+        self._con.execute("CREATE TABLE checkpoint%d AS SELECT * FROM %s"
+                          % (epoch, self._tablename[-1]))
+        self._con.execute("INSERT OR REPLACE INTO checkpoints VALUES (?,?,?)",
+                          (epoch, self._last_generation, self._tablename[-1]))
+
+        for old, in self._con.execute("SELECT epoch FROM checkpoints WHERE epoch < ?",
+                                      (epoch - 1,)).fetchall():
+            self._con.execute("DROP TABLE IF EXISTS checkpoint%d" % old)
+            self._con.execute("DELETE FROM checkpoints WHERE epoch=?", (old,))
+        self._con.commit()
+        return self._last_generation
+
+    def restore_checkpoint(self, epoch, db_name, payloads=(), policy='worst'):
+        """
+        Put the database of the island back in the state of a snapshot:
+        the generations computed after the snapshot are removed and the last
+        population is copied from the snapshot. Then the migrants which were
+        in flight at the time of the snapshot are received.
+        The evolution must then be continued from the database (without
+        starting from scratch).
+
+        :param epoch: number of the checkpoint
+        :param db_name: database of the island
+        :param payloads: in-flight payloads sent to the island
+        :param policy: replacement policy of the in-flight immigrants
+
+        Return the generation of the snapshot
+        """
+        self._con = sqlite.connect(db_name)
+        self._popwriter = writepop.WritePop(self._con)
+
+        generation, tablename = self._con.execute(
+                "SELECT generation, tablename FROM checkpoints WHERE epoch=?",
+                (epoch,)).fetchone()
+        for name, in self._con.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'pop%'").fetchall():
+            if int(name[3:]) > generation:
+                self._con.execute("DROP TABLE %s" % name)
+        self._con.execute("DELETE FROM %s" % tablename)
+        self._con.execute("INSERT INTO %s SELECT * FROM checkpoint%d" % (tablename, epoch))
+        self._con.commit()
+
+        self._tablename = [tablename]
+        self._selected_table = tablename
+        self._population = None
+        self._population_table = None
+        if payloads:
+            self.replace_with_immigrants(payloads, policy)
+        return generation
+
+    def get_fitness_summary(self):
+        """
+        Returns the best fitness and the mean of the finite fitnesses of the
+        last population.
+        """
+        fitnesses = self._get_keys_and_fitness(self._tablename[-1])[:, 1]
+        finite = fitnesses[np.isfinite(fitnesses)]
+        return fitnesses[0], finite.mean() if len(finite) else np.inf
+
+    def get_generation_record(self):
+        """
+        Returns the statistics of the last population (fitnesses, sizes,
+        depths and ratio of distinct trees) and of the generation which
+        computed it (evaluations and time of each stage), as a small dict
+        which can be sent to the manager instead of the population.
+        """
+        tablename = self._tablename[-1]
+        fitnesses = self._get_keys_and_fitness(tablename)[:, 1]
+        finite = fitnesses[np.isfinite(fitnesses)]
+        nb, size, depth, unique = self._get_population_summary(tablename)
+
+        record = { 'best': float(fitnesses[0]) if len(fitnesses) else np.inf,
+                   'mean': float(finite.mean()) if len(finite) else np.inf,
+                   'std': float(finite.std()) if len(finite) else 0.0,
+                   'size': float(size),
+                   'depth': float(depth),
+                   'unique_ratio': float(unique) / nb if nb else 0.0}
+        for key in GENERATION_RECORD_STATS:
+            record[key] = self._generation_stats.get(key, 0)
+        return record
+
+    def reopen(self):
+        """
+        Attach the evolver to the populations of its database, to continue
+        an evolution whose previous generations have been computed by
+        another process.
+        """
+        self.__read_from_db_if_possible__()
+        self._selected_table = self._tablename[-1]
+        self._population = None
+        self._population_table = None
+        self._current_best_fitness = self.get_best_individual()[1]
+
+    def set_migration_statistics(self, statistics):
+        """Set the migration statistics of the island (see
+        get_migration_statistics)."""
+        self._migration_statistics = dict(statistics)
+
+    def get_migration_statistics(self):
+        """
+        Returns the number of emigrants and immigrants of the island, and the
+        size in bytes of their payloads.
+        """
+        return dict(self._migration_statistics)
+
+    def forget_emigrants(self, payload):
+        """
+        Remove from the migration statistics the emigrants of a payload
+        which has not been delivered (dropped by a full mailbox).
+        """
+        self._migration_statistics['emigrants'] -= migrants.count_migrants(payload)
+        self._migration_statistics['bytes_sent'] -= len(payload)
+        self._migration_statistics['payloads_dropped'] += 1
+
+    def get_duplicate_state(self):
+        """
+        Returns the fingerprints kept by the suppression of the duplicates:
+        the fingerprints of the neighbours and the recent immigrants (see
+        set_duplicate_state).
+        """
+        return (dict((source, set(fingerprints)) \
+                        for source, fingerprints in self._neighbour_fingerprints.iteritems()),
+                [set(arrived) for arrived in self._recent_immigrants])
+
+    def set_duplicate_state(self, state):
+        """Set the fingerprints kept by the suppression of the duplicates
+        (see get_duplicate_state)."""
+        neighbour_fingerprints, recent_immigrants = state
+        self._neighbour_fingerprints = dict(neighbour_fingerprints)
+        self._recent_immigrants.clear()
+        self._recent_immigrants.extend(recent_immigrants)
+        self._rejected_fingerprints = set().union(*self._recent_immigrants)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+"""
+:mod:`pystepx.island.migrants` -- Binary format of the migrants
+===============================================================
+
+A batch of migrants is sent between islands as a string of bytes:
+
+* header: number of migrants, number of symbols, length of the symbol
+  table, source island (-1 when unknown), number of fingerprints
+* symbol table of the batch (marshal of its nodes)
+* fitness of each migrant (float64)
+* number of nodes of each migrant (uint32)
+* symbols of all the trees, in prefix order (uint16)
+* fingerprints of the trees of the source island (uint64, see
+  crossutil.GetTreeFingerprint), used to suppress the duplicates between
+  the islands
+
+The tree mapping and the tree depth are not sent: the receiving island
+computes them again. The sizes of the subtrees are rebuilt from the arity of
+the symbols.
+"""
+
+import struct
+import marshal
+
+import numpy as np
+
+from pystepx.tree.gptree import SymbolTable, GPTree
+from pystepx.geneticoperators import crossutil
+
+HEADER = struct.Struct('<IIIiI')
+
+NODE_TYPE = np.uint16
+LENGTH_TYPE = np.uint32
+FITNESS_TYPE = np.float64
+FINGERPRINT_TYPE = np.uint64
+
+
+def encode_migrants(trees, fitnesses, fingerprints=(), source=-1):
+    """
+    Build the payload of a batch of migrants.
+
+    :param trees: list of trees (nested lists)
+    :param fitnesses: fitness of each tree
+    :param fingerprints: fingerprints of the population of the source island
+    :param source: number of the source island
+    :returns: the payload (string of bytes)
+    """
+    symbols = SymbolTable()
+    encoded = [GPTree.from_list(tree, symbols).nodes for tree in trees]
+    nodes = marshal.dumps(symbols.get_nodes())
+    assert len(symbols) <= np.iinfo(NODE_TYPE).max, "Too many symbols"
+
+    return ''.join([
+        HEADER.pack(len(trees), len(symbols), len(nodes), source, len(fingerprints)),
+        nodes,
+        np.array(fitnesses, dtype=FITNESS_TYPE).tostring(),
+        np.array([len(tree) for tree in encoded], dtype=LENGTH_TYPE).tostring(),
+        np.concatenate(encoded).astype(NODE_TYPE).tostring() if encoded else '',
+        np.array(list(fingerprints), dtype=FINGERPRINT_TYPE).tostring()])
+
+
+def _prefix_sizes(nodes, arities):
+    """Returns the size of the subtree of each node of a prefix tree."""
+    sizes = np.ones(len(nodes), dtype=np.int32)
+    pending = [] # sizes of the subtrees whose parent is not read yet
+    for i in xrange(len(nodes) - 1, -1, -1):
+        for child in xrange(arities[nodes[i]]):
+            sizes[i] += pending.pop()
+        pending.append(sizes[i])
+    return sizes
+
+
+def decode_migrants(payload):
+    """
+    Read the migrants of a payload.
+
+    :param payload: string built by encode_migrants
+    :returns: the list of (tree, tree mapping, tree depth, evaluated,
+    fitness) tuples of the migrants
+    """
+    nb, nb_symbols, length = HEADER.unpack_from(payload)[:3]
+    start = HEADER.size
+    symbols = SymbolTable(marshal.loads(payload[start:start + length]))
+    assert len(symbols) == nb_symbols, "Corrupted symbol table"
+    start += length
+    fitnesses = np.frombuffer(payload, FITNESS_TYPE, nb, start)
+    start += fitnesses.nbytes
+    lengths = np.frombuffer(payload, LENGTH_TYPE, nb, start)
+    start += lengths.nbytes
+    nodes = np.frombuffer(payload, NODE_TYPE, int(lengths.sum()), start).astype(np.int32)
+
+    arities = [node[1] for node in symbols.get_nodes()]
+    migrants = []
+    end = 0
+    for i in xrange(nb):
+        begin, end = end, end + lengths[i]
+        tree = GPTree.from_prefix(nodes[begin:end],
+                                  _prefix_sizes(nodes[begin:end], arities),
+                                  symbols).to_list()
+        mapping = crossutil.GetIndicesMappingFromTree(tree)
+        migrants.append((tree,
+                         mapping,
+                         crossutil.GetDepthFromIndicesMapping(mapping),
+                         1,
+                         float(fitnesses[i])))
+    return migrants
+
+
+def decode_fingerprints(payload):
+    """
+    Read the fingerprints of the source island of a payload.
+
+    :param payload: string built by encode_migrants
+    :returns: the number of the source island and the list of fingerprints
+    """
+    source, nb = HEADER.unpack_from(payload)[3:]
+    if not nb:
+        return source, []
+    return source, np.frombuffer(payload, FINGERPRINT_TYPE, nb,
+                                 len(payload) - nb * FINGERPRINT_TYPE().itemsize).tolist()
+
+
+def count_migrants(payload):
+    """Returns the number of migrants of a payload."""
+    return HEADER.unpack_from(payload)[0]
@@ -27,22 +27,816 @@ Several population evolve on different islands.
 After each generation, some individuals can migrate in other islands.
 
 The api is the same than PySTEPX.
+
+The islands are run by a backend:
+
+* MultiprocessingBackend (the default) runs each island in a local process
+  (no external service is needed, the islands use the cores of the machine).
+  Optionally, the islands exchange their migrants and publish their
+  fitnesses in shared memory (see pystepx.island.sharedmemory)
+* IPythonBackend runs each island in an engine of an IPython cluster which
+  must have been launched before (IPython is imported only by this backend)
+* ScheduledMultiprocessingBackend runs more islands than local processes:
+  the state of an island goes with each of its commands, so the islands of
+  different speeds share the processes
+
+In all cases, the manager sends typed commands (IslandCommand) to the
+IslandWorker of each island, which answers with an IslandReply.
+
+By default, the islands are synchronized at each generation (and so wait
+for the slowest one). In the asynchronous mode, each island evolves on its
+own and posts its emigrants in the mailboxes of its destinations; the
+immigrants arrived in its mailbox are absorbed at the end of each of its
+generations, and the first island whose evolution is ended stops the other
+ones (only available with the MultiprocessingBackend).
+The idle time of each island is reported at the end of the evolution.
+The statistics of each generation of each island can be written in one file
+(see pystepx.island.statistics and set_statistics_path).
 """
 
+import os
+import random
+import select
 import logging
+import traceback
+import sqlite3 as sqlite
+import time
+import Queue
+import multiprocessing
+from collections import namedtuple
 
 import numpy as np
 from copy import copy
 
-from IPython.parallel import Client
-import IPython
-
 import pystepx.pySTEPX
+from pystepx.island import topology
+from pystepx.island import migrants
+from pystepx.island import sharedmemory
+from pystepx.island.statistics import open_statistics
+
+
+# Command sent to an island: name of the IslandWorker method to call
+# and its arguments
+IslandCommand = namedtuple('IslandCommand', 'name args')
+
+# Reply of an island: returned value, or the traceback of the error
+IslandReply = namedtuple('IslandReply', 'value error')
+
+# Command stopping the worker process
+STOP = 'stop'
+
+
+class IslandError(Exception):
+    """Error raised by an island while executing a command"""
+
+
+class IslandWorker(object):
+    """
+    Island side of the model: owns the PySTEPX engine (and its
+    DistributedEvolver) of the island and executes the commands of the
+    manager.
+    """
+
+    def __init__(self, mailboxes=None, island=None, statistics=None, stop_event=None):
+        """
+        :param mailboxes: queue of immigrants of each island (used by the
+        asynchronous mode)
+        :param island: number of the island
+        :param statistics: SharedStatistics in which the island publishes
+        the fitnesses of each generation
+        :param stop_event: multiprocessing.Event shared by the islands, set by
+        the first one whose asynchronous evolution is ended
+        """
+        self._namespace = {}
+        self._engine = None
+        self._generations = None
+        self._generation = -1
+        self._mailboxes = mailboxes
+        self._island = island
+        self._statistics = statistics
+        self._stop_event = stop_event
+        self._busy = 0.0
+        self._recording = False
+        self._records = []
+
+    def _measure(self, function, *args):
+        """Call the function and add its duration to the busy time."""
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            self._busy += time.time() - start
+
+    def initialize(self, init_script):
+        """
+        Execute the initialisation script of the island. The script must
+        create the engine in the gp_engine variable.
+        The script is executed in a new namespace, but the modules it imports
+        are shared by the islands of the process: the engine must be built
+        by a function of the module (gp_engine = build_engine()), not at the
+        import of the module.
+        """
+        self._namespace = {}
+        exec init_script in self._namespace
+        self._engine = self._namespace['gp_engine']
+
+    def get_variable(self, name):
+        """Returns a variable created by the initialisation script."""
+        return self._namespace[name]
+
+    def set_db_name(self, db_name):
+        """Set the database of the island."""
+        self._engine.set_db_name(db_name)
+
+    def start(self):
+        """Prepare the evolution."""
+        self._generations = self._engine.sequentially_evolve()
+        self._generation = -1
+        self._busy = 0.0
+
+    def set_recording(self, value):
+        """
+        Set if the island computes the record of statistics of each
+        generation (see pop_records).
+        """
+        self._recording = value
+
+    def next_generation(self):
+        """Compute the next generation and returns its best individual."""
+        start = time.time()
+        best = self._measure(self._generations.next)
+        elapsed = time.time() - start
+        self._generation += 1
+        if self._statistics is not None:
+            self._statistics.publish(self._island, self._generation,
+                    *self._engine.get_evolver().get_fitness_summary())
+        if self._recording:
+            record = self._engine.get_evolver().get_generation_record()
+            record.update(island=self._island, generation=self._generation,
+                          time_generation=elapsed)
+            self._records.append(record)
+        return best
+
+    def pop_records(self):
+        """Returns the records of statistics of the generations computed
+        since the last call (see DistributedEvolver.get_generation_record)."""
+        records, self._records = self._records, []
+        return records
+
+    def checkpoint(self, epoch):
+        """Take a snapshot of the island (see DistributedEvolver.checkpoint)."""
+        return self._measure(self._engine.get_evolver().checkpoint, epoch)
+
+    def restore(self, epoch, payloads, policy):
+        """
+        Put the island back in the state of a snapshot and receive the
+        in-flight migrants, then prepare the evolution from there.
+        """
+        generation = self._engine.get_evolver().restore_checkpoint(epoch,
+                self._engine.get_db_name(), payloads, policy)
+        self._engine.set_start_from_scratch(False)
+        self.start()
+        self._generation = generation
+
+    def get_busy_time(self):
+        """Returns the time spent to evolve since the start."""
+        return self._busy
+
+    def get_generation(self):
+        """Returns the number of the last computed generation."""
+        return self._generation
+
+    def is_started(self):
+        """Returns True once the evolution is prepared."""
+        return self._generations is not None
+
+    def sync(self):
+        """Waits until the populations are written in the database."""
+        if self._engine is not None:
+            self._engine.sync()
+
+    def resume(self, generation, busy, migration_statistics):
+        """
+        Prepare the evolution of an island whose previous generations have
+        been computed by another process.
+        """
+        if generation >= 0:
+            # the populations are read from the database
+            self._engine.set_start_from_scratch(False)
+            self._engine.__parametrize__()
+            self._engine.get_evolver().reopen()
+        self.start()
+        self._generation = generation
+        self._busy = busy
+        if migration_statistics is not None:
+            self._engine.get_evolver().set_migration_statistics(migration_statistics)
+
+    def get_best_individual(self):
+        """Returns the best individual of the island."""
+        return self._engine.get_best_individual()
+
+    def is_evolution_ended(self):
+        """Returns True when the evolution of the island is ended."""
+        return self._engine.get_evolver().is_evolution_ended()
+
+    def get_real_popsize(self):
+        """Returns the size of the population of the island."""
+        return self._engine.get_evolver().get_real_popsize()
+
+    def select_and_remove_individuals(self, prob):
+        """Returns the payload of the emigrants (see DistributedEvolver)."""
+        return self._measure(self._engine.get_evolver().select_and_remove_individuals,
+                             prob)
+
+    def add_new_trees(self, payloads):
+        """Add the immigrants of the payloads (see DistributedEvolver)."""
+        return self._measure(self._engine.get_evolver().add_new_trees, payloads)
+
+    def set_duplicate_suppression(self, value, memory=3):
+        """Set the suppression of the duplicates between the islands (see
+        DistributedEvolver.set_duplicate_suppression)."""
+        self._engine.get_evolver().set_duplicate_suppression(value, self._island, memory)
+
+    def select_emigrants(self, prob, policy, destinations, tournament=(10, 0.8)):
+        """
+        Returns the payloads of copies of emigrants, one payload for each
+        destination (see DistributedEvolver.select_emigrants).
+
+        :param tournament: size and selection probability of the tournaments
+        of the 'tournament' policy
+        """
+        return [self._measure(self._engine.get_evolver().select_emigrants,
+                              prob, policy, destination, *tournament)[0] \
+                    for destination in destinations]
+
+    def replace_with_immigrants(self, payloads, policy):
+        """
+        Put the immigrants of the payloads in place of individuals of the
+        island (see DistributedEvolver.replace_with_immigrants).
+        """
+        return self._measure(self._engine.get_evolver().replace_with_immigrants,
+                             payloads, policy)
+
+    def get_migration_statistics(self):
+        """Returns the migration statistics of the island."""
+        return self._engine.get_evolver().get_migration_statistics()
+
+    def get_duplicate_state(self):
+        """Returns the fingerprints kept by the suppression of the duplicates
+        (see DistributedEvolver.get_duplicate_state)."""
+        return self._engine.get_evolver().get_duplicate_state()
+
+    def set_duplicate_state(self, state):
+        """Set the fingerprints kept by the suppression of the duplicates
+        (see DistributedEvolver.set_duplicate_state)."""
+        self._engine.get_evolver().set_duplicate_state(state)
+
+    def emigrate(self, prob, policy, destinations, tournament=(10, 0.8),
+                 return_dropped=False):
+        """
+        Post copies of emigrants in the mailbox of each destination.
+        A full mailbox refuses the payload: its emigrants are not counted.
+
+        :param return_dropped: if True, the refused payloads are returned to
+        be delivered by another way, else they are lost
+        :returns: the number of emigrants and the size of each posted
+        payload, and the list of the (destination, payload) refused by the
+        full mailboxes when return_dropped is True
+        """
+        payloads = self.select_emigrants(prob, policy, destinations, tournament)
+        sent, dropped = [], []
+        for destination, payload in zip(destinations, payloads):
+            # the queues accept all the payloads (their put returns None)
+            if self._mailboxes[destination].put(payload) is not False:
+                sent.append((migrants.count_migrants(payload), len(payload)))
+            elif return_dropped:
+                dropped.append((destination, payload))
+            else:
+                self._engine.get_evolver().forget_emigrants(payload)
+        return sent, dropped
+
+    def absorb_immigrants(self, island, policy='worst'):
+        """
+        Put the immigrants arrived in the mailbox of the island in place of
+        individuals of the island (chosen by the replacement policy).
+        All the arrived payloads are absorbed at once.
+
+        :returns: the number of absorbed payloads
+        """
+        payloads = []
+        while True:
+            try:
+                payloads.append(self._mailboxes[island].get_nowait())
+            except Queue.Empty:
+                break
+        if payloads:
+            self.replace_with_immigrants(payloads, policy)
+        return len(payloads)
+
+    def evolve_asynchronously(self, island, settings):
+        """
+        Evolve the island without waiting for the other ones.
+        At the end of each migration interval, the emigrants are posted in the
+        mailbox of each destination. At the end of each generation, the
+        immigrants already arrived are absorbed.
+        The island stops when its evolution is ended or when another island
+        has ended its evolution (the stop event is set).
+
+        :param island: number of the island
+        :param settings: migration settings of the island (see
+        MigrationOperator.get_island_settings)
+        :returns: the best individual and the number of generations
+        """
+        assert self._mailboxes is not None, "The backend does not provide mailboxes"
+        self.start()
+        nb_generations = 0
+        while True:
+            self.next_generation()
+            nb_generations += 1
+            if self.is_evolution_ended():
+                if self._stop_event is not None:
+                    self._stop_event.set()
+                break
+            if self._stop_event is not None and self._stop_event.is_set():
+                break
+
+            if nb_generations % settings['interval'] == 0:
+                self.emigrate(settings['prob'], settings['emigrant_policy'],
+                              settings['destinations'], settings['tournament'])
+            self.absorb_immigrants(island, settings['replacement_policy'])
+
+        return self.get_best_individual(), nb_generations
+
+
+def _island_process(connection, island, mailboxes, statistics, stop_event):
+    """
+    Main loop of an island process: executes the commands received on the
+    connection until the STOP command.
+    """
+    # the immigrants never absorbed must not block the end of the process
+    for mailbox in mailboxes:
+        mailbox.cancel_join_thread()
+
+    worker = IslandWorker(mailboxes, island, statistics, stop_event)
+    while True:
+        command = connection.recv()
+        if command.name == STOP:
+            connection.send(IslandReply(None, None))
+            break
+        try:
+            connection.send(IslandReply(getattr(worker, command.name)(*command.args), None))
+        except Exception:
+            connection.send(IslandReply(None, traceback.format_exc()))
+    connection.close()
+
+
+class MultiprocessingBackend(object):
+    """
+    Run each island in a local process. The commands and their replies go
+    through a pipe per island.
+
+    With the shared memory, the mailboxes of the islands are ring buffers
+    and the islands publish the fitnesses of each generation in a shared
+    array, read by the manager (see pystepx.island.sharedmemory).
+    """
+
+    def __init__(self, shared_memory=False, buffer_size=1 << 20):
+        """
+        :param shared_memory: if True, exchange the migrants and the
+        statistics in shared memory
+        :param buffer_size: size in bytes of the mailbox of each island in
+        shared memory
+        """
+        self._connections = []
+        self._processes = []
+        self.shared_memory = shared_memory
+        self._buffer_size = buffer_size
+        self.mailboxes = None
+        self.statistics = None
+        self.stop_event = None
+
+    def connect(self, nb_islands):
+        """Launch the processes of the islands."""
+        self.stop_event = multiprocessing.Event()
+        if self.shared_memory:
+            self.mailboxes = [sharedmemory.SharedRingBuffer(self._buffer_size) \
+                                for i in range(nb_islands)]
+            self.statistics = sharedmemory.SharedStatistics(nb_islands)
+        else:
+            self.mailboxes = [multiprocessing.Queue() for i in range(nb_islands)]
+        for i in range(nb_islands):
+            connection, island_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_island_process,
+                                              args=(island_connection, i,
+                                                    self.mailboxes, self.statistics,
+                                                    self.stop_event),
+                                              name='island%d' % i)
+            process.daemon = True
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def _receive(self, island):
+        reply = self._connections[island].recv()
+        if reply.error is not None:
+            raise IslandError('Island %d: %s' % (island, reply.error))
+        return reply.value
+
+    def call(self, island, name, *args):
+        """Execute a command on one island and returns its result."""
+        self._connections[island].send(IslandCommand(name, args))
+        return self._receive(island)
+
+    def broadcast(self, name, *args):
+        """
+        Execute a command on all the islands at the same time and returns
+        the list of their results.
+        """
+        return self.map(name, [args] * len(self._connections))
+
+    def map(self, name, args_list):
+        """
+        Execute a command on all the islands at the same time, with the
+        arguments of each island, and returns the list of their results.
+        """
+        self.post(name, args_list)
+        return self.collect()
+
+    def post(self, name, args_list):
+        """
+        Send a command to all the islands, with the arguments of each island,
+        without waiting for the results (see collect).
+        """
+        for connection, args in zip(self._connections, args_list):
+            connection.send(IslandCommand(name, tuple(args)))
+
+    def poll(self, timeout):
+        """
+        Returns True when all the islands have answered the posted command,
+        after waiting at most timeout seconds.
+        """
+        end = time.time() + timeout
+        for connection in self._connections:
+            if not connection.poll(max(0, end - time.time())):
+                return False
+        return True
+
+    def collect(self):
+        """Returns the results of the posted command."""
+        return [self._receive(island) for island in range(len(self._connections))]
+
+    def close(self):
+        """Stop the processes of the islands."""
+        for connection in self._connections:
+            connection.send(IslandCommand(STOP, ()))
+            connection.recv()
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+
+
+class IslandState(object):
+    """
+    State of an island moved between the worker processes of a
+    ScheduledMultiprocessingBackend: the population is stored in the
+    database of the island, the other state is kept here (with the state
+    of the random generators).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.init_script = None
+        self.db_name = None
+        self.started = False
+        self.generation = -1
+        self.busy = 0.0
+        self.migration_statistics = None
+        self.duplicate_state = None
+        self.random_state = None
+        self.numpy_state = None
+        self.init_random_states = None
+        self.settings = {} # commands replayed on the new workers
+        self.records = []
+
+    def reset(self):
+        """Forget the island: the next worker is built from scratch."""
+        version = self.version
+        self.__init__()
+        self.version = version + 1
+
+    def build_worker(self, island):
+        """Build the worker of the island in the current process."""
+        worker = IslandWorker(island=island)
+        if self.init_script is not None:
+            # the script gets the same random numbers than the first time
+            random.setstate(self.init_random_states[0])
+            np.random.set_state(self.init_random_states[1])
+            worker.initialize(self.init_script)
+        if self.db_name is not None:
+            worker.set_db_name(self.db_name)
+        if self.started:
+            worker.resume(self.generation, self.busy, self.migration_statistics)
+        for name, args in self.settings.iteritems():
+            getattr(worker, name)(*args)
+        if self.duplicate_state is not None:
+            # the settings have emptied the fingerprints
+            worker.set_duplicate_state(self.duplicate_state)
+        worker._records = list(self.records)
+        return worker
+
+    def set_random_states(self):
+        """Set the random generators of the process to the ones of the island
+        (new ones for the first step of the island)."""
+        if self.random_state is None:
+            random.seed()
+            np.random.seed()
+        else:
+            random.setstate(self.random_state)
+            np.random.set_state(self.numpy_state)
+
+    def save(self, worker):
+        """Store the state of the island after a step."""
+        worker.sync()
+        self.version += 1
+        self.started = worker.is_started()
+        self.generation = worker.get_generation()
+        self.busy = worker.get_busy_time()
+        self.records = list(worker._records)
+        if self.started:
+            self.migration_statistics = worker.get_migration_statistics()
+            self.duplicate_state = worker.get_duplicate_state()
+        self.random_state = random.getstate()
+        self.numpy_state = np.random.get_state()
+
+
+def _scheduled_process(connection):
+    """
+    Main loop of a worker process of a ScheduledMultiprocessingBackend:
+    executes a command of an island, then returns the result and the new
+    state of the island.
+    The workers of the islands executed by the process are kept. A worker is
+    built again from the state of its island only when the island was
+    executed by another process in between (its version changed). The
+    islands given in the evicted list of a command have moved to another
+    process: their workers are freed.
+    """
+    workers = {} # island => (version of its state, worker)
+    while True:
+        command = connection.recv()
+        if command.name == STOP:
+            connection.send(IslandReply(None, None))
+            break
+        island, state, name, args, evicted = command.args
+        for other in evicted:
+            workers.pop(other, None)
+        try:
+            if name == 'initialize':
+                state.reset()
+            rebuilt = workers.get(island, (None,))[0] != state.version
+            if rebuilt:
+                workers.pop(island, None)
+                workers[island] = (state.version, state.build_worker(island))
+                _check_own_engine(workers, island)
+            worker = workers[island][1]
+
+            state.set_random_states()
+            if name == 'initialize':
+                state.init_script = args[0]
+                state.init_random_states = (random.getstate(), np.random.get_state())
+            elif name == 'set_db_name':
+                state.db_name = args[0]
+            elif name in ('set_recording', 'set_duplicate_suppression'):
+                state.settings[name] = args
+            value = getattr(worker, name)(*args)
+            if name == 'initialize':
+                _check_own_engine(workers, island)
+            state.save(worker)
+            workers[island] = (state.version, worker)
+
+            # a new island is not counted as a rebuild
+            connection.send(IslandReply((value, state,
+                                         rebuilt and name != 'initialize'), None))
+        except Exception:
+            workers.pop(island, None)
+            connection.send(IslandReply(None, traceback.format_exc()))
+    connection.close()
+
+
+def _check_own_engine(workers, island):
+    """
+    Raise an IslandError when the engine of the island is shared with
+    another island of the process.
+    """
+    engine = workers[island][1]._engine
+    if engine is None:
+        return
+    for other, (version, worker) in workers.iteritems():
+        if other != island and worker._engine is engine:
+            raise IslandError('Islands %d and %d share the same engine: the '
+                              'init script must build a new engine for each '
+                              'island (gp_engine = build_engine())' % (other, island))
+
+
+class ScheduledMultiprocessingBackend(object):
+    """
+    Run more islands than local processes: each command of an island is
+    given to a free process. The populations are stored in the databases of
+    the islands and the other state of the islands (generation, random
+    generators...) is sent with each command, so an island can be run by any
+    process.
+
+    Each island is held by one process, which keeps its worker: the commands
+    of the island are sent to this process. A free process without command
+    of its islands takes a command of the busiest process (the island moves
+    and is built again from its state in the new process).
+
+    The islands of different speeds share the processes: the throughput is
+    bounded by the total work instead of by the slowest island.
+    Only the synchronous mode is available.
+    The init script must build a new engine for each island (the modules are
+    imported once by process): gp_engine = build_engine().
+    """
+
+    shared_memory = False
+    mailboxes = None
+    statistics = None
+    stop_event = None
+
+    def __init__(self, nb_workers=None):
+        """
+        :param nb_workers: number of processes (the number of cores by default)
+        """
+        self._nb_workers = nb_workers or multiprocessing.cpu_count()
+        self._connections = []
+        self._processes = []
+        self._states = []
+        self._holders = []
+        self._stale = []
+        self._rebuilds = 0
+
+    def connect(self, nb_islands):
+        """Launch the processes and create the state of the islands."""
+        self._states = [IslandState() for i in range(nb_islands)]
+        for i in range(min(self._nb_workers, nb_islands)):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_scheduled_process,
+                                              args=(worker_connection,),
+                                              name='worker%d' % i)
+            process.daemon = True
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._holders = [island % len(self._connections) for island in range(nb_islands)]
+        self._stale = [set() for process in self._connections]
+
+    def get_rebuilds(self):
+        """Returns the number of workers built again from the state of their
+        island (after a move of the island to another process)."""
+        return self._rebuilds
+
+    def _choose_task(self, process, pending):
+        """
+        Returns a pending task for a free process: a task of an island held
+        by the process, or the last task of the process with the most pending
+        tasks (when it has at least two of them), None otherwise.
+        """
+        queues = {}
+        for task in pending:
+            holder = self._holders[task[1][0]]
+            if holder == process:
+                return task
+            queues.setdefault(holder, []).append(task)
+        if queues:
+            load, holder = max([ (len(tasks), holder) \
+                                    for holder, tasks in queues.iteritems()])
+            if load >= 2:
+                return queues[holder][-1]
+        return None
+
+    def _run(self, tasks):
+        """
+        Execute the (island, command name, arguments) tasks on the free
+        processes and returns their results.
+        """
+        pending = list(enumerate(tasks))
+        running = {} # process => (position of the task, island)
+        results = [None] * len(tasks)
+        errors = []
+
+        while pending or running:
+            for process in range(len(self._connections)):
+                if not pending:
+                    break
+                if process in running:
+                    continue
+                chosen = self._choose_task(process, pending)
+                if chosen is None:
+                    continue
+                pending.remove(chosen)
+                position, (island, name, args) = chosen
+                if self._holders[island] != process:
+                    self._stale[self._holders[island]].add(island)
+                    self._stale[process].discard(island)
+                evicted = list(self._stale[process])
+                self._stale[process].clear()
+                self._connections[process].send(IslandCommand('run',
+                        (island, self._states[island], name, tuple(args), evicted)))
+                self._holders[island] = process
+                running[process] = (position, island)
+
+            ready, _, _ = select.select(
+                    [self._connections[process].fileno() for process in running], [], [])
+            for process in list(running):
+                if self._connections[process].fileno() not in ready:
+                    continue
+                position, island = running.pop(process)
+                reply = self._connections[process].recv()
+                if reply.error is not None:
+                    errors.append('Island %d: %s' % (island, reply.error))
+                    continue
+                results[position], self._states[island], rebuilt = reply.value
+                self._rebuilds += rebuilt
+
+        if errors:
+            raise IslandError('\n'.join(errors))
+        return results
+
+    def call(self, island, name, *args):
+        """Execute a command on one island and returns its result."""
+        return self._run([(island, name, args)])[0]
+
+    def broadcast(self, name, *args):
+        """
+        Execute a command on all the islands and returns the list of their
+        results.
+        """
+        return self.map(name, [args] * len(self._states))
+
+    def map(self, name, args_list):
+        """
+        Execute a command on all the islands, with the arguments of each
+        island, and returns the list of their results.
+        """
+        return self._run([ (island, name, args) \
+                            for island, args in enumerate(args_list)])
+
+    def close(self):
+        """Stop the processes."""
+        for connection in self._connections:
+            connection.send(IslandCommand(STOP, ()))
+            connection.recv()
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+
+
+class IPythonBackend(object):
+    """
+    Run each island in an engine of an IPython cluster.
+
+    .. warning:: Create the object only after launching the cluster of islands. You must have
+                 created the same number of engines than the number of islands.
+    """
+
+    # the engines can not share queues or memory
+    shared_memory = False
+    mailboxes = None
+    statistics = None
+    stop_event = None
+
+    def connect(self, nb_islands):
+        """Connect to the cluster and create the worker of each engine."""
+        import IPython
+        from IPython.parallel import Client
+
+        if IPython.__version__ < '0.11':
+            raise ImportError("Wrong Ipython version")
+
+        self._rc = Client()
+        assert len(self._rc.ids) == nb_islands, "Number of servers and required islands different %d/%d" %(len(self._rc.ids),nb_islands)
+        self._rc[:].execute("from pystepx.island.pystepislands import IslandWorker;"
+                            "island_worker = IslandWorker()", block=True)
+
+    def _execute(self, view, name, args):
+        view['island_args'] = args
+        view.execute("island_result = island_worker.%s(*island_args)" % name, block=True)
+        return view['island_result']
 
+    def call(self, island, name, *args):
+        """Execute a command on one island and returns its result."""
+        return self._execute(self._rc[island], name, args)
 
+    def broadcast(self, name, *args):
+        """Execute a command on all the islands and returns their results."""
+        return self._execute(self._rc[:], name, args)
+
+    def map(self, name, args_list):
+        """Execute a command on each island with its own arguments."""
+        return [self.call(island, name, *args) for island, args in enumerate(args_list)]
+
+    def close(self):
+        """The engines are stopped with the cluster."""
 
-if IPython.__version__ < 0.11:
-    raise Error("Wrong Ipython version")
 
 class PySTEPXIsland(object):
     """
@@ -50,12 +844,11 @@ class PySTEPXIsland(object):
     the API is the same than PySTEPX.
     On evolver is built for each island.
 
-    XXX allows an asynchronous process (no wait for ended generation, lost
-    possibility during migration)
     XXX pull and push to the required servers (not all)
     """
 
-    def __init__(self, nb_islands=3, init_script="", db_path='/tmp/pySTEPX%d.sqlite'):
+    def __init__(self, nb_islands=3, init_script="", db_path='/tmp/pySTEPX%d.sqlite',
+                 backend=None):
         """
         Initialize the global manager.
         Get the reference to the island processes, but does not launch
@@ -65,24 +858,30 @@ class PySTEPXIsland(object):
         :param init_script: script to launch on each insland
         :param db_path: model of the sqlie path. Must contains %d were to put the
         number of the island.
+        :param backend: backend running the islands (a MultiprocessingBackend
+        by default)
         :type nb_islands: integer
         :type init_script: string
         :type db_path: string
-
-        .. warning:: Create the object only after launching the cluster of islands. You must have
-                     created the same number of cluster than the number of islands.
         """
         assert db_path.find('%d') != -1, "db_path must contains %d to include the island number"
         self._nb_islands = nb_islands
         self._db_path = db_path
 
-        #Configure multiengine client
-        self._rc = Client()
-        assert len(self._rc.ids) == nb_islands, "Number of servers and required islands different %d/%d" %(len(self._rc.ids),nb_islands)
-        self._rc_ids = self._rc.ids
+        self._backend = backend if backend is not None else MultiprocessingBackend()
+        self._backend.connect(nb_islands)
 
         self.__init_script__ = init_script
         self.set_migration_operator(MigrationOperator())
+        self.set_asynchronous(False)
+        self._idle_times = []
+        self._migration_statistics = {}
+        self.set_monitoring_interval(1.0)
+        self._manifest_path = db_path % 0
+        self.set_checkpoint_interval(0)
+        self.set_resume(False)
+        self.set_statistics_path(None)
+        self.set_duplicate_suppression(False)
 
 
     def set_migration_operator(self, operator):
@@ -93,6 +892,89 @@ class PySTEPXIsland(object):
         """
         self.__migration_operator__ = operator
 
+    def set_asynchronous(self, value):
+        """
+        Set the asynchronous mode: the islands do not wait for each other
+        at each generation and exchange their migrants through mailboxes.
+
+        :param value: True to activate the asynchronous mode
+        :type value: boolean
+        """
+        self._asynchronous = value
+
+    def set_checkpoint_interval(self, value):
+        """
+        Set the number of generations between two coordinated checkpoints of
+        the islands (synchronous mode only). The manifest of the checkpoints
+        is stored in the database of number 0 of db_path.
+
+        :param value: number of generations (0 for no checkpoint)
+        :type value: integer
+        """
+        self._checkpoint_interval = value
+
+    def set_resume(self, value):
+        """
+        Set if the evolution restarts from the last complete checkpoint
+        (when there is one).
+
+        :param value: True to resume the evolution
+        :type value: boolean
+        """
+        self._resume = value
+
+    def set_monitoring_interval(self, value):
+        """
+        Set the time between two logs of the statistics published by the
+        islands in shared memory, in the asynchronous mode.
+
+        :param value: time in seconds
+        :type value: float
+        """
+        self._monitoring_interval = value
+
+    def set_statistics_path(self, value):
+        """
+        Set the file in which the statistics of each generation of each
+        island are written (see pystepx.island.statistics): JSON lines for a
+        .jsonl file, a SQLite database otherwise.
+
+        :param value: path of the file (None to not record the statistics)
+        :type value: string
+        """
+        self._statistics_path = value
+
+    def set_duplicate_suppression(self, value):
+        """
+        Set the suppression of the duplicates between the islands: the
+        islands exchange the fingerprints of their trees with their
+        migrants, and reject the immigrants they already have and the
+        offsprings identical to recent immigrants (see
+        DistributedEvolver.set_duplicate_suppression).
+
+        :param value: True to suppress the duplicates
+        :type value: boolean
+        """
+        self._duplicate_suppression = value
+
+    def get_idle_times(self):
+        """
+        Returns the time each island of the last evolution spent without
+        evolving (waiting for the other islands or for the manager).
+        """
+        return self._idle_times
+
+    def get_migration_statistics(self):
+        """
+        Returns the number of emigrants and immigrants of all the islands of
+        the last evolution, and the size in bytes of their payloads.
+        """
+        return self._migration_statistics
+
+    def get_backend(self):
+        """Returns the backend running the islands."""
+        return self._backend
+
     def __parametrize__(self):
         """
         Do all the necessary parametrization of the objects.
@@ -106,18 +988,20 @@ class PySTEPXIsland(object):
 
         """
 
-        #Set path XXX change that
-        print logging.info(self.__init_script__)
-        self._rc[:].execute(self.__init_script__, block=True)
+        logging.info(self.__init_script__)
+        self._backend.broadcast('initialize', self.__init_script__)
 
-        self.__migration_operator__.set_rc( self._rc)
+        self.__migration_operator__.set_backend( self._backend)
         self.__migration_operator__.set_nb_islands( self._nb_islands)
 
         #Set the right db name for each island
         for i in range(self._nb_islands):
             db_name = self._db_path % (i+1)
             logging.debug( '%d => %s' % ( i, db_name))
-            self._rc[i].execute("gp_engine.set_db_name('%s')" %db_name)
+            self._backend.call(i, 'set_db_name', db_name)
+
+        self._backend.broadcast('set_recording', self._statistics_path is not None)
+        self._backend.broadcast('set_duplicate_suppression', self._duplicate_suppression)
 
     def evolve(self):
         """Launch the evoluation process.
@@ -128,59 +1012,234 @@ class PySTEPXIsland(object):
         #Configure properly each island
         self.__parametrize__()
 
-        # Get evolution generator of each island
-        self._rc[:].execute("gen = gp_engine.sequentially_evolve()", block=True)
+        self._statistics_stream = None
+        if self._statistics_path is not None:
+            self._statistics_stream = open_statistics(self._statistics_path)
+
+        start = time.time()
+        if self._asynchronous:
+            bests = self._evolve_asynchronously()
+        else:
+            bests = self._evolve_synchronously()
+        elapsed = time.time() - start
+
+        self._idle_times = [ elapsed - busy \
+                for busy in self._backend.broadcast('get_busy_time')]
+        print "Island\t| idle\t"
+        print "\n".join(\
+                [ "%d\t%f" % (j, self._idle_times[j]) \
+                    for j in range(len(self._idle_times))])
+
+        self._migration_statistics = {}
+        for statistics in self._backend.broadcast('get_migration_statistics'):
+            for key, value in statistics.iteritems():
+                self._migration_statistics[key] = self._migration_statistics.get(key, 0) + value
+        print "Migrants\t%d\t(%f bytes per migrant)" % (
+                self._migration_statistics['emigrants'],
+                float(self._migration_statistics['bytes_sent']) \
+                        / max(1, self._migration_statistics['emigrants']))
+        if self._duplicate_suppression:
+            print "Duplicates\t%d immigrants rejected\t%d emigrants not sent" % (
+                    self._migration_statistics['immigrants_rejected'],
+                    self._migration_statistics['emigrants_filtered'])
+
+        print 'Evolution terminated'
+        if self._statistics_stream is not None:
+            self._statistics_stream.close()
+        self._backend.close()
+        return bests
+
+    def _evolve_asynchronously(self):
+        """
+        Let each island evolve on its own.
+
+        :returns: The best individual of each island
+        """
+        assert self._backend.mailboxes is not None, \
+                "The backend does not allow the asynchronous mode"
+        assert not self._checkpoint_interval and not self._resume, \
+                "The checkpoints need the synchronous mode"
+
+        operator = self.__migration_operator__
+        args = [ (i, operator.get_island_settings(i)) \
+                    for i in range(self._nb_islands)]
+        if self._backend.stop_event is not None:
+            self._backend.stop_event.clear()
+        if self._backend.statistics is None:
+            results = self._backend.map('evolve_asynchronously', args)
+        else:
+            # monitor the islands by reading the shared memory
+            self._backend.post('evolve_asynchronously', args)
+            while not self._backend.poll(self._monitoring_interval):
+                statistics = self._backend.statistics.read()
+                logging.info('Generations: %s' % [elem[0] for elem in statistics])
+                logging.info('Best fitnesses: %s' % [elem[1] for elem in statistics])
+            results = self._backend.collect()
+        bests = [best for best, nb_generations in results]
+        self._write_statistics()
+
+        print "Island\t| fit\t| generations"
+        print "\n".join(\
+                [ "%d\t%f\t%d" % (j, results[j][0][1], results[j][1]) \
+                    for j in range(len(results))])
+        return bests
+
+    def _evolve_synchronously(self):
+        """
+        Evolve all the islands generation by generation, with a migration
+        after each generation.
+
+        :returns: The best individual of each island
+        """
+        operator = self.__migration_operator__
+        epoch, i = 0, 0
+        restored = self._restore() if self._resume else None
+        if restored is not None:
+            epoch, generation = restored
+            i = generation + 1
+            operator.set_generation(i)
+        else:
+            if os.path.exists(self._manifest_path):
+                os.remove(self._manifest_path)
+            # Get evolution generator of each island
+            self._backend.broadcast('start')
 
         # Loop over all the sessions
-        i = 0
         while True:
             logging.info('Launch generation evolution')
 
             #Do generation computing
-            self._rc[:].execute("chosen = gen.next()")
+            self._backend.broadcast('next_generation')
 
             #Print best individual
-            logging.info('Get best individuals')
-            self._rc[:].execute("best = gp_engine.get_best_individual()")
-            bests = self._rc[:]['best']
+            records = self._write_statistics()
+            if records:
+                fitnesses = [record['best'] for record in records]
+            elif self._backend.statistics is None:
+                logging.info('Get best individuals')
+                fitnesses = [best[1] for best in self._backend.broadcast('get_best_individual')]
+            else:
+                fitnesses = [elem[1] for elem in self._backend.statistics.read()]
 
             print "Generation %d" % i
             print "="*15
             print "Island\t| fit\t"
             print "\n".join(\
-                    [ "%d\t%f" % (j, bests[j][1]) \
-                        for j in range(len(bests))])
+                    [ "%d\t%f" % (j, fitnesses[j]) \
+                        for j in range(len(fitnesses))])
 
-            print "AVG\t%f" %np.mean( [bests[j][1]  for j in range(len(bests))])
+            print "AVG\t%f" %np.mean(fitnesses)
             i = i + 1
 
             logging.info('Test if end of generation')
             #Test if the process is finished
-            self._rc[:].execute('end=gp_engine.__evolver__.is_evolution_ended()')
-
-            if np.any( self._rc[:]['end']):
+            if np.any( self._backend.broadcast('is_evolution_ended')):
                 break
 
-            #Operate the migration
+            #Operate the migration (and the checkpoint)
             logging.info('Launch migration process')
-            self.__migration_operator__.manage_migration()
+            checkpoint = None
+            if self._checkpoint_interval and i % self._checkpoint_interval == 0:
+                epoch = epoch + 1
+                checkpoint = lambda batches, epoch=epoch: self._checkpoint(epoch, batches)
+            operator.manage_migration(checkpoint)
 
             #loop again
 
-        print 'Evolution terminated'
-        return bests
+        return self._backend.broadcast('get_best_individual')
+
+    def _write_statistics(self):
+        """
+        Gather the records of statistics of the islands and write them in
+        the statistics file.
+
+        :returns: the records
+        """
+        if self._statistics_stream is None:
+            return []
+        records = [ record for records in self._backend.broadcast('pop_records') \
+                        for record in records]
+        self._statistics_stream.write(records)
+        return records
+
+    def _checkpoint(self, epoch, batches):
+        """
+        Take a coordinated checkpoint: each island takes a snapshot of its
+        population, then the epoch and the in-flight migrants are committed
+        in the manifest. The epoch is complete only once the manifest is
+        committed.
+
+        :param epoch: number of the checkpoint
+        :param batches: in-flight payloads sent to each island
+        """
+        logging.info('Checkpoint %d' % epoch)
+        generations = self._backend.broadcast('checkpoint', epoch)
+
+        con = sqlite.connect(self._manifest_path)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS epochs
+            (epoch INTEGER PRIMARY KEY, generation INTEGER)""")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS inflight
+            (epoch INTEGER, destination INTEGER, payload BLOB)""")
+        con.executemany("INSERT INTO inflight VALUES (?,?,?)",
+                [ (epoch, destination, buffer(payload)) \
+                    for destination, batch in enumerate(batches) \
+                    for payload in batch])
+        con.execute("INSERT OR REPLACE INTO epochs VALUES (?,?)", (epoch, generations[0]))
+        con.execute("DELETE FROM inflight WHERE epoch < ?", (epoch,))
+        con.execute("DELETE FROM epochs WHERE epoch < ?", (epoch,))
+        con.commit()
+        con.close()
+
+    def _restore(self):
+        """
+        Restore all the islands from the last complete checkpoint.
+
+        :returns: the epoch and the generation of the checkpoint, or None
+        when there is no checkpoint
+        """
+        if not os.path.exists(self._manifest_path):
+            return None
+        con = sqlite.connect(self._manifest_path)
+        try:
+            row = con.execute(
+                    "SELECT epoch, generation FROM epochs ORDER BY epoch DESC LIMIT 1").fetchone()
+            if row is None:
+                return None
+            epoch, generation = row
+            batches = [[] for island in range(self._nb_islands)]
+            for destination, payload in con.execute(
+                    "SELECT destination, payload FROM inflight WHERE epoch=?", (epoch,)):
+                batches[destination].append(str(payload))
+        except sqlite.OperationalError:
+            return None
+        finally:
+            con.close()
+
+        logging.info('Restore checkpoint %d (generation %d)' % (epoch, generation))
+        policy = self.__migration_operator__.get_replacement_policy()
+        self._backend.map('restore',
+                [ (epoch, batches[island], policy) for island in range(self._nb_islands)])
+        return epoch, generation
 
 class MigrationOperator(object):
     """
     Migration operator managing how the population migrates
     between islands.
 
-    We suppose that islands are placed in a circle way.
-    Migration is done in the island before and after.
-    In this implementation, population migrates in an aleatory way
-    in another island
+    The topology gives the destinations of the migrants of each island (by
+    default, the islands are placed in a circle and the migrants go to the
+    island before and after). Every interval generations, each island sends
+    copies of emigrants, chosen by the emigrant policy, to each of its
+    destinations. The immigrants replace individuals chosen by the
+    replacement policy, so the size of the population of each island does
+    not change.
     """
 
+    EMIGRANT_POLICIES = ('best', 'random', 'tournament')
+    REPLACEMENT_POLICIES = ('worst', 'random')
+
     def __init__(self):
         """
         Initialise the operator.
@@ -188,21 +1247,105 @@ class MigrationOperator(object):
 
         self.set_migration_probability(0.02)
         self.set_nb_islands(0)
-        self.set_rc(None)
-        self._move_east = []
-        self._move_west = []
-
-    def set_rc(self, mec):
-        self._rc = mec
+        self.set_backend(None)
+        self.set_topology(topology.RingTopology())
+        self.set_migration_interval(1)
+        self.set_emigrant_policy('tournament')
+        self.set_emigrant_tournament(10, 0.8)
+        self.set_replacement_policy('worst')
+        self._generation = 0
+        self._payloads = []
+        self._statistics = {'migrants': 0, 'bytes': 0}
+
+    def set_backend(self, backend):
+        """Set the backend running the islands."""
+        self._backend = backend
 
     def set_migration_probability(self, prob):
         """Set the migration probability.
         
-        :param prob: probability of migration in each direction
+        :param prob: probability of migration to each destination
         :type prob: float
         """
         self._prob = prob
 
+    def get_migration_probability(self):
+        """Returns the migration probability to each destination."""
+        return self._prob
+
+    def set_topology(self, value):
+        """Set the topology of the islands.
+
+        :param value: instance of pystepx.island.topology.Topology
+        """
+        self._topology = value
+
+    def set_migration_interval(self, value):
+        """Set the number of generations between two migrations.
+
+        :param value: number of generations
+        :type value: integer
+        """
+        assert value >= 1, "The migration interval must be positive"
+        self._interval = value
+
+    def set_emigrant_policy(self, value):
+        """Set the choice of the emigrants.
+
+        :param value: 'best', 'random' or 'tournament'
+        :type value: string
+        """
+        assert value in self.EMIGRANT_POLICIES, "Unknown emigrant policy %s" % value
+        self._emigrant_policy = value
+
+    def set_emigrant_tournament(self, size, prob):
+        """Set the tournaments of the 'tournament' emigrant policy.
+
+        :param size: number of individuals of each tournament
+        :param prob: probability to choose the best individual of a
+        tournament
+        :type size: integer
+        :type prob: float
+        """
+        assert size >= 1, "The tournament size must be positive"
+        assert 0 <= prob <= 1, "The selection probability must be in [0, 1]"
+        self._tournament = (size, prob)
+
+    def set_replacement_policy(self, value):
+        """Set the choice of the individuals replaced by the immigrants.
+
+        :param value: 'worst' or 'random'
+        :type value: string
+        """
+        assert value in self.REPLACEMENT_POLICIES, "Unknown replacement policy %s" % value
+        self._replacement_policy = value
+
+    def get_replacement_policy(self):
+        """Returns the choice of the individuals replaced by the immigrants."""
+        return self._replacement_policy
+
+    def get_destinations(self, island):
+        """
+        Returns the islands receiving the migrants of an island.
+
+        :param island: number of the source island
+        """
+        return self._topology.get_destinations(island, self._nb_islands)
+
+    def get_island_settings(self, island):
+        """
+        Returns the migration settings of an island (used by the
+        asynchronous mode).
+
+        :param island: number of the island
+        """
+        return {'destinations': self.get_destinations(island),
+                'prob': self._prob,
+                'interval': self._interval,
+                'emigrant_policy': self._emigrant_policy,
+                'tournament': self._tournament,
+                'replacement_policy': self._replacement_policy}
+
     def set_nb_islands(self, value):
         """Set the number of islands involved in the process.
         
@@ -211,78 +1354,128 @@ class MigrationOperator(object):
         """
         self._nb_islands = value
 
-    def manage_migration(self):
+    def set_generation(self, value):
+        """Set the number of generations already done (when resuming an
+        evolution).
+
+        :param value: number of generations
+        :type value: integer
+        """
+        self._generation = value
+
+    def manage_migration(self, checkpoint=None):
         """
-        Launch the migration process with:
+        Launch the migration process, at the end of each migration interval,
+        with:
 
         * selecting the individuals to migrate
         * moving these individuals in their new island
+
+        Called after each generation.
+
+        :param checkpoint: function called with the in-flight migrants (the
+        list of the payloads sent to each island) after their selection and
+        before their reception
         """
-        self.select_and_remove_individuals()
-        self.replace_individuals()
+        self._generation += 1
+        if self._generation % self._interval:
+            if checkpoint is not None:
+                checkpoint([[] for island in range(self._nb_islands)])
+            return
+
+        if self._backend.shared_memory and checkpoint is None:
+            self.exchange_individuals()
+        else:
+            self.select_individuals()
+            if checkpoint is not None:
+                checkpoint(self.get_batches())
+            self.replace_individuals()
 
         #Check popsize evolution
-        self._rc[:].execute('nb=gp_engine.__evolver__.get_real_popsize()',
-                            block=True)
+        self._popsizes = self._backend.broadcast('get_real_popsize')
 
 
-    def select_and_remove_individuals(self):
+    def select_individuals(self):
         """
-        For each island, select the individuals to migrate and remove them from
-        the island.
+        For each island, select the individuals to migrate to each of its
+        destinations.
         """
         logging.info('Get individuals from islands')
 
-        # Build the command list
-        actions = [ \
-"move_east, nb_trees_east = gp_engine.__evolver__.select_and_remove_individuals(%f);" % self._prob,
-"move_west, nb_trees_west = gp_engine.__evolver__.select_and_remove_individuals(%f);" % self._prob,
-]
-
-        # Launch the command list on each island at the same time
-        for action in actions:
-            self._rc[:].execute( action, block=True)
-
-        # Store the moving individuals of each individual
-        self._move_east = self._rc[:]['move_east']
-        self._move_west = self._rc[:]['move_west']
-
-        self._nb_trees_east = self._rc[:]['nb_trees_east']
-        self._nb_trees_west = self._rc[:]['nb_trees_west']
-
+        # Launch the selection on each island at the same time
+        # and store the payload of each island for each of its destinations
+        self._payloads = self._backend.map('select_emigrants',
+                [ (self._prob, self._emigrant_policy, self.get_destinations(island),
+                   self._tournament) \
+                    for island in range(self._nb_islands)])
+        for payloads in self._payloads:
+            for payload in payloads:
+                self._statistics['migrants'] += migrants.count_migrants(payload)
+                self._statistics['bytes'] += len(payload)
 
 
     def replace_individuals(self):
         """
-        For each island, put its migrant in another island.
+        For each island, put its migrant in other islands.
+        The payloads sent to an island are given in one batch, and all the
+        islands receive their batch at the same time.
         """
 
 
         logging.info('Set new individuals in other islands')
-        for island_source in range(self._nb_islands):
-
-            #move to east
-            island_destination = (island_source + 1) % self._nb_islands
-            logging.info('Move from %d to %d' % (island_source, island_destination))
-            self._move_from_to(self._rc[island_source]['move_east'], island_destination)
-
-            #move to west
-            island_destination = (island_source - 1) % self._nb_islands
-            logging.info('Move from %d to %d' % (island_source, island_destination))
-            self._move_from_to(self._rc[island_source]['move_west'], island_destination)
+        self._backend.map('replace_with_immigrants',
+                          [(batch, self._replacement_policy) for batch in self.get_batches()])
 
+    def get_batches(self):
+        """Returns the list of the selected payloads sent to each island."""
+        batches = [[] for island in range(self._nb_islands)]
+        for island_source in range(self._nb_islands):
+            for destination, payload in zip(self.get_destinations(island_source),
+                                            self._payloads[island_source]):
+                logging.info('Move from %d to %d' % (island_source, destination))
+                batches[destination].append(payload)
+        return batches
 
-    def _move_from_to(self, trees, destination):
+    def exchange_individuals(self):
         """
-        Copy the trees to the destination island.
-
-        :param trees: List of trees to import
-        :param destination: island destination id
+        The islands post their migrants directly in the mailboxes of their
+        destinations in shared memory, then each island absorbs its
+        immigrants (the migrants do not go through the manager).
+        The payloads refused by a full mailbox are sent through the manager,
+        so no migrant is lost.
         """
-
-
-        logging.info('Send trees')
-        logging.debug(trees)
-
-        self._rc[destination]['new_trees'] =  trees
-        self._rc[destination].execute('gp_engine.__evolver__.add_new_trees(new_trees);')
+        logging.info('Exchange individuals through the shared memory')
+        batches = [[] for island in range(self._nb_islands)]
+        for sent, dropped in self._backend.map('emigrate',
+                [ (self._prob, self._emigrant_policy, self.get_destinations(island),
+                   self._tournament, True) \
+                    for island in range(self._nb_islands)]):
+            for nb, size in sent:
+                self._statistics['migrants'] += nb
+                self._statistics['bytes'] += size
+            for destination, payload in dropped:
+                self._statistics['migrants'] += migrants.count_migrants(payload)
+                self._statistics['bytes'] += len(payload)
+                batches[destination].append(payload)
+
+        self._backend.map('absorb_immigrants',
+                [ (island, self._replacement_policy) \
+                    for island in range(self._nb_islands)])
+
+        # the payloads refused by the full mailboxes go through the manager
+        for island, batch in enumerate(batches):
+            if batch:
+                logging.warning('%d payloads sent to island %d through the manager' \
+                                % (len(batch), island))
+                self._backend.call(island, 'replace_with_immigrants',
+                                   batch, self._replacement_policy)
+
+    def get_statistics(self):
+        """
+        Returns the number of migrants and the size of their payloads
+        (in bytes) since the creation of the operator.
+        """
+        statistics = dict(self._statistics)
+        statistics['bytes_per_migrant'] = \
+                float(statistics['bytes']) / max(1, statistics['migrants'])
+        return statistics
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+"""
+:mod:`pystepx.island.sharedmemory` -- Shared memory between local islands
+=========================================================================
+
+When the islands run in the processes of one host, they can exchange their
+migrants and publish their statistics in shared memory, without pickling
+and without the pipes of the commands:
+
+* SharedRingBuffer is the mailbox of an island: the other islands write
+  the payloads of their migrants in it, the island reads them
+* SharedStatistics is an array in which each island publishes its last
+  generation, best fitness and mean fitness; the manager monitors the
+  evolution by reading it
+
+The shared memory must be created before starting the processes of the
+islands.
+"""
+
+import Queue
+import ctypes
+import struct
+import logging
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+LENGTH = struct.Struct('<I')
+
+READ, WRITE, DROPPED = range(3)
+
+
+class SharedRingBuffer(object):
+    """
+    Mailbox of an island in shared memory. The payloads are stored one
+    after the other (preceded by their length) in a circular buffer.
+
+    The writers never wait: when the buffer is full, the payload is dropped
+    (and counted) as a lost migration.
+    The API is the one of the multiprocessing queues used as mailboxes.
+    """
+
+    def __init__(self, capacity=1 << 20):
+        """
+        :param capacity: size of the buffer in bytes
+        """
+        self._capacity = capacity
+        self._buffer = RawArray(ctypes.c_char, capacity)
+        # number of bytes read and written since the creation, number of
+        # dropped payloads
+        self._counters = RawArray(ctypes.c_longlong, 3)
+        self._lock = multiprocessing.Lock()
+
+    def _write(self, position, data):
+        """Copy the data in the buffer from position (wrapping at the end)."""
+        start = position % self._capacity
+        first = min(len(data), self._capacity - start)
+        self._buffer[start:start + first] = data[:first]
+        if first < len(data):
+            self._buffer[0:len(data) - first] = data[first:]
+
+    def _read(self, position, length):
+        """Returns length bytes of the buffer from position."""
+        start = position % self._capacity
+        first = min(length, self._capacity - start)
+        data = self._buffer[start:start + first]
+        if first < length:
+            data += self._buffer[0:length - first]
+        return data
+
+    def put(self, payload):
+        """
+        Write a payload in the buffer.
+
+        :returns: False if the payload has been dropped
+        """
+        record = LENGTH.pack(len(payload)) + payload
+        with self._lock:
+            counters = self._counters
+            if counters[WRITE] - counters[READ] + len(record) > self._capacity:
+                counters[DROPPED] += 1
+                logging.warning('Mailbox full: payload of %d bytes dropped' % len(payload))
+                return False
+            self._write(counters[WRITE], record)
+            counters[WRITE] += len(record)
+        return True
+
+    def get_nowait(self):
+        """
+        Returns the oldest payload of the buffer.
+        Raise Queue.Empty if there is no payload.
+        """
+        with self._lock:
+            counters = self._counters
+            if counters[READ] == counters[WRITE]:
+                raise Queue.Empty()
+            length = LENGTH.unpack(self._read(counters[READ], LENGTH.size))[0]
+            payload = self._read(counters[READ] + LENGTH.size, length)
+            counters[READ] += LENGTH.size + length
+        return payload
+
+    def empty(self):
+        """Returns True if there is no payload in the buffer."""
+        return self._counters[READ] == self._counters[WRITE]
+
+    def get_dropped(self):
+        """Returns the number of payloads dropped because the buffer was full."""
+        return self._counters[DROPPED]
+
+    def cancel_join_thread(self):
+        """Nothing has to be flushed at the end of the process (API of
+        multiprocessing.Queue)."""
+
+
+class SharedStatistics(object):
+    """
+    Last generation, best fitness and mean fitness of each island, in shared
+    memory.
+    """
+
+    FIELDS = ('generation', 'best', 'mean')
+
+    def __init__(self, nb_islands):
+        """
+        :param nb_islands: number of islands
+        """
+        self._nb_islands = nb_islands
+        self._values = RawArray(ctypes.c_double, nb_islands * len(self.FIELDS))
+        for i in range(nb_islands):
+            self._values[i * len(self.FIELDS)] = -1
+        self._lock = multiprocessing.Lock()
+
+    def publish(self, island, generation, best, mean):
+        """Set the statistics of the last generation of an island."""
+        start = island * len(self.FIELDS)
+        with self._lock:
+            self._values[start:start + len(self.FIELDS)] = [generation, best, mean]
+
+    def read(self):
+        """
+        Returns the (generation, best fitness, mean fitness) of each island
+        (the generation is -1 before the first one).
+        """
+        with self._lock:
+            values = self._values[:]
+        size = len(self.FIELDS)
+        return [ (int(values[i * size]), values[i * size + 1], values[i * size + 2]) \
+                    for i in range(self._nb_islands)]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+"""
+:mod:`pystepx.island.statistics` -- Statistics of the island evolutions
+=======================================================================
+
+Each island computes a record of statistics after each of its generations
+(see DistributedEvolver.get_generation_record); the manager gathers these
+small records, without reading the populations, and writes them in one
+statistics file:
+
+* JSONLinesStatistics writes one JSON object per line
+* SQLiteStatistics writes one row per record in the generations table
+
+open_statistics chooses the format with the extension of the file.
+"""
+
+import json
+import sqlite3 as sqlite
+
+FIELDS = ('island', 'generation', 'best', 'mean', 'std', 'size', 'depth',
+          'unique_ratio', 'evaluations', 'evaluations_saved',
+          'duplicates_rejected', 'time_select', 'time_fetch', 'time_breed',
+          'time_dedup', 'time_evaluate', 'time_write', 'time_generation')
+
+
+class StatisticsStream(object):
+    """
+    Base class of the statistics files.
+    """
+
+    def write(self, records):
+        """
+        Add records to the file.
+
+        :param records: list of dicts whose keys are in FIELDS
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Flush and close the file."""
+        raise NotImplementedError()
+
+
+class JSONLinesStatistics(StatisticsStream):
+    """
+    Statistics written as JSON lines.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the file (the records are added at its end)
+        """
+        self._file = open(path, 'a')
+
+    def write(self, records):
+        self._file.write(''.join([json.dumps(record, sort_keys=True) + '\n' \
+                                    for record in records]))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SQLiteStatistics(StatisticsStream):
+    """
+    Statistics written in the generations table of a SQLite database.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the database (the table is created if needed)
+        """
+        self._con = sqlite.connect(path)
+        self._con.execute("CREATE TABLE IF NOT EXISTS generations (%s)" \
+                % ', '.join(FIELDS))
+        self._insert = "INSERT INTO generations (%s) VALUES (%s)" \
+                % (', '.join(FIELDS), ', '.join(['?'] * len(FIELDS)))
+
+    def write(self, records):
+        self._con.executemany(self._insert,
+                [ [record.get(field) for field in FIELDS] for record in records])
+        self._con.commit()
+
+    def close(self):
+        self._con.close()
+
+
+def open_statistics(path):
+    """
+    Returns the statistics stream of a file: JSON lines for the .jsonl and
+    .json files, SQLite otherwise.
+    """
+    if path.endswith(('.jsonl', '.json')):
+        return JSONLinesStatistics(path)
+    return SQLiteStatistics(path)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+"""
+:mod:`pystepx.island.topology` -- Topologies of the islands
+===========================================================
+
+A topology gives the islands receiving the migrants of each island.
+The sparse topologies (ring, torus, hypercube, random k-regular) keep the
+traffic of each island small when the number of islands grows; the fully
+connected topology sends migrants from each island to all the other ones.
+"""
+
+import math
+
+import numpy as np
+
+# number of swaps tried per edge to mix the random regular graph
+SWAPS_PER_EDGE = 10
+
+
+class Topology(object):
+    """
+    Base class of the topologies.
+    """
+
+    def get_destinations(self, island, nb_islands):
+        """
+        Returns the islands receiving the migrants of an island.
+
+        :param island: number of the source island
+        :param nb_islands: number of islands
+        :type island: integer
+        :type nb_islands: integer
+        """
+        raise NotImplementedError()
+
+
+class RingTopology(Topology):
+    """
+    The islands are placed in a circle: the migrants go to the island after
+    (east) and to the island before (west).
+    """
+
+    def get_destinations(self, island, nb_islands):
+        return [ (island + 1) % nb_islands,
+                 (island - 1) % nb_islands]
+
+
+class TorusTopology(Topology):
+    """
+    The islands are placed on a grid whose borders are joined: the migrants
+    go to the four neighbours of the island.
+    """
+
+    def __init__(self, width=None):
+        """
+        :param width: number of islands of a row of the grid. By default,
+        the grid is the closest to a square.
+        """
+        self._width = width
+
+    def _get_width(self, nb_islands):
+        if self._width is not None:
+            assert nb_islands % self._width == 0, \
+                    "The width of the torus must divide the number of islands"
+            return self._width
+        width = int(math.sqrt(nb_islands))
+        while nb_islands % width:
+            width -= 1
+        return width
+
+    def get_destinations(self, island, nb_islands):
+        width = self._get_width(nb_islands)
+        height = nb_islands / width
+        row, column = island / width, island % width
+
+        destinations = []
+        for neighbour in ( row * width + (column + 1) % width,
+                           row * width + (column - 1) % width,
+                           ((row + 1) % height) * width + column,
+                           ((row - 1) % height) * width + column):
+            if neighbour != island and neighbour not in destinations:
+                destinations.append(neighbour)
+        return destinations
+
+
+class HypercubeTopology(Topology):
+    """
+    The islands are the vertices of a hypercube (their number must be a
+    power of two): the migrants go to the islands whose number differs
+    by one bit.
+    """
+
+    def get_destinations(self, island, nb_islands):
+        assert nb_islands & (nb_islands - 1) == 0, \
+                "The number of islands of a hypercube must be a power of two"
+        return [ island ^ (1 << bit) \
+                    for bit in range(int(math.log(nb_islands, 2) + 0.5))]
+
+
+class RandomRegularTopology(Topology):
+    """
+    Random graph in which each island sends migrants to degree islands and
+    receives migrants from degree islands.
+    The graph is drawn once and kept for the whole evolution.
+    """
+
+    def __init__(self, degree=2, seed=None):
+        """
+        :param degree: number of destinations of each island
+        :param seed: seed of the random graph
+        """
+        self._degree = degree
+        self._seed = seed
+        self._graph = {}
+
+    def _build(self, nb_islands):
+        """
+        Draw the graph edge by edge: start from a circulant graph (each
+        island sends to the islands at degree distinct random offsets, in a
+        random order of the islands), then mix it with random swaps of the
+        destinations of two edges. A swap is done only when it keeps the
+        graph without loop and without repeated edge, so the degrees never
+        change and no draw is ever rejected as a whole.
+        """
+        assert self._degree < nb_islands, \
+                "The degree must be lower than the number of islands"
+        rng = np.random.RandomState(self._seed)
+        order = rng.permutation(nb_islands)
+        offsets = rng.permutation(np.arange(1, nb_islands))[:self._degree]
+        destinations = [[] for island in range(nb_islands)]
+        for position in range(nb_islands):
+            destinations[order[position]] = [ int(order[(position + offset) % nb_islands]) \
+                                                for offset in offsets]
+        known = [set(elem) for elem in destinations]
+
+        for i in xrange(SWAPS_PER_EDGE * nb_islands * self._degree):
+            source1, source2 = rng.randint(nb_islands, size=2)
+            edge1, edge2 = rng.randint(self._degree, size=2)
+            destination1 = destinations[source1][edge1]
+            destination2 = destinations[source2][edge2]
+            if source1 == destination2 or source2 == destination1 \
+                    or destination2 in known[source1] or destination1 in known[source2]:
+                continue
+            destinations[source1][edge1] = destination2
+            destinations[source2][edge2] = destination1
+            known[source1].remove(destination1)
+            known[source1].add(destination2)
+            known[source2].remove(destination2)
+            known[source2].add(destination1)
+        return destinations
+
+    def get_destinations(self, island, nb_islands):
+        if nb_islands not in self._graph:
+            self._graph[nb_islands] = self._build(nb_islands)
+        return list(self._graph[nb_islands][island])
+
+
+class FullTopology(Topology):
+    """
+    Each island sends migrants to all the other islands.
+    """
+
+    def get_destinations(self, island, nb_islands):
+        return [ destination for destination in range(nb_islands) \
+                    if destination != island]
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+
+"""
+:mod:`pystepx.multirun` -- Batch of independent runs
+====================================================
+
+Launch many independent runs of the same problem (for statistical studies)
+on a pool of local processes.
+
+The engine of each run is built by a configuration factory called with the
+seed of the run. The processes of the pool are reused from one run to the
+next one (their startup and their imports are paid once), and the fitness
+data given to set_shared_data is shared read-only by the processes: the pool
+is forked after it, so the arrays are not copied (copy-on-write) and not
+pickled.
+
+The generations and the result of each run are written in one SQLite
+statistics database:
+
+* runs: seed, success, number of generations, best fitness and tree, cpu
+  and wall times of each run
+* generations: best fitness, evaluations and time of each generation of
+  each run
+
+The summary of the batch gives the success rate, the number of generations
+to the solution of the successful runs and the cpu time.
+"""
+
+import os
+import time
+import random
+import logging
+import traceback
+import multiprocessing
+import sqlite3 as sqlite
+
+import numpy as np
+
+# configuration of the batch, inherited by the processes of the pool
+_factory = None
+_shared_data = {}
+
+
+def get_shared_data(name):
+    """
+    Returns a data shared by the runs (see MultiRunExecutor.set_shared_data).
+    Called by the configuration factory.
+    """
+    return _shared_data[name]
+
+
+def _execute_run(args):
+    """
+    Execute one run in a process of the pool.
+
+    :param args: (number of the run, seed, path of the population database)
+    :returns: the result of the run and the records of its generations
+    """
+    run, seed, db_name = args
+    random.seed(seed)
+    np.random.seed(seed)
+    start, start_cpu = time.time(), sum(os.times()[:2])
+    result = {'run': run, 'seed': seed, 'success': False, 'generations': 0,
+              'best_fitness': None, 'best_tree': None, 'error': None}
+    records = []
+    engine = None
+
+    try:
+        if os.path.exists(db_name):
+            os.remove(db_name)
+        engine = _factory(seed)
+        engine.set_db_name(db_name)
+        evolver = engine.get_evolver()
+
+        generation_start = time.time()
+        for best in engine.sequentially_evolve():
+            generation = engine.get_last_generation_number()
+            records.append((run, generation, best[1],
+                            engine.get_generation_stats().get('evaluations', 0),
+                            time.time() - generation_start))
+            result['generations'] = generation
+            result['best_fitness'] = best[1]
+            if best[1] <= evolver.get_fitness_criterion():
+                result['success'] = True
+                break
+            if evolver.is_evolution_ended():
+                break
+            generation_start = time.time()
+
+        result['best_tree'] = str(engine.get_best_individual()[2])
+    except Exception:
+        result['error'] = traceback.format_exc()
+    finally:
+        # the database of the run is closed and removed even after an error
+        try:
+            if engine is not None:
+                engine.close()
+        except Exception:
+            if result['error'] is None:
+                result['error'] = traceback.format_exc()
+        if os.path.exists(db_name):
+            os.remove(db_name)
+
+    result['cpu_time'] = sum(os.times()[:2]) - start_cpu
+    result['wall_time'] = time.time() - start
+    return result, records
+
+
+class MultiRunExecutor(object):
+    """
+    Execute independent runs of a PySTEPX configuration on a process pool.
+    """
+
+    def __init__(self, factory, seeds, processes=None,
+                 stats_path='/tmp/pySTEPX_runs.sqlite',
+                 db_path='/tmp/pySTEPX_run%d.sqlite'):
+        """
+        :param factory: function building the configured PySTEPX engine of a
+        run from its seed (the random generators are already seeded)
+        :param seeds: seed of each run
+        :param processes: number of processes (the number of cores by default)
+        :param stats_path: path of the statistics database
+        :param db_path: model of the path of the population database of each
+        run. Must contain %d where to put the number of the run. The database
+        is removed at the end of the run.
+        :type seeds: list of integers
+        :type processes: integer
+        :type stats_path: string
+        :type db_path: string
+        """
+        assert db_path.find('%d') != -1, "db_path must contains %d to include the run number"
+        self._factory = factory
+        self._seeds = list(seeds)
+        self._processes = processes
+        self._stats_path = stats_path
+        self._db_path = db_path
+        self._shared_data = {}
+        self._results = []
+
+    def set_shared_data(self, **data):
+        """
+        Set the read-only data shared by the runs (the fitness cases...),
+        read by the factory with get_shared_data.
+        The numpy arrays (or memory-mapped arrays) are not copied in the
+        processes of the pool.
+        """
+        self._shared_data.update(data)
+
+    def _create_tables(self, con):
+        """Create the tables of the statistics database."""
+        con.execute("""CREATE TABLE IF NOT EXISTS runs (
+                            run INTEGER, seed INTEGER, success INTEGER,
+                            generations INTEGER, best_fitness FLOAT,
+                            best_tree TEXT, cpu_time FLOAT, wall_time FLOAT,
+                            error TEXT)""")
+        con.execute("""CREATE TABLE IF NOT EXISTS generations (
+                            run INTEGER, generation INTEGER, best FLOAT,
+                            evaluations INTEGER, time FLOAT)""")
+        con.commit()
+
+    def run(self):
+        """
+        Execute all the runs and write their statistics as soon as they end.
+
+        :returns: the summary of the batch (see get_summary)
+        """
+        global _factory, _shared_data
+        _factory, _shared_data = self._factory, self._shared_data
+
+        con = sqlite.connect(self._stats_path)
+        self._create_tables(con)
+        self._results = []
+        pool = multiprocessing.Pool(self._processes)
+        try:
+            tasks = [ (run, seed, self._db_path % run) \
+                        for run, seed in enumerate(self._seeds)]
+            for result, records in pool.imap_unordered(_execute_run, tasks):
+                if result['error'] is not None:
+                    logging.error('Run %d (seed %d) failed: %s' % (
+                        result['run'], result['seed'], result['error']))
+                con.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            [result[field] for field in ('run', 'seed', 'success',
+                                'generations', 'best_fitness', 'best_tree',
+                                'cpu_time', 'wall_time', 'error')])
+                con.executemany("INSERT INTO generations VALUES (?, ?, ?, ?, ?)", records)
+                con.commit()
+                self._results.append(result)
+                print "Run %d\t| seed %d\t| generations %d\t| fitness %s" % (
+                        result['run'], result['seed'], result['generations'],
+                        result['best_fitness'])
+        finally:
+            pool.close()
+            pool.join()
+            con.close()
+            _factory, _shared_data = None, {}
+
+        summary = self.get_summary()
+        print "Success rate\t%f (%d runs)" % (summary['success_rate'], summary['runs'])
+        print "Generations to solution\t%s" % summary['generations_to_solution']
+        print "CPU time\t%f (%f per run)" % (summary['cpu_time'], summary['cpu_time_per_run'])
+        return summary
+
+    def get_results(self):
+        """Returns the result of each ended run (dicts of the columns of the
+        runs table)."""
+        return sorted(self._results, key=lambda result: result['run'])
+
+    def get_summary(self):
+        """
+        Returns the summary of the ended runs: number of runs, success rate,
+        mean and median number of generations to the solution of the
+        successful runs (None without success), total and mean cpu time.
+        """
+        results = [result for result in self._results if result['error'] is None]
+        generations = [result['generations'] for result in results if result['success']]
+        cpu_times = [result['cpu_time'] for result in self._results]
+        return {'runs': len(self._results),
+                'errors': len(self._results) - len(results),
+                'success_rate': float(len(generations)) / max(1, len(results)),
+                'generations_to_solution': np.mean(generations) if generations else None,
+                'median_generations_to_solution': \
+                        np.median(generations) if generations else None,
+                'cpu_time': sum(cpu_times),
+                'cpu_time_per_run': sum(cpu_times) / max(1, len(cpu_times))}
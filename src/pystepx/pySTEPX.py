@@ -45,14 +45,21 @@ class PySTEPX(object):
         self.set_crossover_operator(CrossoverOperator())
         self.set_crossover_mapping([])
         self.set_strongly_typed_crossover_degree(False)
+        self.set_typed_crossover(True)
+        self.set_size_fair_crossover(False)
+        self.set_copy_on_write(True)
+        self.set_mutation_probabilities()
         self.set_substitute_mutation(False)
         self.set_db_name(db_path)
         self.set_start_from_scratch(start_from_scratch)
         self.set_low_memory_footprint(False)
+        self.set_executor(None)
+        self.set_async_write(False)
         self.set_endofgeneration(None)
 
     def get_best_individual(self):
-        """Returns the best individual of the whole population"""
+        """Returns the id, the fitness and the tree of the best individual of
+        the last population"""
         return self.__evolver__.get_best_individual(all=True)
 
     def set_fitness_function(self, function):
@@ -86,6 +93,38 @@ class PySTEPX(object):
         """XXX"""
         self.__config__['strongly_typed_crossover_degree'] = degree
 
+    def set_typed_crossover(self, value):
+        """
+        Set if the crossover points are chosen only among the legal ones
+        (True, the default) or checked after each crossover attempt (False).
+        With a strongly typed crossover degree and a crossover mapping, the
+        points are always checked after each attempt (the exchanged ADF
+        symbols are renamed).
+        """
+        self.__config__['typed_crossover'] = value
+
+    def set_size_fair_crossover(self, value):
+        """
+        Set if the second crossover point is chosen relatively to the size
+        of the first subtree (True) instead of uniformly (False, the default)
+        """
+        self.__config__['size_fair_crossover'] = value
+
+    def set_copy_on_write(self, value):
+        """
+        Set if the offsprings share the unmodified subtrees of their parents
+        (True, the default) instead of being built from deep copies (False)
+        """
+        self.__config__['copy_on_write'] = value
+
+    def set_mutation_probabilities(self, subtree=1.0, point=0.0, hoist=0.0, shrink=0.0):
+        """
+        Set the probability of each kind of mutation: subtree (Koza),
+        point, hoist and shrink mutations (see Mutator)
+        """
+        self.__config__['mutation_probabilities'] = dict(subtree=subtree,
+                point=point, hoist=hoist, shrink=shrink)
+
     def set_adf_ordered(self, value):
         """Specify if adf must be ordered (prevents infinite loop)"""
         self.__config__['adf_ordered'] = value
@@ -101,6 +140,24 @@ class PySTEPX(object):
     def set_low_memory_footprint(self, value):
         self.__config__['low_memory_footprint'] = value
 
+    def set_executor(self, executor):
+        """
+        Set the executor used to evaluate the offsprings: an object with a
+        map(function, iterable) method, e.g. a multiprocessing.Pool (the
+        fitness function must then be picklable), or None (the default)
+        to evaluate them in the current process
+        """
+        self.__config__['executor'] = executor
+
+    def set_async_write(self, value):
+        """
+        Set if the populations are written in the database by a background
+        thread while the next generation is computed (True), or before
+        computing it (False, the default). Not compatible with the low memory
+        footprint.
+        """
+        self.__config__['async_write'] = value
+
     def set_db_name(self, value):
         """Set the dbname"""
         self.__config__['db_name'] = value
@@ -114,6 +171,12 @@ class PySTEPX(object):
         already exists."""
         self.__config__['start_from_scratch']= value
 
+    def get_generation_stats(self):
+        """
+        Returns the statistics of the last computed generation.
+        """
+        return self.__evolver__.get_generation_stats()
+
     def get_last_generation_number(self):
         """
         Returns the actual generation.
@@ -133,6 +196,14 @@ class PySTEPX(object):
         """
         self.__evolver__ = evolver
 
+    def sync(self):
+        """Waits until all the computed populations are written in the database"""
+        self.__evolver__.sync()
+
+    def close(self):
+        """Writes the remaining populations and closes the database"""
+        self.__evolver__.close()
+
     def get_evolver(self):
         """Returns teh evolver."""
         return self.__evolver__
@@ -149,7 +220,17 @@ class PySTEPX(object):
                 self.__config__['strongly_typed_crossover_degree'])
         self.__config__['crossover_operator'].set_crossover_mapping( \
                 self.__config__['crossover_mapping'])
+        self.__config__['crossover_operator'].set_typed_crossover( \
+                self.__config__['typed_crossover'])
+        self.__config__['crossover_operator'].set_size_fair( \
+                self.__config__['size_fair_crossover'])
         self.__config__['mutation_operator'].set_tree_rules( self.__config__['rules'])
+        self.__config__['crossover_operator'].set_copy_on_write( \
+                self.__config__['copy_on_write'])
+        self.__config__['mutation_operator'].set_copy_on_write( \
+                self.__config__['copy_on_write'])
+        self.__config__['mutation_operator'].set_mutation_probabilities( \
+                **self.__config__['mutation_probabilities'])
 
         #Inform evolver
         self.__evolver__._set_tree_rules(self.__config__['rules'])
@@ -160,6 +241,8 @@ class PySTEPX(object):
         self.__evolver__._set_start_from_scratch(self.__config__['start_from_scratch'])
         self.__evolver__._set_end_of_generation_handler(self.__config__['generationhandler'])
         self.__evolver__._set_low_memory_footprint(self.__config__['low_memory_footprint'])
+        self.__evolver__._set_executor(self.__config__['executor'])
+        self.__evolver__._set_async_write(self.__config__['async_write'])
 
 
     def evolve(self):
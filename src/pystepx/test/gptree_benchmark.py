@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# filename: gptree_benchmark.py
+"""
+Compare the memory usage and the speed of the operations of the nested list
+trees and of their compact version (pystepx.tree.gptree.GPTree).
+"""
+import sys
+import time
+import random
+import copy
+import cPickle
+
+from pystepx.tree import buildtree
+from pystepx.tree.gptree import GPTree, SymbolTable
+from pystepx.geneticoperators import crossutil
+from pystepx.test.test_gptree import treeRules
+
+NB_TREES = 500
+MAX_DEPTH = 10
+
+
+def list_size(tree):
+    """Memory used by the nested list (node tuples are counted each time)"""
+    size = sys.getsizeof(tree)
+    for elem in tree:
+        if type(elem) is list:
+            size += list_size(elem)
+        else:
+            size += sys.getsizeof(elem) + sum([sys.getsizeof(x) for x in elem])
+    return size
+
+
+def timeit(title, function, trees):
+    """Apply the function on each tree and print the mean time"""
+    t0 = time.time()
+    for tree in trees:
+        function(tree)
+    duration = time.time() - t0
+    print '%-45s %10.2f us/tree' % (title, 1e6 * duration / len(trees))
+
+
+def list_replace(tree):
+    """Replace a random subtree with the eval/exec way of the crossover"""
+    mapping = crossutil.GetIndicesMappingFromTree(tree)
+    depth = crossutil.GetDepthFromIndicesMapping(mapping)
+    point = random.choice(crossutil.UnpackIndicesFromList(
+                crossutil.GetPackedListIndicesAtDepth(mapping, random.randint(1, depth - 1))))
+    clone = copy.deepcopy(tree)
+    fragment = eval("clone%s" % crossutil.IndexLstToIndexStr2(point))
+    exec("clone%s=fragment" % crossutil.IndexLstToIndexStr2(point))
+    return clone
+
+
+def random_points(tree, nb):
+    """Returns nb random paths of the tree"""
+    mapping = crossutil.GetIndicesMappingFromTree(tree)
+    points = []
+    for depth in xrange(1, crossutil.GetDepthFromIndicesMapping(mapping)):
+        points.extend(crossutil.UnpackIndicesFromList(
+                crossutil.GetPackedListIndicesAtDepth(mapping, depth)))
+    return [random.choice(points) for i in xrange(nb)]
+
+
+def eval_get_set(args):
+    """Get and set back the subtrees with eval/exec"""
+    tree, points = args
+    for point in points:
+        fragment = eval("tree%s" % crossutil.IndexLstToIndexStr2(point))
+        exec("tree%s=fragment" % crossutil.IndexLstToIndexStr2(point))
+
+
+def path_get_set(args):
+    """Get and set back the subtrees with the path API of crossutil"""
+    tree, points = args
+    for point in points:
+        fragment = crossutil.GetSubtreeAtPath(tree, point)
+        crossutil.ReplaceSubtreeAtPath(tree, point, fragment)
+
+
+def gptree_replace(gptree):
+    """Replace a random subtree of the compact tree"""
+    position = random.randint(1, len(gptree) - 1)
+    return gptree.replace(position, gptree.subtree(position))
+
+
+def main():
+    builder = buildtree.BuildTree(treeRules)
+    trees = [builder.AddHalfNode((0,1,'root'), 0, 2, MAX_DEPTH) for i in xrange(NB_TREES)]
+    symbols = SymbolTable()
+    gptrees = [GPTree.from_list(tree, symbols) for tree in trees]
+    nb_nodes = sum([len(gptree) for gptree in gptrees])
+
+    print 'Memory for %d trees of %.1f nodes on average' % (NB_TREES, float(nb_nodes) / NB_TREES)
+    print '%-45s %10.1f bytes/tree' % ('nested list',
+            sum([list_size(tree) for tree in trees]) / float(NB_TREES))
+    print '%-45s %10.1f bytes/tree' % ('nested list (pickled)',
+            sum([len(cPickle.dumps(tree)) for tree in trees]) / float(NB_TREES))
+    print '%-45s %10.1f bytes/tree' % ('GPTree arrays',
+            sum([gptree.nbytes for gptree in gptrees]) / float(NB_TREES))
+    print '%-45s %10.1f bytes/tree' % ('GPTree (pickled)',
+            sum([len(cPickle.dumps(gptree, -1)) for gptree in gptrees]) / float(NB_TREES))
+
+    print
+    print 'Operations'
+    timeit('index mapping + depth (nested list)',
+            lambda tree: crossutil.GetDepthFromIndicesMapping(
+                crossutil.GetIndicesMappingFromTree(tree)),
+            trees)
+    timeit('from_list + depth (GPTree)',
+            lambda tree: GPTree.from_list(tree, symbols).depth(),
+            trees)
+    timeit('depth (GPTree already built)',
+            lambda gptree: gptree.depth(),
+            gptrees)
+    timeit('to_list (GPTree)',
+            lambda gptree: gptree.to_list(),
+            gptrees)
+    timeit('subtree replacement (deepcopy + eval/exec)',
+            list_replace,
+            trees)
+    timeit('subtree replacement (GPTree)',
+            gptree_replace,
+            gptrees)
+
+    print
+    print 'Subtree access (100 get + set per tree, no copy)'
+    points = [(tree, random_points(tree, 100)) for tree in trees]
+    timeit('eval/exec',
+            eval_get_set,
+            points)
+    timeit('GetSubtreeAtPath/ReplaceSubtreeAtPath',
+            path_get_set,
+            points)
+
+    print
+    print 'Generation of %d trees' % (100 * NB_TREES)
+    t0 = time.time()
+    for i in xrange(100 * NB_TREES):
+        builder.AddHalfNode((0,1,'root'), 0, 2, MAX_DEPTH)
+    print '%-45s %10.2f s' % ('AddHalfNode', time.time() - t0)
+    t0 = time.time()
+    builder.generate(100 * NB_TREES, 'AddHalfNode', 2, MAX_DEPTH)
+    print '%-45s %10.2f s' % ('BuildTree.generate', time.time() - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the strongly-typed tree building methods.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+
+from pystepx.tree import buildtree
+from pystepx.test.test_gptree import treeRules
+
+
+# The terminal can only be reached through '^2'
+sparseRules = {'root':[([(1,2,'+'),(1,1,'^2')], [])],
+               '+':[([(1,2,'+'),(1,1,'^2')], []), ([(1,2,'+'),(1,1,'^2')], [])],
+               '^2':[([], [(3,0,'x')])]
+              }
+
+
+class TestBuildTree(unittest.TestCase):
+    """
+    Check that the built trees respect the rules and the depths.
+    """
+
+    def test_rules(self):
+        """Each child is allowed by the rules of its parent"""
+        for rules in (treeRules, sparseRules):
+            builder = buildtree.BuildTree(rules)
+            for i in xrange(100):
+                tree = builder.AddHalfNode((0,1,'root'), 0, 2, 8)
+                checkRules(self, tree, rules)
+
+    def test_depth(self):
+        """The full method reaches the max depth, the other ones do not exceed it"""
+        builder = buildtree.BuildTree(treeRules)
+        for maxdepth in xrange(2, 9):
+            for i in xrange(20):
+                self.assertEqual(treeDepth(builder.AddFullNode((0,1,'root'), 0, maxdepth)),
+                                 maxdepth)
+                self.assertTrue(treeDepth(builder.AddGrowNodeMin((0,1,'root'), 0, 2, maxdepth))
+                                <= maxdepth)
+
+    def test_no_leaf_in_list(self):
+        """The leaves are never stored in a list of their own"""
+        builder = buildtree.BuildTree(treeRules)
+        for i in xrange(100):
+            tree = builder.AddHalfNode((0,1,'root'), 0, 2, 8)
+            for subtree in treeBranches(tree):
+                self.assertNotEqual(subtree[0][1], 0)
+
+    def test_wrong_rules(self):
+        """A node without rules can not get children"""
+        builder = buildtree.BuildTree({'root':[([(1,2,'+')], [])]})
+        self.assertRaises(buildtree.TreeBuildingError,
+                          builder.AddFullNode, (0,1,'root'), 0, 4)
+
+    def test_generate(self):
+        """The batch generation respects the rules and the depths of each method"""
+        for rules in (treeRules, sparseRules):
+            builder = buildtree.BuildTree(rules)
+            for method in ('AddHalfNode', 'AddFullNode', 'AddGrowNodeMin'):
+                batch = builder.generate(200, method, 2, 6, rng=1)
+                self.assertEqual(len(batch), 200)
+                depths = []
+                for tree in batch.to_lists():
+                    checkRules(self, tree, rules)
+                    depths.append(treeDepth(tree))
+                self.assertTrue(max(depths) <= 6)
+                if method == 'AddFullNode' and rules is treeRules:
+                    self.assertEqual(min(depths), 6)
+                if method == 'AddHalfNode' and rules is treeRules:
+                    self.assertEqual(sorted(set(depths)), range(2, 7))
+
+    def test_generate_seed(self):
+        """The same seed gives the same trees"""
+        builder = buildtree.BuildTree(treeRules)
+        batch1 = builder.generate(100, 'AddHalfNode', 2, 8, rng=42)
+        batch2 = buildtree.BuildTree(treeRules).generate(100, 'AddHalfNode', 2, 8, rng=42)
+        self.assertEqual(batch1.to_lists(), batch2.to_lists())
+        self.assertNotEqual(batch1.to_lists(),
+                            builder.generate(100, 'AddHalfNode', 2, 8, rng=43).to_lists())
+
+    def test_ptc2(self):
+        """PTC2 builds trees of the targeted sizes"""
+        for rules in (treeRules, sparseRules):
+            builder = buildtree.BuildTree(rules)
+            batch = builder.generate(300, 'AddPTC2Node', 0, 17, rng=1, minsize=10, maxsize=30)
+            sizes = []
+            for index in xrange(len(batch)):
+                tree = batch.to_list(index)
+                checkRules(self, tree, rules)
+                self.assertTrue(treeDepth(tree) <= 17)
+                sizes.append(len(batch.tree(index)))
+            # the leaves of the last expanded branch can exceed the target
+            # (and the sparse rules can not always reach it)
+            if rules is treeRules:
+                self.assertTrue(min(sizes) >= 10)
+                self.assertTrue(max(sizes) <= 31)
+
+        tree = buildtree.BuildTree(treeRules).AddPTC2Node((0,1,'root'), 0, 5, 5, 3)
+        checkRules(self, tree, treeRules)
+        self.assertTrue(treeDepth(tree) <= 3)
+
+
+def treeBranches(tree):
+    """Returns all the branches (lists) of the tree"""
+    yield tree
+    for elem in tree[1:]:
+        if type(elem) is list:
+            for branch in treeBranches(elem):
+                yield branch
+
+
+def treeDepth(tree):
+    """Returns the depth of the deepest leaf (the root is at depth 0)"""
+    if type(tree) is not list:
+        return 0
+    return 1 + max([treeDepth(elem) for elem in tree[1:]] or [-1])
+
+
+def checkRules(test, tree, rules):
+    """Checks that each child of the tree is allowed by the rules"""
+    for branch in treeBranches(tree):
+        slots = rules[branch[0][2]]
+        test.assertEqual(len(branch) - 1, branch[0][1])
+        for i, child in enumerate(branch[1:]):
+            node = child[0] if type(child) is list else child
+            test.assertTrue(node in slots[i][0] + slots[i][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,7 @@ import pystepx.pySTEPX as pySTEPX
 import pystepx.evolver as evolver
 from pystepx.tree.treeutil import WrongValues
 from pystepx.fitness import evalfitness
+from pystepx.geneticoperators import selection
 
 
 DB = '/tmp/continuation.sqlite'
@@ -55,12 +56,14 @@ class TestExecutionContinuation(unittest.TestCase):
         self._gp_engine = None
 
 
-    def _create_gp(self, start_from_scratch):
+    def _create_gp(self, start_from_scratch, offspring_policy='best', **options):
         """
         Create the genetic programming engine and configure it.
 
         @param start_from_scratch: if True, start from scratch, if False, reload
         db
+        @param offspring_policy: offsprings kept by the crossover
+        @param options: other parameters of the evolver
         """
         def add(listElem):
             try:
@@ -156,7 +159,7 @@ class TestExecutionContinuation(unittest.TestCase):
         for nb in xrange(nb_eval):
             ideal_results.append([all_x[nb]**3 + all_x[nb]**2 + math.cos(all_x[nb])])
 
-        evolve = evolver.Evolver()
+        evolve = evolver.Evolver(offspring_policy=offspring_policy, **options)
 
         gp_engine = pySTEPX.PySTEPX(db_path=DB,
                 start_from_scratch=start_from_scratch)
@@ -242,6 +245,169 @@ class TestExecutionContinuation(unittest.TestCase):
         gen.next()
         self.assertEqual( self._gp_engine.get_last_generation_number(), 3)
 
+    def test_continuation_without_treesize(self):
+        """
+        Test the continuation from a database of an older version, whose
+        tables have no treesize column
+        """
+        self._create_gp(True)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        gen.next()
+        self._gp_engine.sync()
+        con = self._gp_engine.get_evolver()._con
+        sizes = con.execute("SELECT o_id, treesize FROM pop1 ORDER BY o_id").fetchall()
+        for tablename in ('pop0', 'pop1'):
+            con.execute("ALTER TABLE %s RENAME TO old" % tablename)
+            con.execute("""CREATE TABLE %s (o_id INTEGER PRIMARY KEY, tree TEXT,
+                           tree_mapping TEXT, treedepth INTEGER, evaluated INTEGER,
+                           fitness FLOAT)""" % tablename)
+            con.execute("""INSERT INTO %s SELECT o_id, tree, tree_mapping, treedepth,
+                           evaluated, fitness FROM old""" % tablename)
+            con.execute("DROP TABLE old")
+        con.commit()
+
+        self._create_gp(False)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        self.assertEqual( self._gp_engine.get_last_generation_number(), 2)
+        con = self._gp_engine.get_evolver()._con
+        self.assertEqual(
+            con.execute("SELECT o_id, treesize FROM pop1 ORDER BY o_id").fetchall(),
+            sizes)
+
+    def test_offspring_policies(self):
+        """
+        Test that each offspring policy fills the population and that the
+        saved evaluations are counted
+        """
+        for policy in ('both', 'random', 'best'):
+            self._create_gp(True, policy)
+            gen = self._gp_engine.sequentially_evolve()
+            gen.next()
+            gen.next()
+
+            stats = self._gp_engine.get_generation_stats()
+            self.assertTrue(stats['evaluations'] > 0)
+            if policy == 'both':
+                # each crossover gives two of the 100 crossover offsprings
+                self.assertTrue(stats['crossover_crossovers'] <= 50)
+            if policy == 'best':
+                # both offsprings are evaluated or found in the cache
+                self.assertTrue(stats['evaluations'] + stats['evaluations_saved']
+                                >= 2 * stats['crossover_crossovers'])
+            if policy == 'random':
+                # at least one evaluation is saved per crossover
+                self.assertTrue(stats['evaluations_saved'] >= stats['crossover_crossovers'])
+
+    def test_average_size(self):
+        """
+        Test that the average size of the trees is reported with the size-fair
+        and size-limited crossover
+        """
+        self._create_gp(True, max_nodes=30)
+        self._gp_engine.set_size_fair_crossover(True)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        gen.next()
+
+        stats = self._gp_engine.get_generation_stats()
+        self.assertTrue(stats['average_size'] >= 1)
+        self.assertTrue(stats['crossover_crossovers'] > 0)
+
+    def test_max_nodes(self):
+        """
+        Test that the Koza crossover and the mutations do not build trees
+        bigger than max_nodes
+        """
+        self._create_gp(True, buildmethod='AddPTC2Node', min_size=5, max_size=20,
+                        max_nodes=30)
+        self._gp_engine.set_typed_crossover(False)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        gen.next()
+        self._gp_engine.sync()
+
+        con = self._gp_engine.get_evolver()._con
+        initial = con.execute("SELECT MAX(treesize) FROM pop0").fetchone()[0]
+        biggest = con.execute("SELECT MAX(treesize) FROM pop1").fetchone()[0]
+        self.assertTrue(initial <= 30)
+        self.assertTrue(biggest <= 30)
+
+    def test_parsimony(self):
+        """
+        Test that the trees killed by the Tarpeian method are not evaluated
+        """
+        self._create_gp(True, 'both', lexicographic_parsimony=True,
+                        tarpeian_rate=1.0, double_tournament=0.7)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        gen.next()
+
+        stats = self._gp_engine.get_generation_stats()
+        self.assertTrue(stats['tarpeian_kills'] > 0)
+        # each offspring is either killed, evaluated or found in the cache
+        # (the mutations giving the parent are done again)
+        offsprings = stats['tarpeian_kills'] + stats['evaluations'] \
+                + stats['evaluations_saved']
+        self.assertTrue(offsprings >= 2 * stats['crossover_crossovers'])
+        self.assertTrue(offsprings <= 2 * stats['crossover_crossovers']
+                        + stats['mutation_subtree'])
+
+    def test_pipeline(self):
+        """
+        Test that each stage of the generation is timed, that the offsprings
+        are evaluated by the executor and that the population is filled,
+        with and without the low memory footprint
+        """
+        class Executor(object):
+            def __init__(self):
+                self.calls = 0
+            def map(self, function, iterable):
+                self.calls += 1
+                return map(function, iterable)
+
+        for low_memory in (False, True):
+            executor = Executor()
+            self._create_gp(True)
+            self._gp_engine.set_executor(executor)
+            self._gp_engine.set_low_memory_footprint(low_memory)
+            gen = self._gp_engine.sequentially_evolve()
+            gen.next()
+            gen.next()
+
+            stats = self._gp_engine.get_generation_stats()
+            for stage in ('select', 'fetch', 'breed', 'dedup', 'evaluate', 'write'):
+                self.assertTrue(stats['time_' + stage] >= 0)
+            self.assertTrue(stats['evaluations'] > 0)
+            # 100 crossovers and 98 mutations by batches of 50 parents with the low memory footprint
+            self.assertEqual(executor.calls, 4 if low_memory else 1)
+            self.assertEqual(self._gp_engine.get_evolver().get_real_popsize(), 200)
+
+    def test_async_write(self):
+        """
+        Test that the populations written in background are in the database
+        after the barrier, and that the evolution can continue from them
+        """
+        self._create_gp(True)
+        self._gp_engine.set_async_write(True)
+        gen = self._gp_engine.sequentially_evolve()
+        for i in xrange(3):
+            best = gen.next()
+        self._gp_engine.sync()
+
+        evolver = self._gp_engine.get_evolver()
+        db_list = selection.GetDBKeysAndFitness(evolver._con, 'pop2')
+        self.assertEqual(len(db_list), 200)
+        self.assertEqual(db_list[0][1], best[1])
+        for o_id, individual in evolver._population.iteritems():
+            self.assertEqual(evolver.load_tree('pop2', o_id)[1:], individual)
+
+        self._create_gp(False)
+        gen = self._gp_engine.sequentially_evolve()
+        gen.next()
+        self.assertEqual( self._gp_engine.get_last_generation_number(), 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the crossover operators.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+import copy
+
+from pystepx.tree import buildtree
+from pystepx.geneticoperators.crossoveroperator import CrossoverOperator
+from pystepx.geneticoperators.mutationoperator import Mutator
+from pystepx.geneticoperators import crossutil
+from pystepx.tree.gptree import GPTree
+from pystepx.test.test_gptree import treeRules, ADF_TREE
+from pystepx.test.test_buildtree import sparseRules, checkRules, treeDepth
+
+
+class TestTypedCrossover(unittest.TestCase):
+    """
+    Check the offsprings of the typed crossover.
+    """
+
+    def _operator(self, rules):
+        operator = CrossoverOperator()
+        operator.set_tree_rules(rules)
+        operator.set_crossover_mapping([])
+        return operator
+
+    def test_offsprings_respect_rules(self):
+        """The offsprings respect the rules and the max depth"""
+        for rules in (treeRules, sparseRules):
+            operator = self._operator(rules)
+            builder = buildtree.BuildTree(rules)
+            for i in xrange(100):
+                p1 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                p2 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                saved1, saved2 = copy.deepcopy(p1), copy.deepcopy(p2)
+
+                pattern, o1, o2 = operator.TypedCrossover(8, p1, p2)
+                self.assertEqual(pattern, [1, 1, 1, 1])
+                checkRules(self, o1, rules)
+                checkRules(self, o2, rules)
+                self.assertTrue(treeDepth(o1) <= 8)
+                self.assertTrue(treeDepth(o2) <= 8)
+
+                # the parents are not modified
+                self.assertEqual(p1, saved1)
+                self.assertEqual(p2, saved2)
+
+    def test_statistics(self):
+        """The illegal points are counted"""
+        operator = self._operator(sparseRules)
+        builder = buildtree.BuildTree(sparseRules)
+        for i in xrange(20):
+            operator.TypedCrossover(8,
+                                    builder.AddHalfNode((0,1,'root'), 0, 2, 6),
+                                    builder.AddHalfNode((0,1,'root'), 0, 2, 6))
+        statistics = operator.get_statistics()
+        self.assertEqual(statistics['crossovers'], 20)
+        # a leaf can not replace a branch of the sparse rules
+        self.assertTrue(statistics['illegal_points_avoided'] > 0)
+
+        operator.reset_statistics()
+        self.assertEqual(operator.get_statistics()['crossovers'], 0)
+
+    def test_renaming_uses_koza_crossover(self):
+        """The strongly typed crossover with a mapping is not the typed one"""
+        operator = self._operator(treeRules)
+        self.assertTrue(operator.is_typed_crossover())
+        operator.set_strongly_typed_crossover_degree(True)
+        self.assertTrue(operator.is_typed_crossover())
+        operator.set_crossover_mapping([('_ADF0', 'ADF0')])
+        self.assertFalse(operator.is_typed_crossover())
+        operator.set_typed_crossover(False)
+        self.assertFalse(operator.is_typed_crossover())
+
+    def test_no_legal_pair(self):
+        """The parents are returned when no crossover is possible"""
+        operator = self._operator(treeRules)
+        p1 = [(0,1,'root'), (3,0,'x')]
+        p2 = [(0,1,'root'), [(1,1,'^2'), (3,0,'x')]]
+        pattern, o1, o2 = operator.TypedCrossover(1, p1, p2)
+        self.assertEqual(pattern, [0, 0, 0, 0])
+        self.assertEqual((o1, o2), (p1, p2))
+        self.assertEqual(operator.get_statistics()['no_legal_pair'], 1)
+
+    def test_maxsize(self):
+        """The offsprings never exceed the max number of nodes"""
+        operator = self._operator(treeRules)
+        builder = buildtree.BuildTree(treeRules)
+        for size_fair in (False, True):
+            operator.set_size_fair(size_fair)
+            for i in xrange(100):
+                p1 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                p2 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                map1 = crossutil.GetIndicesMappingFromTree(p1)
+                map2 = crossutil.GetIndicesMappingFromTree(p2)
+                size1 = crossutil.GetSizeFromIndicesMapping(map1)
+                size2 = crossutil.GetSizeFromIndicesMapping(map2)
+                self.assertEqual(size1, len(GPTree.from_list(p1, operator.get_grammar())))
+
+                maxsize = max(size1, size2)
+                result = operator.TypedCrossover(8, p1, p2, map1, map2, maxsize)
+                checkRules(self, result[1], treeRules)
+                checkRules(self, result[2], treeRules)
+                self.assertTrue(crossutil.GetSizeFromIndicesMapping(result[3]) <= maxsize)
+                self.assertTrue(crossutil.GetSizeFromIndicesMapping(result[5]) <= maxsize)
+
+    def test_size_fair(self):
+        """The size-fair crossover exchanges subtrees of close sizes"""
+        builder = buildtree.BuildTree(treeRules)
+        parents = [(builder.AddHalfNode((0,1,'root'), 0, 2, 8),
+                    builder.AddHalfNode((0,1,'root'), 0, 2, 8)) for i in xrange(200)]
+        changes = {}
+        for size_fair in (False, True):
+            operator = self._operator(treeRules)
+            operator.set_size_fair(size_fair)
+            changes[size_fair] = []
+            for p1, p2 in parents:
+                size1 = len(GPTree.from_list(p1, operator.get_grammar()))
+                pattern, o1, o2 = operator.TypedCrossover(17, p1, p2)
+                if pattern == [1, 1, 1, 1]:
+                    checkRules(self, o1, treeRules)
+                    changes[size_fair].append(
+                        abs(len(GPTree.from_list(o1, operator.get_grammar())) - size1))
+        mean = lambda values: float(sum(values)) / len(values)
+        self.assertTrue(mean(changes[True]) < mean(changes[False]))
+
+
+class TestSubtreePath(unittest.TestCase):
+    """
+    Compare the path API of crossutil with the eval/exec indexing.
+    """
+
+    def test_get_and_replace(self):
+        """The path gives the same subtree than eval"""
+        builder = buildtree.BuildTree(treeRules)
+        for tree in [builder.AddHalfNode((0,1,'root'), 0, 2, 6) for i in xrange(20)] + [ADF_TREE]:
+            mapping = crossutil.GetIndicesMappingFromTree(tree)
+            for depth in xrange(1, crossutil.GetDepthFromIndicesMapping(mapping)):
+                for point in crossutil.UnpackIndicesFromList(
+                        crossutil.GetPackedListIndicesAtDepth(mapping, depth)):
+                    self.assertEqual(crossutil.GetSubtreeAtPath(tree, point),
+                                     eval("tree%s" % crossutil.IndexLstToIndexStr2(point)))
+
+                    expected = copy.deepcopy(tree)
+                    exec("expected%s=(3,0,'y')" % crossutil.IndexLstToIndexStr2(point))
+                    result = crossutil.ReplaceSubtreeAtPath(copy.deepcopy(tree), point, (3,0,'y'))
+                    self.assertEqual(result, expected)
+
+        self.assertEqual(crossutil.ReplaceSubtreeAtPath(ADF_TREE, [], (3,0,'y')), (3,0,'y'))
+
+    def test_mappings(self):
+        """The operators give the same mappings and depths than a new computation"""
+        crossover = CrossoverOperator()
+        crossover.set_tree_rules(treeRules)
+        crossover.set_crossover_mapping([])
+        mutator = Mutator()
+        mutator.set_tree_rules(treeRules)
+
+        builder = buildtree.BuildTree(treeRules)
+        for i in xrange(50):
+            p1 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+            p2 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+            map1 = crossutil.GetIndicesMappingFromTree(p1)
+            map2 = crossutil.GetIndicesMappingFromTree(p2)
+            depth1 = crossutil.GetDepthFromIndicesMapping(map1)
+            depth2 = crossutil.GetDepthFromIndicesMapping(map2)
+
+            results = [crossover.TypedCrossover(8, p1, p2, map1, map2),
+                       crossover.Koza1PointCrossover(8, p1, p2, map1, map2, depth1, depth2, True)]
+            for result in results:
+                self.assertEqual(len(result), 7)
+                for tree, mapping, depth in ((result[1], result[3], result[4]),
+                                             (result[2], result[5], result[6])):
+                    self.assertEqual(mapping, crossutil.GetIndicesMappingFromTree(tree))
+                    self.assertEqual(depth, crossutil.GetDepthFromIndicesMapping(mapping))
+
+            result = mutator.mutate(8, p1, map1, depth1, True)
+            self.assertEqual(result[2], crossutil.GetIndicesMappingFromTree(result[1]))
+            self.assertEqual(result[3], crossutil.GetDepthFromIndicesMapping(result[2]))
+
+    def test_rename(self):
+        """Only the complete names are renamed"""
+        fragment = [(7, 2, '_ADF0'), (3, 0, 'x'), [(7, 1, '_ADF01'), (3, 0, 'x')]]
+        renamed = crossutil.RenameSymbols(fragment, {'_ADF0': '_ADF1'})
+        self.assertEqual(renamed,
+                         [(7, 2, '_ADF1'), (3, 0, 'x'), [(7, 1, '_ADF01'), (3, 0, 'x')]])
+        self.assertEqual(fragment[0][2], '_ADF0')
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    """
+    Check that the offsprings share the unmodified subtrees of their parents.
+    """
+
+    def test_splice(self):
+        """Only the spine is copied"""
+        tree = [(0,1,'root'), [(1,2,'+'), [(1,1,'^2'), (3,0,'x')], [(1,2,'*'), (3,0,'x'), (3,0,'x')]]]
+        saved = copy.deepcopy(tree)
+        result = crossutil.SpliceSubtreeAtPath(tree, [1, 2, 1], (3,0,'y'))
+
+        self.assertEqual(tree, saved)
+        self.assertEqual(result,
+            [(0,1,'root'), [(1,2,'+'), [(1,1,'^2'), (3,0,'x')], [(1,2,'*'), (3,0,'y'), (3,0,'x')]]])
+        self.assertFalse(result is tree)
+        self.assertFalse(result[1] is tree[1])
+        self.assertFalse(result[1][2] is tree[1][2])
+        self.assertTrue(result[1][1] is tree[1][1])
+
+    def test_operators(self):
+        """The parents are not modified and the modes give legal offsprings"""
+        for copy_on_write in (True, False):
+            crossover = CrossoverOperator()
+            crossover.set_tree_rules(treeRules)
+            crossover.set_crossover_mapping([])
+            crossover.set_copy_on_write(copy_on_write)
+            mutator = Mutator()
+            mutator.set_tree_rules(treeRules)
+            mutator.set_copy_on_write(copy_on_write)
+
+            builder = buildtree.BuildTree(treeRules)
+            for i in xrange(50):
+                p1 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                p2 = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+                saved1, saved2 = copy.deepcopy(p1), copy.deepcopy(p2)
+                map1 = crossutil.GetIndicesMappingFromTree(p1)
+                map2 = crossutil.GetIndicesMappingFromTree(p2)
+                depth1 = crossutil.GetDepthFromIndicesMapping(map1)
+                depth2 = crossutil.GetDepthFromIndicesMapping(map2)
+
+                pattern, o1, o2 = crossover.TypedCrossover(8, p1, p2)
+                checkRules(self, o1, treeRules)
+                checkRules(self, o2, treeRules)
+                crossover.Koza1PointCrossover(8, p1, p2, map1, map2, depth1, depth2)
+                identical, mutant = mutator.mutate(8, p1, map1, depth1)
+                checkRules(self, mutant, treeRules)
+
+                self.assertEqual(p1, saved1)
+                self.assertEqual(p2, saved2)
+                self.assertEqual(map1, crossutil.GetIndicesMappingFromTree(p1))
+
+
+if __name__ == "__main__":
+    unittest.main()
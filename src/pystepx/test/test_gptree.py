@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the compact representation of the trees (GPTree) against the
+nested list one.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+import random
+import copy
+import cPickle
+
+from pystepx.tree import buildtree
+from pystepx.tree.gptree import GPTree, SymbolTable
+from pystepx.tree.grammar import Grammar, compile_rules
+from pystepx.geneticoperators import crossutil
+
+
+# default function set applicable by for branches:
+defaultFunctionSet= [(1,2,'+'), (1,2,'*'), (1,1,'^2'), (1,2,'-'), (1,1,'cos'), (1,1,'sin'), (1,1,'neg')]
+# default terminal set applicable by for branches:
+defaultTerminalSet= [(3,0,'x')]
+treeRules = {'root':[(defaultFunctionSet,defaultTerminalSet)],
+                    '+':[(defaultFunctionSet,defaultTerminalSet),(defaultFunctionSet,defaultTerminalSet)],
+                    '*':[(defaultFunctionSet,defaultTerminalSet),(defaultFunctionSet,defaultTerminalSet)],
+                    '^2':[(defaultFunctionSet,defaultTerminalSet)],
+                    '-':[(defaultFunctionSet,defaultTerminalSet),(defaultFunctionSet,defaultTerminalSet)],
+                    'neg':[([(1,2,'+'),(1,2,'*'),(1,2,'-'),(1,1,'cos'),(1,1,'sin')],defaultTerminalSet)],
+                    'cos':[([(1,2,'+'),(1,2,'*'),(1,2,'-'),(1,1,'sin'),(1,1,'neg')],defaultTerminalSet)],
+                    'sin':[([(1,2,'+'),(1,2,'*'),(1,2,'-'),(1,1,'cos'),(1,1,'neg')],defaultTerminalSet)]
+                    }
+
+ADF_TREE = [(0, 2, 'root'), [(6, 1, 'ADF0'), [(1, 2, 'ADF0_+'), (8, 0, 'ADF0_PARAM0'), (8, 0, 'ADF0_PARAM1')]], [(0, 2, '_root'), [(7, 2, '_ADF0'), (3, 0, 'x'), (3, 0, 'x')], [(1, 2, '*'), (3, 0, 'x'), (3, 0, 'y')]]]
+
+
+class TestGPTree(unittest.TestCase):
+    """
+    Compare the GPTree operations with the nested list ones.
+    """
+
+    def setUp(self):
+        """Build some random trees."""
+        builder = buildtree.BuildTree(treeRules)
+        self._trees = [canonical(builder.AddHalfNode((0,1,'root'), 0, 2, 8)) for i in xrange(50)]
+        self._trees.append(ADF_TREE)
+        self._symbols = SymbolTable()
+
+    def test_round_trip(self):
+        """The nested list is rebuilt identically"""
+        builder = buildtree.BuildTree(treeRules)
+        for i in xrange(50):
+            tree = builder.AddHalfNode((0,1,'root'), 0, 2, 8)
+            gptree = GPTree.from_list(tree, self._symbols)
+            self.assertEqual(gptree.to_list(), canonical(tree))
+
+        for tree in self._trees:
+            gptree = GPTree.from_list(tree, self._symbols)
+            self.assertEqual(gptree.to_list(), tree)
+            self.assertEqual(len(gptree), len(list(crossutil.BillSubtreeIndices(tree))) \
+                    + len(list(treeLeaves(tree))))
+
+    def test_depth(self):
+        """The depth is the same than with the indices mapping"""
+        for tree in self._trees:
+            gptree = GPTree.from_list(tree, self._symbols)
+            mapping = crossutil.GetIndicesMappingFromTree(tree)
+            self.assertEqual(gptree.depth(), crossutil.GetDepthFromIndicesMapping(mapping))
+
+    def test_path(self):
+        """The path of a position gives the same subtree in the nested list"""
+        for tree in self._trees:
+            gptree = GPTree.from_list(tree, self._symbols)
+            for position in xrange(len(gptree)):
+                subtree = tree
+                for index in gptree.path(position):
+                    subtree = subtree[index]
+                expected = gptree.subtree(position).to_list()
+                if type(subtree) is tuple:
+                    subtree = [subtree]
+                self.assertEqual(subtree, expected)
+
+    def test_replace(self):
+        """Replacing a subtree is the same than in the nested list"""
+        for tree in self._trees[:-1]:
+            other = random.choice(self._trees[:-1])
+            gptree = GPTree.from_list(tree, self._symbols)
+            gpother = GPTree.from_list(other, self._symbols)
+
+            position = random.randint(1, len(gptree) - 1)
+            source = random.randint(1, len(gpother) - 1)
+            result = gptree.replace(position, gpother.subtree(source))
+
+            expected = copy.deepcopy(tree)
+            fragment = other
+            for index in gpother.path(source):
+                fragment = fragment[index]
+            subtree = expected
+            path = gptree.path(position)
+            for index in path[:-1]:
+                subtree = subtree[index]
+            subtree[path[-1]] = copy.deepcopy(fragment)
+
+            self.assertEqual(result.to_list(), expected)
+            rebuilt = GPTree.from_list(expected, self._symbols)
+            self.assertEqual(result, rebuilt)
+            self.assertTrue((result.depths == rebuilt.depths).all())
+            self.assertTrue((result.parents == rebuilt.parents).all())
+
+    def test_hash_and_pickle(self):
+        """Equal trees have the same hash and survive pickling"""
+        for tree in self._trees:
+            gptree = GPTree.from_list(tree, self._symbols)
+            same = GPTree.from_list(copy.deepcopy(tree), self._symbols)
+            self.assertEqual(gptree, same)
+            self.assertEqual(hash(gptree), hash(same))
+
+            restored = cPickle.loads(cPickle.dumps(gptree, -1))
+            self.assertEqual(restored.to_list(), tree)
+
+
+class TestGrammar(unittest.TestCase):
+    """
+    Compare the compiled grammar with the tree rules.
+    """
+
+    def test_deterministic_ids(self):
+        """The same rules always give the same ids"""
+        grammar1 = Grammar(treeRules)
+        grammar2 = Grammar(copy.deepcopy(treeRules))
+        self.assertEqual(grammar1.get_nodes(), grammar2.get_nodes())
+
+        restored = cPickle.loads(cPickle.dumps(grammar1, -1))
+        self.assertEqual(grammar1.get_nodes(), restored.get_nodes())
+
+    def test_tables(self):
+        """The tables give the nodes of the rules"""
+        grammar = Grammar(treeRules, [(0,1,'root')])
+        self.assertEqual(grammar.get_id((0,1,'root')), 0)
+
+        for symbol in xrange(len(grammar)):
+            node = grammar.node(symbol)
+            self.assertEqual(grammar.types[symbol], node[0])
+            self.assertEqual(grammar.arities[symbol], node[1])
+            self.assertEqual(grammar.names[symbol], node[2])
+
+            slots = treeRules.get(node[2], [])
+            self.assertEqual(grammar.nb_slots(symbol), len(slots))
+            for slot, (functions, terminals) in enumerate(slots):
+                self.assertEqual([grammar.node(child) for child in grammar.get_functions(symbol, slot)],
+                                 functions)
+                self.assertEqual([grammar.node(child) for child in grammar.get_terminals(symbol, slot)],
+                                 terminals)
+                for child in functions + terminals:
+                    self.assertTrue(grammar.is_allowed(symbol, slot, grammar.get_id(child)))
+            self.assertFalse(grammar.is_allowed(symbol, len(slots), 0))
+
+    def test_rules_modified_in_place(self):
+        """The rules modified in place are compiled again by set_tree_rules"""
+        rules = copy.deepcopy(treeRules)
+        builder = buildtree.BuildTree(rules)
+        square = builder.get_grammar().get_id((1,1,'^2'))
+        self.assertEqual(len(builder.get_grammar().get_functions(square, 0)), 7)
+
+        rules['^2'] = [([], [(3,0,'x')])]
+        builder.set_tree_rules(rules)
+        grammar = builder.get_grammar()
+        self.assertEqual(len(grammar.get_functions(grammar.get_id((1,1,'^2')), 0)), 0)
+
+    def test_encoding(self):
+        """Trees are encoded with the ids of the grammar"""
+        grammar = compile_rules(treeRules)
+        # the same rules give the same ids
+        self.assertEqual(compile_rules(treeRules).names, grammar.names)
+
+        builder = buildtree.BuildTree(treeRules)
+        for i in xrange(20):
+            tree = canonical(builder.AddHalfNode((0,1,'root'), 0, 2, 8))
+            gptree = grammar.encode(tree)
+            self.assertTrue(gptree.symbols is grammar)
+            self.assertEqual(grammar.decode(gptree), tree)
+
+
+def canonical(tree):
+    """Returns the tree where the nodes alone in a list are not in a list anymore"""
+    if type(tree) is list and len(tree) == 1:
+        return tree[0]
+    elif type(tree) is list:
+        return [tree[0]] + [canonical(elem) for elem in tree[1:]]
+    return tree
+
+
+def treeLeaves(tree):
+    """Returns the leaves of the tree (nodes which are not at the head of a list)"""
+    for elem in tree[1:]:
+        if type(elem) is list:
+            for leaf in treeLeaves(elem):
+                yield leaf
+        else:
+            yield elem
+
+
+if __name__ == "__main__":
+    unittest.main()
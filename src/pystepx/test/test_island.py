@@ -7,10 +7,21 @@
 
 # imports
 import unittest
-import subprocess
+import os
+import json
 import time
+import Queue
+import multiprocessing
+import sqlite3 as sqlite
 
-from pystepx.island.pystepislands import PySTEPXIsland
+from pystepx.island.pystepislands import PySTEPXIsland, MigrationOperator, \
+        MultiprocessingBackend, ScheduledMultiprocessingBackend, IslandCommand, IslandReply, IslandError
+from pystepx.island import migrants
+from pystepx.island import topology
+from pystepx.island import sharedmemory
+from pystepx.tree import buildtree
+from pystepx.geneticoperators import crossutil
+from pystepx.test.test_gptree import treeRules
 import pystepx.tutorials.functions_tutorial_island 
 
 import logging
@@ -19,58 +30,541 @@ import logging
 logging.basicConfig(level=logging.INFO)
 
 # code
-init_script = """from pystepx.tutorials.functions_tutorial_island import *;"""
+init_script = """from pystepx.tutorials.functions_tutorial_island import *;gp_engine = build_engine();"""
+# evolution of 5 generations
+short_script = """from pystepx.tutorials.functions_tutorial_island import *;gp_engine = build_engine(5, -1.0);"""
+# engine built once by process (refused by the scheduled backend)
+shared_script = """import pystepx.tutorials.functions_tutorial_island as tutorial;tutorial.gp_engine = getattr(tutorial, 'gp_engine', None) or tutorial.build_engine();gp_engine = tutorial.gp_engine;"""
+db_path = '/tmp/pySTEPX_test_island%d.sqlite'
 
-class TestPystepIsland(unittest.TestCase):
+class TestMigrants(unittest.TestCase):
+    """The binary payloads give back the migrants."""
+
+    def test_encode_decode(self):
+        """The trees and the fitnesses are kept, the mappings are computed again"""
+        builder = buildtree.BuildTree(treeRules)
+        trees = [builder.AddHalfNode((0,1,'root'), 0, 2, 8) for i in xrange(20)]
+        fitnesses = [float(i) / 3 for i in xrange(20)]
+
+        payload = migrants.encode_migrants(trees, fitnesses)
+        self.assertEqual(migrants.count_migrants(payload), 20)
+        decoded = migrants.decode_migrants(payload)
+        self.assertEqual(len(decoded), 20)
+        for tree, fitness, migrant in zip(trees, fitnesses, decoded):
+            mapping = crossutil.GetIndicesMappingFromTree(tree)
+            self.assertEqual(migrant, (tree, mapping,
+                                       crossutil.GetDepthFromIndicesMapping(mapping),
+                                       1, fitness))
+
+        self.assertEqual(migrants.decode_migrants(migrants.encode_migrants([], [])), [])
+
+    def test_fingerprints(self):
+        """The fingerprints of the source island go with the migrants"""
+        builder = buildtree.BuildTree(treeRules)
+        trees = [builder.AddHalfNode((0,1,'root'), 0, 2, 8) for i in xrange(20)]
+        fingerprints = [crossutil.GetTreeFingerprint(tree) for tree in trees]
+        self.assertEqual(fingerprints[0], crossutil.GetTreeFingerprint(str(trees[0])))
+        self.assertEqual(len(set(fingerprints)), len(set(map(str, trees))))
+
+        payload = migrants.encode_migrants(trees[:5], [0.0]*5, fingerprints, 3)
+        self.assertEqual(migrants.decode_fingerprints(payload), (3, fingerprints))
+        self.assertEqual([migrant[0] for migrant in migrants.decode_migrants(payload)],
+                         trees[:5])
+        self.assertEqual(migrants.decode_fingerprints(migrants.encode_migrants(trees, [0.0]*20)),
+                         (-1, []))
+
+
+class TestTopology(unittest.TestCase):
+    """The topologies give the expected destinations."""
+
+    def _check(self, topo, nb_islands, degree):
+        """Each island sends to degree islands and receives from degree islands"""
+        received = [0] * nb_islands
+        for island in range(nb_islands):
+            destinations = topo.get_destinations(island, nb_islands)
+            self.assertEqual(len(destinations), degree)
+            self.assertEqual(len(set(destinations)), degree)
+            self.assertFalse(island in destinations)
+            for destination in destinations:
+                received[destination] += 1
+        self.assertEqual(received, [degree] * nb_islands)
+
+    def test_topologies(self):
+        """Ring, torus, hypercube, random and full topologies"""
+        self.assertEqual(topology.RingTopology().get_destinations(0, 64), [1, 63])
+        self._check(topology.RingTopology(), 64, 2)
+        self._check(topology.TorusTopology(), 64, 4)
+        self._check(topology.TorusTopology(width=16), 64, 4)
+        self.assertEqual(sorted(topology.TorusTopology().get_destinations(0, 16)), [1, 3, 4, 12])
+        self._check(topology.HypercubeTopology(), 64, 6)
+        self.assertEqual(topology.HypercubeTopology().get_destinations(5, 8), [4, 7, 1])
+        self._check(topology.RandomRegularTopology(4, seed=1), 64, 4)
+        self._check(topology.FullTopology(), 16, 15)
+
+    def test_random_graph_is_kept(self):
+        """The random graph does not change during the evolution"""
+        topo = topology.RandomRegularTopology(3)
+        self.assertEqual(topo.get_destinations(7, 64), topo.get_destinations(7, 64))
+
+    def test_large_random_graph(self):
+        """The random graph of high degree is drawn quickly"""
+        start = time.time()
+        for degree in (16, 32, 63):
+            self._check(topology.RandomRegularTopology(degree, seed=2), 64, degree)
+        self._check(topology.RandomRegularTopology(16, seed=3), 256, 16)
+        self.assertTrue(time.time() - start < 10)
+        # the graphs of two seeds differ
+        self.assertNotEqual(topology.RandomRegularTopology(16, seed=1).get_destinations(0, 64),
+                            topology.RandomRegularTopology(16, seed=2).get_destinations(0, 64))
+
+
+def _put_payloads(mailbox, payloads):
+    """Write payloads in a mailbox from another process"""
+    for payload in payloads:
+        mailbox.put(payload)
+
+
+class TestSharedMemory(unittest.TestCase):
+    """The shared memory transmits the payloads and the statistics."""
 
-    def __init__(self, a):
-        """Start the processes."""
-        super(TestPystepIsland, self).__init__(a)
+    def test_ring_buffer(self):
+        """The payloads are read in order, across the end of the buffer"""
+        mailbox = sharedmemory.SharedRingBuffer(64)
+        self.assertTrue(mailbox.empty())
+        self.assertRaises(Queue.Empty, mailbox.get_nowait)
+        for i in xrange(20):
+            payload = chr(65 + i) * (i % 7 + 10)
+            self.assertTrue(mailbox.put(payload))
+            self.assertTrue(mailbox.put(payload[::-1] + 'z'))
+            self.assertEqual(mailbox.get_nowait(), payload)
+            self.assertEqual(mailbox.get_nowait(), payload[::-1] + 'z')
+        self.assertTrue(mailbox.empty())
 
+    def test_full_buffer(self):
+        """The payloads are dropped when the buffer is full"""
+        mailbox = sharedmemory.SharedRingBuffer(64)
+        self.assertTrue(mailbox.put('a' * 40))
+        self.assertFalse(mailbox.put('b' * 40))
+        self.assertFalse(mailbox.put('c' * 100))
+        self.assertEqual(mailbox.get_dropped(), 2)
+        self.assertEqual(mailbox.get_nowait(), 'a' * 40)
+        self.assertRaises(Queue.Empty, mailbox.get_nowait)
+
+    def test_other_process(self):
+        """The payloads written by another process are read"""
+        mailbox = sharedmemory.SharedRingBuffer(1 << 12)
+        payloads = [str(i) * i for i in xrange(1, 50)]
+        process = multiprocessing.Process(target=_put_payloads, args=(mailbox, payloads))
+        process.start()
+        process.join()
+        self.assertEqual([mailbox.get_nowait() for payload in payloads], payloads)
+
+    def test_statistics(self):
+        """Each island has its own statistics"""
+        statistics = sharedmemory.SharedStatistics(3)
+        self.assertEqual([elem[0] for elem in statistics.read()], [-1, -1, -1])
+        statistics.publish(1, 4, 0.5, 2.0)
+        self.assertEqual(statistics.read()[1], (4, 0.5, 2.0))
+        self.assertEqual(statistics.read()[2][0], -1)
+
+
+class TestPystepIsland(unittest.TestCase):
+    """The islands are run by local processes (no IPython cluster needed)."""
 
     def setUp(self):
-        """Initilize each thing."""
-        return
-        print 'Launch 4 clusters'
-        subprocess.Popen("ipcluster start --n=4", shell=True, stdout=subprocess.PIPE)
-        time.sleep(6)
+        """Launch 4 islands."""
+        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script,
+                                      db_path=db_path)
+        self._backend = self._pystepx.get_backend()
 
     def tearDown(self):
-        print 'Close 4 clusters'
-        return
-        subprocess.Popen("ipcluster stop", shell=True, stdout=subprocess.PIPE)
-        time.sleep(3)
+        """Stop the islands."""
+        self._backend.close()
+
+    def _start(self):
+        """Configure the islands and build their first population"""
+        self._pystepx.__parametrize__()
+        self._backend.broadcast('start')
+        self._backend.broadcast('next_generation')
 
     def test_initialisation(self):
         """Test if we create correctly the objects"""
-        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script)
         self._pystepx.__parametrize__()
 
         # Test if functions are equal
         f1 = pystepx.tutorials.functions_tutorial_island.treeRules
-        for f2 in self._pystepx._rc[:]['treeRules']:
+        for f2 in self._backend.broadcast('get_variable', 'treeRules'):
             self.assertEqual(f1, f2)
 
-    def test_population_movements_without_compilation(self):
-        """Verify if we are able to move population while not compiling objects"""
-        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script)
-        self._pystepx._rc[0].execute('elems = gp_engine.get_evolver().select_and_remove_individuals(0.01, False)',
-                                    block=True)
-        print self._pystepx._rc[0]['elems']
-
-    def test_population_movements_with_compilation(self):
-        """Verify if we are able to move population while compiling objects"""
-        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script)
-        print self._pystepx._rc[0]['gp_engine']
-        self._pystepx._rc[0].execute('elems =  gp_engine.get_evolver().select_and_remove_individuals(0.01)',
-                                    block=True)
-        print self._pystepx._rc[0]['elems']
+    def test_messages(self):
+        """The commands and their replies are typed, the errors are raised"""
+        self.assertEqual(IslandCommand('start', ()).name, 'start')
+        self.assertEqual(IslandReply(1, None).value, 1)
+        self.assertRaises(IslandError, self._backend.call, 0, 'get_variable', 'treeRules')
+
+    def test_population_movements(self):
+        """Verify if we are able to move population between islands"""
+        self._start()
+        payload, nb = self._backend.call(0, 'select_and_remove_individuals', 0.01)
+        self.assertEqual(migrants.count_migrants(payload), nb)
+        self.assertEqual(self._backend.call(0, 'get_real_popsize'), 50 - nb)
+
+        self.assertEqual(self._backend.call(1, 'add_new_trees', [payload, payload]), 2*nb)
+        self.assertEqual(self._backend.call(1, 'get_real_popsize'), 50 + 2*nb)
+
+        statistics = self._backend.call(0, 'get_migration_statistics')
+        self.assertEqual(statistics['emigrants'], nb)
+        self.assertEqual(statistics['bytes_sent'], len(payload))
+        self.assertEqual(self._backend.call(1, 'get_migration_statistics')['immigrants'], 2*nb)
+
+    def test_migration(self):
+        """The migration operator keeps the size of each island"""
+        self._start()
+        operator = MigrationOperator()
+        operator.set_backend(self._backend)
+        operator.set_nb_islands(4)
+        operator.set_migration_probability(0.1)
+        operator.manage_migration()
+        self.assertEqual(operator._popsizes, [50]*4)
+        statistics = operator.get_statistics()
+        self.assertEqual(statistics['migrants'], 4*2*5)
+        self.assertTrue(statistics['bytes_per_migrant'] > 0)
+
+    def test_migration_policies(self):
+        """Each policy and topology keeps the size of each island"""
+        self._start()
+        operator = MigrationOperator()
+        operator.set_backend(self._backend)
+        operator.set_nb_islands(4)
+        operator.set_migration_probability(0.1)
+        operator.set_migration_interval(2)
+        operator.set_topology(topology.FullTopology())
+        for emigrant, replacement in (('best', 'worst'), ('random', 'random'),
+                                      ('tournament', 'random')):
+            operator.set_emigrant_policy(emigrant)
+            operator.set_replacement_policy(replacement)
+            operator.manage_migration()
+            operator.manage_migration()
+            self.assertEqual(operator._popsizes, [50]*4)
+        # one migration each two generations
+        self.assertEqual(operator.get_statistics()['migrants'], 3*4*3*5)
+
+        # the tournaments of the emigrants are configured by the operator
+        operator.set_emigrant_tournament(3, 1.0)
+        self.assertEqual(operator.get_island_settings(0)['tournament'], (3, 1.0))
+        operator.manage_migration()
+        operator.manage_migration()
+        self.assertEqual(operator._popsizes, [50]*4)
+        payloads = self._backend.call(0, 'select_emigrants', 0.1, 'tournament', [1], (1, 1.0))
+        self.assertEqual(migrants.count_migrants(payloads[0]), 5)
+
+    def test_replace_worst(self):
+        """The immigrants replace the worst individuals"""
+        self._start()
+        payloads = self._backend.call(0, 'select_emigrants', 0.1, 'best', [1])
+        self.assertEqual(self._backend.call(0, 'get_real_popsize'), 50)
+        self.assertEqual(self._backend.call(1, 'replace_with_immigrants', payloads, 'worst'), 5)
+        self.assertEqual(self._backend.call(1, 'get_real_popsize'), 50)
+
+        best = migrants.decode_migrants(payloads[0])[0][4]
+        self.assertTrue(self._backend.call(1, 'get_best_individual')[1] <= best)
+
+        # more immigrants than individuals: only the best ones are kept
+        self.assertEqual(self._backend.call(1, 'replace_with_immigrants', payloads*11, 'worst'), 50)
+        self.assertEqual(self._backend.call(1, 'get_real_popsize'), 50)
 
     def test_evolution(self):
         """Test if we are able to evolve"""
-        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script)
+        bests = self._pystepx.evolve()
+        self.assertEqual(len(bests), 4)
+        idle_times = self._pystepx.get_idle_times()
+        self.assertEqual(len(idle_times), 4)
+        self.assertTrue(min(idle_times) >= 0)
+
+    def test_asynchronous_evolution(self):
+        """The islands evolve without waiting for each other and exchange migrants"""
+        self._pystepx.set_asynchronous(True)
+        operator = MigrationOperator()
+        operator.set_topology(topology.HypercubeTopology())
+        operator.set_emigrant_policy('best')
+        self._pystepx.set_migration_operator(operator)
+        bests = self._pystepx.evolve()
+        self.assertEqual(len(bests), 4)
+        self.assertEqual(len(self._pystepx.get_idle_times()), 4)
+        self.assertTrue(min(self._pystepx.get_idle_times()) >= 0)
+
+    def test_asynchronous_stop(self):
+        """The first island whose evolution is ended stops the other ones"""
+        self._backend.close()
+        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=short_script,
+                                      db_path=db_path)
+        operator = MigrationOperator()
+        self._pystepx.set_migration_operator(operator)
+        self._backend = self._pystepx.get_backend()
+        self._pystepx.__parametrize__()
+
+        # another island has ended its evolution
+        self._backend.stop_event.set()
+        best, nb_generations = self._backend.call(0, 'evolve_asynchronously', 0,
+                                                  operator.get_island_settings(0))
+        self.assertEqual(nb_generations, 1)
+
+        # the island which ends its evolution stops the other ones
+        self._backend.stop_event.clear()
+        best, nb_generations = self._backend.call(1, 'evolve_asynchronously', 1,
+                                                  operator.get_island_settings(1))
+        self.assertEqual(nb_generations, 5)
+        self.assertTrue(self._backend.stop_event.is_set())
+
+    def test_statistics_stream(self):
+        """The statistics of each generation of each island are written in one file"""
+        self._backend.close()
+        for asynchronous, path in ((False, '/tmp/pySTEPX_test_statistics.jsonl'),
+                                   (True, '/tmp/pySTEPX_test_statistics.sqlite')):
+            if os.path.exists(path):
+                os.remove(path)
+            self._pystepx = PySTEPXIsland(nb_islands=4, init_script=short_script,
+                                          db_path=db_path)
+            self._backend = self._pystepx.get_backend()
+            self._pystepx.set_asynchronous(asynchronous)
+            self._pystepx.set_statistics_path(path)
+            bests = self._pystepx.evolve()
+
+            if asynchronous:
+                con = sqlite.connect(path)
+                cur = con.execute("SELECT * FROM generations")
+                fields = [elem[0] for elem in cur.description]
+                records = [dict(zip(fields, row)) for row in cur.fetchall()]
+                con.close()
+            else:
+                records = [json.loads(line) for line in open(path)]
+            os.remove(path)
+
+            self.assertEqual(sorted([(record['island'], record['generation']) \
+                                        for record in records]),
+                             [(island, generation) for island in range(4) \
+                                for generation in range(5)])
+            for record in records:
+                self.assertTrue(record['best'] <= record['mean'])
+                self.assertTrue(record['std'] >= 0)
+                self.assertTrue(record['size'] >= 1 and record['depth'] >= 1)
+                self.assertTrue(0 < record['unique_ratio'] <= 1)
+                self.assertTrue(record['time_generation'] > 0)
+                if record['generation'] > 0:
+                    self.assertTrue(record['evaluations'] > 0)
+            # the last record of each island has the fitness of its best
+            for island in range(4):
+                last = [record for record in records \
+                            if record['island'] == island and record['generation'] == 4][0]
+                self.assertAlmostEqual(last['best'], bests[island][1], 5)
+
+    def test_duplicate_suppression(self):
+        """The islands reject the immigrants they have and do not send the trees known by the destination"""
+        self._pystepx.set_duplicate_suppression(True)
+        self._start()
+        payloads = self._backend.call(0, 'select_emigrants', 0.1, 'best', [1])
+        source, population = migrants.decode_fingerprints(payloads[0])
+        self.assertEqual((source, len(population)), (0, 50))
+
+        # the best trees may be there twice
+        accepted = self._backend.call(1, 'replace_with_immigrants', payloads, 'worst')
+        self.assertTrue(0 < accepted <= 5)
+        # the same immigrants again
+        self.assertEqual(self._backend.call(1, 'replace_with_immigrants', payloads, 'worst'), 0)
+        self.assertEqual(self._backend.call(1, 'get_real_popsize'), 50)
+        self.assertEqual(
+            self._backend.call(1, 'get_migration_statistics')['immigrants_rejected'],
+            10 - accepted)
+
+        # the whole population of island 1 is selected for island 0
+        payloads = self._backend.call(1, 'select_emigrants', 1.0, 'best', [0, 2])
+        sent = [crossutil.GetTreeFingerprint(migrant[0]) \
+                    for migrant in migrants.decode_migrants(payloads[0])]
+        self.assertFalse(set(sent) & set(population))
+        self.assertEqual(migrants.count_migrants(payloads[1]), 50)
+        self.assertEqual(
+            self._backend.call(1, 'get_migration_statistics')['emigrants_filtered'],
+            50 - len(sent))
+
+        self._backend.broadcast('next_generation')
+        bests = self._pystepx.evolve()
+        self.assertEqual(len(bests), 4)
+        self.assertTrue('immigrants_rejected' in self._pystepx.get_migration_statistics())
+
+    def test_scheduled_duplicate_suppression(self):
+        """The fingerprints of the duplicate suppression are kept when the islands move"""
+        self._backend.close()
+        self._backend = ScheduledMultiprocessingBackend(nb_workers=2)
+        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script, db_path=db_path,
+                                      backend=self._backend)
+        self._pystepx.set_duplicate_suppression(True)
+        self._start()
+        payloads = self._backend.call(0, 'select_emigrants', 0.1, 'best', [1])
+        source, population = migrants.decode_fingerprints(payloads[0])
+        self.assertTrue(self._backend.call(1, 'replace_with_immigrants', payloads, 'worst') > 0)
+        fingerprints = self._backend.call(1, 'get_duplicate_state')
+        self.assertEqual(fingerprints[0].keys(), [0])
+        self.assertEqual(len(fingerprints[1]), 1)
+
+        # island 1 moves to the other process
+        rebuilds = self._backend.get_rebuilds()
+        self._backend._holders[1] = 1 - self._backend._holders[1]
+        self.assertEqual(self._backend.call(1, 'get_duplicate_state'), fingerprints)
+        self.assertEqual(self._backend.get_rebuilds(), rebuilds + 1)
+
+        # the trees known by island 0 are still not sent to it
+        payloads = self._backend.call(1, 'select_emigrants', 1.0, 'best', [0])
+        sent = [crossutil.GetTreeFingerprint(migrant[0]) \
+                    for migrant in migrants.decode_migrants(payloads[0])]
+        self.assertFalse(set(sent) & set(population))
+        self.assertEqual(
+            self._backend.call(1, 'get_migration_statistics')['emigrants_filtered'],
+            50 - len(sent))
+
+    def test_shared_memory_evolution(self):
+        """The islands exchange their migrants and statistics in shared memory"""
+        self._backend.close()
+        for asynchronous in (False, True):
+            self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script,
+                    db_path=db_path,
+                    backend=MultiprocessingBackend(shared_memory=True))
+            self._pystepx.set_asynchronous(asynchronous)
+            self._pystepx.set_monitoring_interval(0.05)
+            self._backend = self._pystepx.get_backend()
+
+            bests = self._pystepx.evolve()
+            self.assertEqual(len(bests), 4)
+            self.assertTrue(self._pystepx.get_migration_statistics()['immigrants'] > 0)
+            for island, (generation, best, mean) in enumerate(self._backend.statistics.read()):
+                self.assertTrue(generation > 0)
+                self.assertEqual(best, bests[island][1])
+                self.assertTrue(mean >= best)
+
+    def test_full_mailboxes(self):
+        """The payloads refused by the full mailboxes are sent through the manager or not counted"""
+        self._backend.close()
+        for asynchronous in (False, True):
+            self._pystepx = PySTEPXIsland(nb_islands=4, init_script=short_script,
+                    db_path=db_path,
+                    backend=MultiprocessingBackend(shared_memory=True, buffer_size=64))
+            operator = MigrationOperator()
+            self._pystepx.set_migration_operator(operator)
+            self._pystepx.set_asynchronous(asynchronous)
+            self._backend = self._pystepx.get_backend()
+            self._pystepx.evolve()
+
+            statistics = self._pystepx.get_migration_statistics()
+            if asynchronous:
+                # all the payloads are dropped
+                self.assertTrue(statistics['payloads_dropped'] > 0)
+                self.assertEqual((statistics['emigrants'], statistics['immigrants']), (0, 0))
+            else:
+                self.assertEqual(statistics['payloads_dropped'], 0)
+                self.assertTrue(statistics['immigrants'] > 0)
+                self.assertEqual(statistics['emigrants'],
+                        operator.get_statistics()['migrants'])
+            self._backend.close()
+
+    def test_checkpoint_and_resume(self):
+        """The islands restart from the last complete checkpoint"""
+        self._backend.close()
+        # 5 generations, without early end
+        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=short_script, db_path=db_path)
+        self._pystepx.set_checkpoint_interval(1)
         self._pystepx.evolve()
 
+        # the last generation has been computed after the last checkpoint,
+        # as if the evolution had been interrupted
+        con = sqlite.connect(db_path % 0)
+        self.assertEqual(con.execute("SELECT epoch, generation FROM epochs").fetchall(),
+                         [(4, 3)])
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM inflight").fetchone()[0], 4*2)
+        con.close()
+
+        resumed = PySTEPXIsland(nb_islands=4, init_script=short_script, db_path=db_path)
+        self._backend = resumed.get_backend()
+        resumed.set_resume(True)
+        resumed.__parametrize__()
+        self.assertEqual(resumed._restore(), (4, 3))
+        for island in range(4):
+            self.assertEqual(self._popTables(island), range(4))
+            self.assertEqual(self._backend.call(island, 'get_real_popsize'), 50)
+
+        # the evolution continues after the checkpoint
+        self._backend.broadcast('next_generation')
+        self.assertTrue(all(self._backend.broadcast('is_evolution_ended')))
+        for island in range(4):
+            self.assertEqual(self._popTables(island), range(5))
+
+    def test_scheduled_islands(self):
+        """More islands than processes: the islands move between the processes"""
+        self._backend.close()
+        self._backend = ScheduledMultiprocessingBackend(nb_workers=2)
+        self._pystepx = PySTEPXIsland(nb_islands=4, init_script=short_script, db_path=db_path,
+                                      backend=self._backend)
+        self._pystepx.__parametrize__()
+        self._backend.broadcast('start')
+        self._backend.broadcast('next_generation')
+
+        # the islands stay in their process (the processes hold the same
+        # number of islands, so no island is moved)
+        rebuilds = self._backend.get_rebuilds()
+        self.assertEqual(self._backend.broadcast('get_generation'), [0]*4)
+        self.assertEqual(self._backend.get_rebuilds(), rebuilds)
+
+        # the islands move to the other process: they are built again
+        # from their state
+        for i in range(2):
+            self._backend._holders = [1 - holder for holder in self._backend._holders]
+            self.assertEqual(self._backend.broadcast('get_generation'), [i]*4)
+            self.assertEqual(self._backend.get_rebuilds(), rebuilds + 4)
+            self.assertEqual(self._backend.broadcast('get_real_popsize'), [50]*4)
+            self._backend._holders = [1 - holder for holder in self._backend._holders]
+            self._backend.broadcast('next_generation')
+            self.assertEqual(self._backend.get_rebuilds(), rebuilds + 8)
+            rebuilds += 8
+        for island in range(4):
+            self.assertEqual(self._popTables(island), range(3))
+
+        # each island has its own random generators
+        states = [state.numpy_state[1].tolist() for state in self._backend._states]
+        self.assertEqual(len(set(map(tuple, states))), 4)
+
+        bests = self._pystepx.evolve()
+        self.assertEqual(len(bests), 4)
+        self.assertEqual(len(self._pystepx.get_idle_times()), 4)
+        self.assertEqual(self._backend.get_rebuilds(), rebuilds)
+        for island in range(4):
+            self.assertEqual(self._popTables(island), range(5))
+
+    def test_scheduled_shared_engine(self):
+        """An engine shared by the islands of a process is refused"""
+        self._backend.close()
+        self._backend = ScheduledMultiprocessingBackend(nb_workers=1)
+        self._pystepx = PySTEPXIsland(nb_islands=2, init_script=shared_script,
+                                      db_path=db_path, backend=self._backend)
+        self.assertRaises(IslandError, self._pystepx.__parametrize__)
+
+    def _popTables(self, island):
+        """Returns the numbers of the population tables of an island"""
+        con = sqlite.connect(db_path % (island + 1))
+        names = con.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'pop%'").fetchall()
+        con.close()
+        return sorted([int(name[3:]) for name, in names])
+
+    def test_mailboxes(self):
+        """The immigrants posted in a mailbox are absorbed by the island"""
+        self._start()
+        payload, nb = self._backend.call(0, 'select_and_remove_individuals', 0.1)
+        self._backend.mailboxes[1].put(payload)
+        # let the feeder thread send the immigrants
+        while self._backend.mailboxes[1].empty():
+            time.sleep(0.01)
+        self.assertEqual(self._backend.call(1, 'absorb_immigrants', 1), 1)
+        self.assertEqual(self._backend.call(1, 'get_real_popsize'), 50)
+        self.assertEqual(self._backend.call(1, 'absorb_immigrants', 1), 0)
+
 if __name__ == '__main__':
     unittest.main()
 
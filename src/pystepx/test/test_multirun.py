@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the batch of independent runs.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+import os
+import sqlite3 as sqlite
+
+import numpy as np
+
+import pystepx.pySTEPX as pySTEPX
+import pystepx.evolver as evolver
+from pystepx import multirun
+from pystepx.fitness import evalfitness
+from pystepx.tutorials.functions_tutorial_island import functions, treeRules
+
+
+STATS = '/tmp/pySTEPX_test_runs.sqlite'
+DB = '/tmp/pySTEPX_test_run%d.sqlite'
+
+
+def build_engine(seed):
+    """Configuration factory of the runs: the fitness cases are shared"""
+    all_x = multirun.get_shared_data('x')
+    ideal_results = multirun.get_shared_data('y')
+    terminals = {'x': all_x}
+
+    gp_engine = pySTEPX.PySTEPX()
+    gp_engine.set_evolver(evolver.Evolver(popsize=30, max_nb_runs=4,
+                                          crossover_prob=0.25, mutation_prob=0.25))
+    gp_engine.set_tree_rules(treeRules)
+    gp_engine.set_functions(functions)
+    gp_engine.set_terminals(terminals)
+
+    fte = evalfitness.FitnessTreeEvaluation()
+    fte.set_terminals(terminals)
+    fte.set_functions(functions)
+    fte.check_configuration()
+    ffe = evalfitness.FinalFitness(ideal_results, len(all_x))
+    def FitnessFunction(my_tree):
+        return ffe.FinalFitness(
+            fte.EvalTreeForAllInputSets(my_tree, xrange(len(all_x))))
+    gp_engine.set_fitness_function(FitnessFunction)
+    return gp_engine
+
+
+def failing_engine(seed):
+    """Configuration factory which fails"""
+    raise ValueError('No engine for the seed %d' % seed)
+
+
+def failing_fitness_engine(seed):
+    """Configuration factory whose fitness function fails during the run"""
+    gp_engine = build_engine(seed)
+    def FitnessFunction(my_tree):
+        raise ValueError('No fitness for the seed %d' % seed)
+    gp_engine.set_fitness_function(FitnessFunction)
+    return gp_engine
+
+
+class TestMultiRun(unittest.TestCase):
+    """
+    Execute small batches of runs.
+    """
+
+    def setUp(self):
+        if os.path.exists(STATS):
+            os.remove(STATS)
+
+    def tearDown(self):
+        if os.path.exists(STATS):
+            os.remove(STATS)
+
+    def _executor(self, factory, seeds):
+        executor = multirun.MultiRunExecutor(factory, seeds, processes=2,
+                                             stats_path=STATS, db_path=DB)
+        all_x = np.linspace(0.5, 5, 4)
+        executor.set_shared_data(x=all_x,
+                                 y=[[x**3 + x**2 + np.cos(x)] for x in all_x])
+        return executor
+
+    def test_runs(self):
+        """The runs are written in one database and summarized"""
+        executor = self._executor(build_engine, [1, 2, 1])
+        summary = executor.run()
+        self.assertEqual(summary['runs'], 3)
+        self.assertEqual(summary['errors'], 0)
+        self.assertTrue(0 <= summary['success_rate'] <= 1)
+        self.assertTrue(summary['cpu_time'] > 0)
+
+        results = executor.get_results()
+        self.assertEqual([result['seed'] for result in results], [1, 2, 1])
+        # the runs of the same seed are identical
+        self.assertEqual(results[0]['best_fitness'], results[2]['best_fitness'])
+        self.assertEqual(results[0]['best_tree'], results[2]['best_tree'])
+        for run in range(3):
+            self.assertFalse(os.path.exists(DB % run))
+
+        con = sqlite.connect(STATS)
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM runs").fetchone()[0], 3)
+        for result in results:
+            generations = con.execute(
+                    "SELECT generation, best FROM generations WHERE run=? ORDER BY generation",
+                    (result['run'],)).fetchall()
+            self.assertEqual([elem[0] for elem in generations],
+                             range(result['generations'] + 1))
+            self.assertEqual(generations[-1][1], result['best_fitness'])
+        con.close()
+
+    def test_errors(self):
+        """A failing run is recorded and does not stop the batch"""
+        executor = self._executor(failing_engine, [1, 2])
+        summary = executor.run()
+        self.assertEqual((summary['runs'], summary['errors']), (2, 2))
+        self.assertEqual(summary['generations_to_solution'], None)
+        for result in executor.get_results():
+            self.assertTrue('ValueError' in result['error'])
+
+    def test_cleanup_after_error(self):
+        """The database of a run which fails is removed"""
+        executor = self._executor(failing_fitness_engine, [1, 2])
+        summary = executor.run()
+        self.assertEqual(summary['errors'], 2)
+        for result in executor.get_results():
+            self.assertTrue('No fitness' in result['error'])
+            self.assertFalse(os.path.exists(DB % result['run']))
+
+
+if __name__ == "__main__":
+    unittest.main()
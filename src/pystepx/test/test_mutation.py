@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the mutation operators.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+import copy
+
+from pystepx.tree import buildtree
+from pystepx.tree.gptree import GPTree
+from pystepx.geneticoperators.mutationoperator import Mutator
+from pystepx.geneticoperators import crossutil
+from pystepx.test.test_gptree import treeRules
+from pystepx.test.test_buildtree import sparseRules, checkRules, treeDepth
+
+
+class TestMutations(unittest.TestCase):
+    """
+    Check the trees given by each kind of mutation.
+    """
+
+    def _mutate(self, rules, maxdepth, maxsize=0, **probabilities):
+        """Yields (parent, result of the mutation) for random parents"""
+        mutator = Mutator()
+        mutator.set_tree_rules(rules)
+        mutator.set_mutation_probabilities(**probabilities)
+        self.mutator = mutator
+        builder = buildtree.BuildTree(rules)
+        for i in xrange(100):
+            parent = builder.AddHalfNode((0,1,'root'), 0, 2, 6)
+            saved = copy.deepcopy(parent)
+            mapping = crossutil.GetIndicesMappingFromTree(parent)
+            depth = crossutil.GetDepthFromIndicesMapping(mapping)
+
+            result = mutator.mutate(maxdepth, parent, mapping, depth, True, maxsize)
+            self.assertEqual(parent, saved)
+            checkRules(self, result[1], rules)
+            self.assertTrue(treeDepth(result[1]) <= maxdepth)
+            self.assertEqual(result[2], crossutil.GetIndicesMappingFromTree(result[1]))
+            self.assertEqual(result[3], crossutil.GetDepthFromIndicesMapping(result[2]))
+            yield parent, result
+
+    def test_subtree(self):
+        """The subtree mutation respects the rules and the max depth"""
+        for rules in (treeRules, sparseRules):
+            for parent, result in self._mutate(rules, 8):
+                pass
+            self.assertEqual(self.mutator.get_statistics()['subtree'], 100)
+
+    def test_subtree_max_size(self):
+        """The subtree mutation does not grow the tree over the max size"""
+        for rules in (treeRules, sparseRules):
+            for parent, result in self._mutate(rules, 8, 20):
+                size = crossutil.GetSizeFromIndicesMapping(result[2])
+                self.assertTrue(size <= max(20, len(GPTree.from_list(
+                        parent, self.mutator.get_grammar()))))
+
+    def test_subtree_max_size_min_expansion(self):
+        """The subtree mutation takes into account the smallest expansion of the nodes"""
+        # h needs three nodes, g two
+        rules = {'root':[([(1,1,'k')],[])],
+                 'k':[([(1,1,'g'),(1,1,'h')],[])],
+                 'g':[([],[(3,0,'x')])],
+                 'h':[([(1,1,'g')],[])]}
+        mutator = Mutator()
+        mutator.set_tree_rules(rules)
+        grammar = mutator.get_grammar()
+        self.assertEqual([grammar.min_size(grammar.get_id(node)) \
+                            for node in [(0,1,'root'), (1,1,'k'), (1,1,'g'), (1,1,'h'), (3,0,'x')]],
+                         [4, 3, 2, 3, 1])
+
+        parent = [(0,1,'root'), [(1,1,'k'), [(1,1,'g'), (3,0,'x')]]]
+        mapping = crossutil.GetIndicesMappingFromTree(parent)
+        depth = crossutil.GetDepthFromIndicesMapping(mapping)
+        for i in xrange(2000):
+            result = mutator.mutate(10, parent, mapping, depth, True, 4)
+            self.assertEqual(crossutil.GetSizeFromIndicesMapping(result[2]), 4)
+            checkRules(self, result[1], rules)
+
+    def test_point(self):
+        """The point mutation changes one node and keeps the shape of the tree"""
+        for rules in (treeRules, sparseRules):
+            done = 0
+            for parent, result in self._mutate(rules, 6, subtree=0, point=1):
+                # the subtree mutation is used when there is no legal point
+                if self.mutator.get_statistics()['point'] == done:
+                    continue
+                done += 1
+                before = GPTree.from_list(parent, self.mutator.get_grammar())
+                after = GPTree.from_list(result[1], self.mutator.get_grammar())
+                self.assertEqual(list(before.sizes), list(after.sizes))
+                self.assertEqual((before.nodes != after.nodes).sum(), 1)
+            if rules is treeRules:
+                self.assertTrue(done > 0)
+
+    def test_hoist_and_shrink(self):
+        """The hoist and shrink mutations never grow the tree"""
+        for kind in ('hoist', 'shrink'):
+            for rules in (treeRules, sparseRules):
+                done = 0
+                for parent, result in self._mutate(rules, 6, subtree=0, **{kind: 1}):
+                    if self.mutator.get_statistics()[kind] == done:
+                        continue
+                    done += 1
+                    self.assertTrue(len(GPTree.from_list(result[1], self.mutator.get_grammar()))
+                                    < len(GPTree.from_list(parent, self.mutator.get_grammar())))
+                if rules is treeRules:
+                    self.assertTrue(done > 0)
+
+    def test_probabilities(self):
+        """Each kind of mutation is chosen following its probability"""
+        for parent, result in self._mutate(treeRules, 8, subtree=1, point=1, hoist=1, shrink=1):
+            pass
+        statistics = self.mutator.get_statistics()
+        self.assertEqual(sum(statistics.values()), 100)
+        for kind in ('subtree', 'point', 'hoist', 'shrink'):
+            self.assertTrue(statistics[kind] > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
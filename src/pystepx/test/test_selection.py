@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the tournament selection and its parsimony pressure.
+
+AUTHOR Romain Giot <romain.giot@ensicaen.fr>
+"""
+
+import unittest
+
+import numpy as np
+
+from pystepx.geneticoperators import selection
+
+
+class TestTournament(unittest.TestCase):
+    """
+    Check the size of the individuals selected with parsimony pressure.
+    """
+
+    def setUp(self):
+        """Population of (o_id, fitness, size) with two fitness values"""
+        self._db_list = np.array([(o_id, o_id % 2, 1 + (o_id * 7) % 50)
+                                  for o_id in xrange(1, 101)], dtype=float)
+        self._sizes = dict((row[0], row[2]) for row in self._db_list)
+
+    def _mean_size(self, **options):
+        selected = selection.TournamentSelectDBSeveral(500, 7, 1, self._db_list, **options)
+        return np.mean([self._sizes[elem[0]] for elem in selected])
+
+    def test_lexicographic(self):
+        """The smallest tree of best fitness wins the tournament"""
+        selected = selection.TournamentSelectDBSeveral(100, 100, 1, self._db_list,
+                                                       lexicographic=True)
+        best = min([row[2] for row in self._db_list if row[1] == 0])
+        for elem in selected:
+            self.assertEqual(self._sizes[elem[0]], best)
+        self.assertTrue(self._mean_size(lexicographic=True) < self._mean_size())
+
+    def test_double_tournament(self):
+        """The double tournament prefers the small trees"""
+        self.assertTrue(self._mean_size(double_tournament=1) < self._mean_size())
+        self.assertTrue(self._mean_size(double_tournament=1)
+                        < self._mean_size(double_tournament=0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
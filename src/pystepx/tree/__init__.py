@@ -1 +1 @@
-__all__ = ['treeutil.py', 'buildtree.py', 'treeconstants.py', 'numpyfunctions.py' ]
+__all__ = ['treeutil.py', 'buildtree.py', 'treeconstants.py', 'numpyfunctions.py', 'gptree.py', 'grammar.py' ]
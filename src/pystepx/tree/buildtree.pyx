@@ -25,6 +25,14 @@ http://www.opensource.org/licenses/mit-license.html
 import random
 import logging
 
+import numpy as np
+cimport numpy as np
+cimport cython
+
+from pystepx.tree.grammar cimport Grammar
+from pystepx.tree.grammar import compile_rules
+from pystepx.tree.gptree import ID_TYPE, TreeBuffer
+
 
 # Exceptions related to tree building
 class TreeBuildingError(Exception):
@@ -41,6 +49,54 @@ class EmptyOrderedSet(TreeBuildingError):
     pass
 
 
+# Members of the index of a child slot (see BuildTree._get_slots)
+DEF LEAVES = 0
+DEF BRANCHES = 1
+DEF BRANCHES_WITH_TERMINALS = 2
+DEF BRANCHES_WITH_FUNCTIONS = 3
+DEF NB_KINDS = 4
+
+# Number of random numbers drawn at once by RandomStream
+DEF RANDOM_BLOCK = 4096
+
+ctypedef np.int32_t ID_TYPE_t
+
+
+cdef class RandomStream(object):
+    """
+    Uniform random numbers read from blocks drawn at once
+    from a numpy random generator.
+    """
+    cdef object rng
+    cdef np.ndarray values
+    cdef int position
+
+    def __init__(self, rng):
+        """
+        :param rng: a numpy.random.RandomState
+        """
+        self.rng = rng
+        self.position = RANDOM_BLOCK
+
+    @cython.boundscheck(False)
+    cdef inline double next(self):
+        """Returns a random number in [0, 1)."""
+        cdef np.ndarray[np.float64_t, ndim=1] values
+        if self.position == RANDOM_BLOCK:
+            self.values = self.rng.random_sample(RANDOM_BLOCK)
+            self.position = 0
+        values = self.values
+        self.position += 1
+        return values[self.position - 1]
+
+    cdef inline int choice(self, int count):
+        """Returns a random index in [0, count)."""
+        cdef int index = <int>(self.next() * count)
+        if index == count:
+            index = count - 1
+        return index
+
+
 # class that contains methods to build a random tree
 
 
@@ -53,21 +109,118 @@ cdef class BuildTree(object):
     """
 
     cdef dict __rules__
+    cdef Grammar __grammar__
+    cdef list __slots_index__
+
+    # Id version of the slots index (see _compile_tables)
+    cdef np.ndarray __tables_base__
+    cdef np.ndarray __tables_start__
+    cdef np.ndarray __tables_count__
+    cdef np.ndarray __tables_pool__
 
-    def __init__(self, dict rules):
+    def __init__(self, dict rules, Grammar grammar=None):
         """Initialize various objects"""
-        self.set_tree_rules(rules)
+        self.set_tree_rules(rules, grammar)
 
-    def set_tree_rules(self, dict rules):
+    def set_tree_rules(self, dict rules, Grammar grammar=None):
         """
         Method:: set_tree_rules
         =======================
 
         Set the tree rules.
+
+        @param grammar: compiled version of the rules, when the caller has
+        already compiled them (see pystepx.tree.grammar.compile_rules)
         """
         self.__rules__ = rules
+        self.__grammar__ = grammar if grammar is not None else compile_rules(rules)
+        self.__slots_index__ = []
+        self.__tables_base__ = None
+
+    def get_grammar(self):
+        """
+        Returns the compiled version of the tree rules.
+        """
+        return self.__grammar__
 
-    cdef setRandomLeafChild(self, parent, int child_nb):
+    cdef tuple _get_slots(self, tuple parent):
+        """
+        Returns the precompiled index of the child slots of the parent node.
+
+        The index is built the first time the node is met: for each slot,
+        it is a tuple of ready to sample tuples of nodes:
+         - LEAVES: the terminal nodes allowed in the slot
+         - BRANCHES: the function nodes allowed in the slot
+         - BRANCHES_WITH_TERMINALS: the function nodes allowed in the slot
+           which accept a terminal in each of their own slots (falling back to
+           the leaves, and then to all the branches, when there is none)
+         - BRANCHES_WITH_FUNCTIONS: the function nodes allowed in the slot
+           which accept a function in each of their own slots (falling back to
+           the leaves, and then to all the branches, when there is none)
+
+        Slots which are not described by the rules are empty, so the builder
+        only raises an exception when it really needs a node for them.
+
+        @param parent: the parent node e.g. (0,2,'root')
+        @return: the tuple of the slots of the node
+        """
+        cdef int symbol = self.__grammar__.intern(parent)
+        cdef tuple slots
+
+        while symbol >= len(self.__slots_index__):
+            self.__slots_index__.append(None)
+
+        slots = self.__slots_index__[symbol]
+        if slots is None:
+            slots = self._compile_slots(symbol)
+            self.__slots_index__[symbol] = slots
+        return slots
+
+    cdef tuple _compile_slots(self, int symbol):
+        """Builds the index of the child slots of the node of id symbol."""
+        cdef Grammar grammar = self.__grammar__
+        cdef list slots = []
+        cdef tuple leaves, branches, with_terminals, with_functions
+        cdef int slot
+
+        for slot in xrange(max(grammar.nb_slots(symbol), grammar.arities[symbol])):
+            if slot >= grammar.nb_slots(symbol):
+                slots.append(((), (), (), ()))
+                continue
+
+            leaves = tuple([grammar.node(child) for child in grammar.get_terminals(symbol, slot)])
+            branches = tuple([grammar.node(child) for child in grammar.get_functions(symbol, slot)])
+            with_terminals = tuple([grammar.node(child)
+                                    for child in grammar.get_functions(symbol, slot)
+                                    if self._has_children(child, 1)])
+            with_functions = tuple([grammar.node(child)
+                                    for child in grammar.get_functions(symbol, slot)
+                                    if self._has_children(child, 0)])
+            slots.append((leaves,
+                          branches,
+                          with_terminals or leaves or branches,
+                          with_functions or leaves or branches))
+
+        return tuple(slots)
+
+    cdef bint _has_children(self, int symbol, int kind):
+        """
+        Returns True if each slot of the node accepts a node of the given kind
+        (0 for the functions, 1 for the terminals).
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef int slot
+
+        if grammar.nb_slots(symbol) < grammar.arities[symbol]:
+            return False
+        for slot in xrange(grammar.arities[symbol]):
+            if kind == 1 and not len(grammar.get_terminals(symbol, slot)):
+                return False
+            if kind == 0 and not len(grammar.get_functions(symbol, slot)):
+                return False
+        return True
+
+    cdef tuple setRandomLeafChild(self, tuple parent, tuple slot, int child_nb):
         """
         Function:  setRandomLeafChild
         =============================
@@ -75,28 +228,17 @@ cdef class BuildTree(object):
         Set the a random leaf node
 
         @param parent: the parent node (generally a root node) e.g. (0,2,'root')
+        @param slot: the index of the child slot (see _get_slots)
         @param child_nb: the child node position (0 for first, 1 for second and so on...)
         @return: the random leaf child node e.g. (3,0,'x')
         """
-        random_leaf_child = []
-        try:
-            random_leaf_child = random.choice(self.__rules__[parent[2]][child_nb][1])
-        except Exception, e:
-            logging.debug('======= Empty terminal set! This parent has no leaf node to choose from!')
-            logging.debug(str( e))
+        if not slot[LEAVES]:
             logging.debug( ''.join([ 'problem with ', str(parent), ' at child ', str(child_nb)]))
-            logging.debug( ''.join([ 'possible child', str(self.__rules__[parent[2]])]))
             logging.debug( 'Maybe a wrong rule ? Verify the number of children')
-            logging.debug( ''.join(['Child nb', str(child_nb)]))
-            logging.debug( ''.join(['Set for the child', str(self.__rules__[parent[2]][child_nb])]))
-            logging.debug( ''.join(['Leaf set for the child', str(self.__rules__[parent[2]][child_nb][1])]))
             raise NoTerminalSet, "Empty terminal set! This parent has no leaf  node to choose from!" + str(parent)
+        return random.choice(slot[LEAVES])
 
-        return random_leaf_child
-
-
-
-    cdef setRandomBranchChild(self, parent, int child_nb):
+    cdef tuple setRandomBranchChild(self, tuple parent, tuple slot, int child_nb):
         """
         Function:  setRandomBranchChild
         ===============================
@@ -104,90 +246,46 @@ cdef class BuildTree(object):
         Set the a random branch node
 
         @param parent: the parent node (generally a root node) e.g. (0,2,'root')
+        @param slot: the index of the child slot (see _get_slots)
         @param child_nb: the child node position (0 for first, 1 for second and so on...)
         @return: the random branch child node e.g. (1,2,'*')
         """
-        random_branch_child = []
-        try:
-            random_branch_child = random.choice(self.__rules__[parent[2]][child_nb][0])
-        except Exception, e:
-            logging.debug('======= Empty function set! This parent has no branch node to choose from!')
-            logging.debug(str( e))
+        if not slot[BRANCHES]:
             logging.debug( ''.join([ 'problem with ', str(parent), ' at child ', str(child_nb)]))
-            logging.debug( ''.join([ 'possible child', str(self.__rules__[parent[2]])]))
             logging.debug( 'Maybe a wrong rule ? Verify the number of children')
-            logging.debug( ''.join(['Child nb', str(child_nb)]))
-            logging.debug( ''.join(['Set for the child', str(self.__rules__[parent[2]][child_nb])]))
-            logging.debug( ''.join(['Leaf set for the child', str(self.__rules__[parent[2]][child_nb][0])]))
- 
             raise NoFunctionSet, "Empty function set! This parent has no branch node to choose from!"
+        return random.choice(slot[BRANCHES])
 
-        return random_branch_child
-
-
-
-    cdef setRandomBranchWithTerminalSet(self, list parent, int child_nb):
+    cdef tuple setRandomChild(self, tuple parent, tuple slot, int child_nb, int kind):
         """
-        Function:  setRandomBranchWithTerminalSet
-        =========================================
+        Function:  setRandomChild
+        =========================
 
-        Set an random branch child node which has terminals
+        Set a random child node of the given kind, falling back to the
+        other kinds as described in _get_slots.
 
         @param parent: the parent node (generally a root node) e.g. (0,2,'root')
+        @param slot: the index of the child slot (see _get_slots)
         @param child_nb: the child node position (0 for first, 1 for second and so on...)
-        @return: the branch child node e.g. (1,2,'*')
+        @param kind: BRANCHES_WITH_TERMINALS or BRANCHES_WITH_FUNCTIONS
+        @return: the child node e.g. (1,2,'*'), or a leaf node when no branch fits
         """
-        constraints = self.__rules__
-        if not constraints[parent[2]][child_nb][0]:
-            logging.debug('======= Empty function set! Impossible to create random branch with terminal set')
+        if not slot[kind]:
             logging.debug( ''.join([ 'problem with ', str(parent), ' at child ', str(child_nb)]))
-            logging.debug( ''.join([ 'possible child', str(self.__rules__[parent[2]])]))
             logging.debug( 'Maybe a wrong rule ? Verify the number of children')
-            logging.debug( ''.join(['Child nb', str(child_nb)]))
-            logging.debug( ''.join(['Set for the child', str(self.__rules__[parent[2]][child_nb])]))
-            logging.debug( ''.join(['Leaf set for the child', str(self.__rules__[parent[2]][child_nb][0])]))
-
-            raise NoFunctionSet, "Empty function set! Root node has no function to choose from!"
-
-        initial = constraints[parent[2]][child_nb][0]
-        try:
-            logging.debug('List to filter')
-            logging.debug(str(initial))
-
-            #filter functions (take aways those who don't have a terminal set)
-            initial2 = [ x for x in initial if constraints[x[2]][child_nb][1] ]
-            return random.choice(initial2)
-        except:
-            # if there are no functions with terminal set, use the other ones
-            logging.debug('unable to choose a function')
-            logging.debug(str(initial))
-            logging.debug(str(initial2))
-            return random.choice(self.__rules__[parent[2]][child_nb][0])
-
+            raise NoFunctionSet, "Empty function and terminal sets! This parent has no node to choose from!" + str(parent)
+        return random.choice(slot[kind])
 
-    cdef tuple setRandomBranchWithFunctionSet(self, parent, int child_nb):
+    cdef object _add_child(self, tuple node, int depth, int mindepth, int maxdepth, bint full):
         """
-        Function:  setRandomBranchWithTerminalSet
-        =========================================
-
-        Set an random branch child node which has terminals
-
-        @param parent: the parent node (generally a root node) e.g. (0,2,'root')
-        @param child_nb: the child node position (0 for first, 1 for second and so on...)
-        @return: the branch child node e.g. (1,2,'*')
+        Returns the subtree built under the node, or the node itself
+        if it is a leaf.
         """
-        constraints = self.__rules__
-        if not constraints[parent[2]][child_nb][0]:
-            raise NoFunctionSet, "Empty function set! Root node has no function to choose from!"
-
-        initial = constraints[parent[2]][child_nb][0]
-        try:
-            #filter functions (take aways those who don't have a function set)
-            initial = [ x for x in initial if constraints[x[2]][child_nb][0] ]
-            return random.choice(initial)
-        except:
-            # if there are no functions with function set, use the other ones
-            return random.choice(self.__rules__[parent[2]][child_nb][1])
+        if node[1] == 0:
+            return node
+        if full:
+            return self.AddFullNode(node, depth, maxdepth)
+        return self.AddGrowNodeMin(node, depth, mindepth, maxdepth)
 
 
 # The FULL method (see KOZA GP Vol I and II)
@@ -203,68 +301,35 @@ cdef class BuildTree(object):
         @return: returns a tree built using Koza Full
         """
         cdef list result
-        cdef int myDepth
-        cdef list listdepth
-
+        cdef tuple slots
+        cdef int i
 
-        result = [parent]
-        myDepth = depth
         # stopping condition - when maximum depth is reached
-        if myDepth == maxdepth:
+        if depth == maxdepth:
             return parent
+
         # add branch upon branch until before maximum depth,
         # then, build leafs
-        else:
-            # if the parent node is a function,
-            result = [parent]
-            # get the number of children of this function (arity)
-            nbChildren = parent[1]
-            listdepth = []
-
-            # for every child
-            for i in xrange(nbChildren):
-                # add a new depth counter
-                listdepth.append(myDepth)
-
-                # if near max depth add a leaf
-                if maxdepth - listdepth[i] == 1:
-                    result.append(self.setRandomLeafChild(parent, i))
-
-                # if 2 nodes from max depth, only use functions which have a terminal set
-                elif maxdepth - listdepth[i] == 2:
-                    try:
-                        result.append(self.AddFullNode( \
-                                        self.setRandomBranchWithTerminalSet(parent, i),
-                                        listdepth[i] + 1,
-                                        maxdepth))
-                        listdepth[i] = listdepth[i] + 1
-                    except:
-                        try:
-                            result.append(self.AddFullNode( \
-                                        self.setRandomBranchChild(parent, i),
-                                        listdepth[i] + 1,
-                                        maxdepth))
-                            listdepth[i] = listdepth[i] + 1
-                        except:
-                            result.append(self.setRandomLeafChild(parent, i))
-
-                # else add a branch
-                else:
-                    try:
-                        result.append(self.AddFullNode( \
-                                        self.setRandomBranchWithFunctionSet(parent, i),
-                                        listdepth[i] + 1,
-                                        maxdepth))
-                        listdepth[i] = listdepth[i]+1
-                    except:
-                        try:
-                            result.append(self.AddFullNode( \
-                                    self.setRandomBranchChild(parent, i),
-                                    listdepth[i] + 1,
-                                    maxdepth))
-                            listdepth[i] = listdepth[i]+1
-                        except:
-                            result.append(self.setRandomLeafChild(parent, i))
+        result = [parent]
+        slots = self._get_slots(parent)
+
+        # for every child
+        for i in xrange(parent[1]):
+            # if near max depth add a leaf
+            if maxdepth - depth == 1:
+                result.append(self.setRandomLeafChild(parent, slots[i], i))
+
+            # if 2 nodes from max depth, only use functions which have a terminal set
+            elif maxdepth - depth == 2:
+                result.append(self._add_child(
+                        self.setRandomChild(parent, slots[i], i, BRANCHES_WITH_TERMINALS),
+                        depth + 1, 0, maxdepth, True))
+
+            # else add a branch
+            else:
+                result.append(self._add_child(
+                        self.setRandomChild(parent, slots[i], i, BRANCHES_WITH_FUNCTIONS),
+                        depth + 1, 0, maxdepth, True))
 
         return result
 
@@ -282,66 +347,42 @@ cdef class BuildTree(object):
         @param maxdepth: max tree depth (in principle unlimited - careful with memory limitation through :))
         @return: returns a tree built using Koza Full
         """
-        cdef list result, listdepth
-        cdef int myDepth
-  
-        myDepth = depth
+        cdef list result
+        cdef tuple slots, slot
+        cdef int i
+
         # stopping condition - when maximum depth is reached
-        if myDepth == maxdepth:
+        if depth == maxdepth:
             return parent
+
         # add branch upon branch until before maximum depth,
         # then, build leafs
-        else:
-            # if the parent node is a function,
-
-            result = [parent]
-            # get the number of children of this function (arity)
-            nbChildren = parent[1]
-            listdepth = []
-            # for every child
-            for i in xrange(nbChildren):
-                # add a new depth counter
-                listdepth.append(myDepth)
-
-                # if near max depth add a leaf
-                if maxdepth - listdepth[i] == 1:
-                    result.append(self.setRandomLeafChild(parent, i))
-
-                # if 2 nodes from max depth, only use functions which have a terminal set
-                elif maxdepth - listdepth[i] == 2 \
-                    or depth - mindepth-1 <= -1:
-                    try:
-                        result.append(self.AddGrowNodeMin( \
-                                self.setRandomBranchWithTerminalSet(parent, i),
-                                listdepth[i] + 1,
-                                mindepth,
-                                maxdepth))
-                    except:
-                        logging.debug("Unable to build a branch with a terminal set")
-                        try:
-                            result.append(self.AddGrowNodeMin( \
-                                            self.setRandomBranchChild(parent, i),
-                                            listdepth[i] + 1,
-                                            mindepth,
-                                            maxdepth))
-                            listdepth[i] = listdepth[i] + 1
-                            logging.debug("Unable to build a branch with a branch")
-                        except:
-                            result.append(self.setRandomLeafChild(parent, i))
-
-
-                # else in normal cases, add randomly a branch or a leave
-                else:
-                    chosenType = random.randint(0, 1)
-                    if chosenType:
-                        result.append(self.AddGrowNodeMin( \
-                                            self.setRandomBranchChild(parent, i),
-                                            listdepth[i] + 1,
-                                            mindepth,
-                                            maxdepth))
-                        listdepth[i] = listdepth[i] + 1
-                    else:
-                        result.append(self.setRandomLeafChild(parent, i))
+        result = [parent]
+        slots = self._get_slots(parent)
+
+        # for every child
+        for i in xrange(parent[1]):
+            slot = slots[i]
+
+            # if near max depth add a leaf
+            if maxdepth - depth == 1:
+                result.append(self.setRandomLeafChild(parent, slot, i))
+
+            # if 2 nodes from max depth (or under the min depth),
+            # only use functions which have a terminal set
+            elif maxdepth - depth == 2 or depth < mindepth:
+                result.append(self._add_child(
+                        self.setRandomChild(parent, slot, i, BRANCHES_WITH_TERMINALS),
+                        depth + 1, mindepth, maxdepth, False))
+
+            # else in normal cases, add randomly a branch or a leave
+            # (the other kind when the chosen one is not allowed here)
+            elif slot[BRANCHES] and (random.randint(0, 1) or not slot[LEAVES]):
+                result.append(self._add_child(
+                        self.setRandomBranchChild(parent, slot, i),
+                        depth + 1, mindepth, maxdepth, False))
+            else:
+                result.append(self.setRandomLeafChild(parent, slot, i))
 
         return result
 
@@ -366,3 +407,315 @@ cdef class BuildTree(object):
         else:
             return self.AddGrowNodeMin(parent, depth, mindepth, randomDepth)
 
+
+    cdef _compile_tables(self):
+        """
+        Build the id version of the slots index of all the nodes of the
+        grammar, as flat arrays: the kind k of the slot i of the node of id s
+        is the list pool[start[j]:start[j] + count[j]] with
+        j = (base[s] + i) * NB_KINDS + k.
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef list base = []
+        cdef list start = []
+        cdef list count = []
+        cdef list pool = []
+        cdef int symbol, kind
+        cdef int nb_rows = 0
+
+        for symbol in xrange(len(grammar)):
+            slots = self._get_slots(grammar.node(symbol))
+            base.append(nb_rows)
+            nb_rows += len(slots)
+            for slot in slots:
+                for kind in xrange(NB_KINDS):
+                    start.append(len(pool))
+                    count.append(len(slot[kind]))
+                    pool.extend([grammar.intern(node) for node in slot[kind]])
+
+        self.__tables_base__ = np.array(base, dtype=ID_TYPE)
+        self.__tables_start__ = np.array(start, dtype=ID_TYPE)
+        self.__tables_count__ = np.array(count, dtype=ID_TYPE)
+        self.__tables_pool__ = np.array(pool, dtype=ID_TYPE)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def generate(self, int n, str method='AddHalfNode', int mindepth=2, int maxdepth=8,
+                 tuple root=(0,1,'root'), rng=None, int minsize=1, int maxsize=0):
+        """
+        Function:  generate
+        ===================
+
+        Build n trees at once, in the same prefix arrays.
+
+        The methods are the same than AddFullNode, AddGrowNodeMin,
+        AddHalfNode and AddPTC2Node, but the random numbers are drawn by blocks from a
+        numpy generator and the nodes are written as ids of the grammar
+        (see pystepx.tree.gptree.TreeBuffer).
+        With the ramped half-and-half method, the depths from mindepth to
+        maxdepth are used in turn along the batch (starting from a random
+        one), half of the trees of each depth being built with the full
+        method and the other half with the grow method.
+        With the PTC2 method, the number of nodes of each tree is drawn
+        uniformly between minsize and maxsize (mindepth is not used).
+
+        @param n: number of trees to build
+        @param method: 'AddHalfNode', 'AddFullNode', 'AddGrowNodeMin' or
+                       'AddPTC2Node' (or 'PTC2')
+        @param mindepth: min tree depth
+        @param maxdepth: max tree depth
+        @param root: the root node of the trees e.g. (0,1,'root')
+        @param rng: a numpy.random.RandomState, or the seed of a new one
+                    (by default, seeded from the random module)
+        @param minsize: min number of nodes of the trees (PTC2 only)
+        @param maxsize: max number of nodes of the trees (PTC2 only)
+        @return: a TreeBuffer of the n trees
+        """
+        cdef Grammar grammar = self.__grammar__
+        cdef RandomStream stream
+        cdef int root_id = grammar.intern(root)
+        cdef int nb_depths = maxdepth - mindepth + 1
+        cdef int t, ramp, tree_min, tree_max, top, symbol, slot, depth, kind, row, child, count
+        cdef bint full
+        cdef long length = 0
+        cdef long capacity = max(n * 16, 1024)
+        cdef bint ptc2 = method in ('PTC2', 'AddPTC2Node')
+        cdef list ptc2_nodes, ptc2_sizes
+
+        if not ptc2 and method not in ('AddHalfNode', 'AddFullNode', 'AddGrowNodeMin'):
+            raise ValueError, "Unknown build method %s" % method
+        if not ptc2 and nb_depths < 1:
+            raise ValueError, "mindepth must not be greater than maxdepth"
+        if ptc2 and (minsize < 1 or maxsize < minsize):
+            raise ValueError, "PTC2 needs 1 <= minsize <= maxsize"
+
+        if rng is None:
+            rng = np.random.RandomState(random.getrandbits(32))
+        elif not isinstance(rng, np.random.RandomState):
+            rng = np.random.RandomState(rng)
+        stream = RandomStream(rng)
+        # the ramp starts at a random place, so small batches are not all alike
+        ramp = stream.choice(2 * nb_depths)
+
+        # Tables are (re)compiled when new nodes have been met
+        if self.__tables_base__ is None or self.__tables_base__.shape[0] != len(grammar):
+            self._compile_tables()
+
+        cdef np.ndarray[ID_TYPE_t, ndim=1] base = self.__tables_base__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] start = self.__tables_start__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] counts = self.__tables_count__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] pool = self.__tables_pool__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] arities = grammar.arities
+
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes = np.empty(capacity, dtype=ID_TYPE)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = np.empty(capacity, dtype=ID_TYPE)
+        cdef np.ndarray[np.int64_t, ndim=1] offsets = np.empty(n + 1, dtype=np.int64)
+
+        # Stack of the branches being built
+        cdef np.ndarray[ID_TYPE_t, ndim=1] st_symbol = np.empty(maxdepth + 2, dtype=ID_TYPE)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] st_slot = np.empty(maxdepth + 2, dtype=ID_TYPE)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] st_depth = np.empty(maxdepth + 2, dtype=ID_TYPE)
+        cdef np.ndarray[np.int64_t, ndim=1] st_position = np.empty(maxdepth + 2, dtype=np.int64)
+
+        for t in xrange(n):
+            if method == 'AddHalfNode':
+                tree_min = mindepth
+                tree_max = mindepth + (t + ramp) % nb_depths
+                full = ((t + ramp) // nb_depths) % 2 == 0
+            else:
+                tree_min = mindepth
+                tree_max = maxdepth
+                full = method == 'AddFullNode'
+
+            offsets[t] = length
+
+            if ptc2:
+                ptc2_nodes, ptc2_sizes = self._build_ptc2(stream, root_id,
+                        minsize + stream.choice(maxsize - minsize + 1), maxdepth)
+                while length + len(ptc2_nodes) > capacity:
+                    capacity *= 2
+                    nodes = np.concatenate((nodes, np.empty(capacity - nodes.shape[0], dtype=ID_TYPE)))
+                    sizes = np.concatenate((sizes, np.empty(capacity - sizes.shape[0], dtype=ID_TYPE)))
+                nodes[length:length + len(ptc2_nodes)] = ptc2_nodes
+                sizes[length:length + len(ptc2_sizes)] = ptc2_sizes
+                length += len(ptc2_nodes)
+                continue
+
+            if length + maxdepth + 2 > capacity:
+                capacity *= 2
+                nodes = np.concatenate((nodes, np.empty(capacity - nodes.shape[0], dtype=ID_TYPE)))
+                sizes = np.concatenate((sizes, np.empty(capacity - sizes.shape[0], dtype=ID_TYPE)))
+
+            nodes[length] = root_id
+            sizes[length] = 1
+            top = -1
+            if tree_max > 0 and arities[root_id] > 0:
+                top = 0
+                st_symbol[0] = root_id
+                st_slot[0] = 0
+                st_depth[0] = 0
+                st_position[0] = length
+            length += 1
+
+            while top >= 0:
+                symbol = st_symbol[top]
+                slot = st_slot[top]
+                depth = st_depth[top]
+
+                # all the children are built
+                if slot == arities[symbol]:
+                    sizes[st_position[top]] = length - st_position[top]
+                    top -= 1
+                    continue
+                st_slot[top] = slot + 1
+
+                row = (base[symbol] + slot) * NB_KINDS
+                # if near max depth add a leaf
+                if tree_max - depth == 1:
+                    kind = LEAVES
+                # if 2 nodes from max depth (or under the min depth with grow),
+                # only use functions which have a terminal set
+                elif tree_max - depth == 2 or (not full and depth < tree_min):
+                    kind = BRANCHES_WITH_TERMINALS
+                elif full:
+                    kind = BRANCHES_WITH_FUNCTIONS
+                # else add randomly a branch or a leave
+                elif counts[row + BRANCHES] > 0 \
+                        and (stream.next() < 0.5 or counts[row + LEAVES] == 0):
+                    kind = BRANCHES
+                else:
+                    kind = LEAVES
+
+                count = counts[row + kind]
+                if count == 0:
+                    self._raise_empty(symbol, slot, kind)
+                child = pool[start[row + kind] + stream.choice(count)]
+
+                if length == capacity:
+                    capacity *= 2
+                    nodes = np.concatenate((nodes, np.empty(capacity - nodes.shape[0], dtype=ID_TYPE)))
+                    sizes = np.concatenate((sizes, np.empty(capacity - sizes.shape[0], dtype=ID_TYPE)))
+                nodes[length] = child
+                sizes[length] = 1
+                if kind != LEAVES and arities[child] > 0:
+                    top += 1
+                    st_symbol[top] = child
+                    st_slot[top] = 0
+                    st_depth[top] = depth + 1
+                    st_position[top] = length
+                length += 1
+
+        offsets[n] = length
+        return TreeBuffer(nodes[:length].copy(), sizes[:length].copy(), offsets, grammar)
+
+    cdef int _raise_empty(self, int symbol, int slot, int kind) except -1:
+        """Raises the exception telling that the kind of nodes is empty for the slot."""
+        logging.debug( ''.join([ 'problem with ', str(self.__grammar__.node(symbol)), ' at child ', str(slot)]))
+        if kind == LEAVES:
+            raise NoTerminalSet, "Empty terminal set! This parent has no leaf  node to choose from!" \
+                    + str(self.__grammar__.node(symbol))
+        raise NoFunctionSet, "Empty function set! This parent has no branch node to choose from!"
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef tuple _build_ptc2(self, RandomStream stream, int root_id, int target, int maxdepth):
+        """
+        Build one tree with the Probabilistic Tree Creation 2 method
+        (Luke, 2000) and returns its ids and subtree sizes in prefix order.
+
+        The free child slots are kept in a list. While the number of nodes
+        plus the number of free slots is under the target size, a random free
+        slot is filled with a branch (whose slots become free); the remaining
+        free slots are then filled with leaves. Near maxdepth, the choices
+        follow the same rules than the full method.
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] base = self.__tables_base__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] start = self.__tables_start__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] counts = self.__tables_count__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] pool = self.__tables_pool__
+        cdef np.ndarray[ID_TYPE_t, ndim=1] arities = self.__grammar__.arities
+        cdef list symbols = [root_id]
+        cdef list depths = [0]
+        cdef list children = [[]]
+        cdef list free = []
+        cdef list prefix, prefix_sizes, stack, node_sizes
+        cdef int i, index, node, slot, symbol, depth, row, kind, count, child
+        cdef bint expand
+
+        if maxdepth > 0:
+            free = [(0, slot) for slot in xrange(arities[root_id])]
+            children[0] = [-1] * arities[root_id]
+
+        while free:
+            # take a random free slot
+            index = stream.choice(len(free))
+            node, slot = free[index]
+            last = free.pop()
+            if index < len(free):
+                free[index] = last
+
+            symbol = symbols[node]
+            depth = depths[node]
+            row = (base[symbol] + slot) * NB_KINDS
+            expand = len(symbols) + len(free) + 1 < target
+
+            if maxdepth - depth == 1:
+                kind = LEAVES
+            elif maxdepth - depth == 2 and (expand or counts[row + LEAVES] == 0):
+                kind = BRANCHES_WITH_TERMINALS
+            elif expand and counts[row + BRANCHES] > 0:
+                kind = BRANCHES
+            elif counts[row + LEAVES] > 0:
+                kind = LEAVES
+            else:
+                kind = BRANCHES_WITH_TERMINALS
+
+            count = counts[row + kind]
+            if count == 0:
+                self._raise_empty(symbol, slot, kind)
+            child = pool[start[row + kind] + stream.choice(count)]
+
+            children[node][slot] = len(symbols)
+            symbols.append(child)
+            depths.append(depth + 1)
+            if kind != LEAVES and arities[child] > 0:
+                free.extend([(len(symbols) - 1, i) for i in xrange(arities[child])])
+                children.append([-1] * arities[child])
+            else:
+                children.append([])
+
+        # children are always created after their parent
+        node_sizes = [1] * len(symbols)
+        for node in xrange(len(symbols) - 1, -1, -1):
+            for child in children[node]:
+                node_sizes[node] += node_sizes[child]
+
+        prefix = []
+        prefix_sizes = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            prefix.append(symbols[node])
+            prefix_sizes.append(node_sizes[node])
+            stack.extend(reversed(children[node]))
+
+        return prefix, prefix_sizes
+
+    cpdef list AddPTC2Node(self, tuple parent, int depth, int minsize, int maxsize, int maxdepth):
+        """
+        Function:  AddPTC2Node
+        ======================
+
+        Build a tree using the Probabilistic Tree Creation 2 method:
+        the number of nodes of the tree is drawn uniformly between
+        minsize and maxsize (see generate).
+
+        @param parent: the parent node (generally a root node) e.g. (0,2,'root')
+        @param depth: starting depth (0 when building a tree from scratch)
+        @param minsize: min number of nodes of the tree
+        @param maxsize: max number of nodes of the tree
+        @param maxdepth: max tree depth
+        @return: returns a tree built using PTC2
+        """
+        return self.generate(1, 'PTC2', 0, maxdepth - depth, parent, None,
+                             minsize, maxsize).to_list(0)
@@ -0,0 +1,37 @@
+cimport numpy as np
+
+cdef class SymbolTable(object):
+    cdef public dict _ids
+    cdef public list _nodes
+
+    cpdef int intern(self, tuple node) except -1
+    cpdef tuple node(self, int symbol)
+
+
+cdef class GPTree(object):
+    cdef readonly np.ndarray nodes
+    cdef readonly np.ndarray sizes
+    cdef readonly np.ndarray depths
+    cdef readonly np.ndarray parents
+    cdef readonly SymbolTable symbols
+    cdef long _hash
+    cdef bint _hashed
+
+    cpdef list to_list(self)
+    cpdef int depth(self)
+    cpdef np.ndarray heights(self)
+    cpdef list children(self, int position)
+    cpdef int slot(self, int position)
+    cpdef list path(self, int position)
+    cpdef GPTree subtree(self, int position)
+    cpdef GPTree replace(self, int position, GPTree fragment)
+
+
+cdef class TreeBuffer(object):
+    cdef readonly np.ndarray nodes
+    cdef readonly np.ndarray sizes
+    cdef readonly np.ndarray offsets
+    cdef readonly SymbolTable symbols
+
+    cpdef GPTree tree(self, int index)
+    cpdef list to_list(self, int index)
@@ -0,0 +1,483 @@
+# cython: profile=True
+
+"""
+:mod:`pystepx.tree.gptree` -- Compact tree representation
+=========================================================
+
+Store a tree as a set of flat typed arrays instead of nested lists.
+
+The nodes are stored in prefix order (a node is always followed by its
+children subtrees) as small integer ids interned in a `SymbolTable`.
+The sizes of the subtrees, the depth of each node and the offset of its
+parent are computed once when the tree is built and kept with it, so
+the operators do not have to walk the whole nested list again each time
+they need this information (see `crossutil.GetIndicesMappingFromTree`).
+
+The nested list representation stays the reference one (fitness functions,
+database storage); `GPTree.from_list` and `GPTree.to_list` convert between
+the two representations. A node stored alone in a list, [(3,0,'x')], carries
+no more information than the node itself: it is stored as (3,0,'x').
+"""
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+import numpy as np
+cimport numpy as np
+
+from pystepx.tree.treeutil import TreeUtilError, NotAList, EmptyList
+
+
+class UnknownSymbol(TreeUtilError):
+    """The node id is not known by the symbol table"""
+    pass
+
+
+ID_TYPE = np.int32
+ctypedef np.int32_t ID_TYPE_t
+
+
+cdef class SymbolTable(object):
+    """
+    Intern the node tuples (type, arity, name) in small integer ids.
+
+    The same node tuple always get the same id in a given table, so the
+    trees only store the ids and comparing two nodes is comparing two
+    integers.
+    """
+
+    def __init__(self, nodes=None):
+        """
+        :param nodes: optional list of nodes to intern, in the order of their ids
+        """
+        self._ids = {}
+        self._nodes = []
+
+        if nodes is not None:
+            for node in nodes:
+                self.intern(node)
+
+    cpdef int intern(self, tuple node) except -1:
+        """
+        Returns the id of the node, and allocate it if it is the first
+        time we meet it.
+
+        :param node: node tuple e.g. (1,2,'+')
+        :return: the id of the node
+        """
+        try:
+            return self._ids[node]
+        except KeyError:
+            self._ids[node] = len(self._nodes)
+            self._nodes.append(node)
+            return self._ids[node]
+
+    cpdef tuple node(self, int symbol):
+        """
+        Returns the node tuple corresponding to the id.
+        """
+        if symbol < 0 or symbol >= len(self._nodes):
+            raise UnknownSymbol, "Unknown symbol id %d" % symbol
+        return self._nodes[symbol]
+
+    def get_nodes(self):
+        """Returns the list of the interned nodes, ordered by id."""
+        return list(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __reduce__(self):
+        return (SymbolTable, (self._nodes,))
+
+
+def _rebuild_gptree(str nodes, str sizes, SymbolTable symbols):
+    """Unpickle helper of `GPTree`"""
+    return GPTree.from_prefix(np.fromstring(nodes, dtype=ID_TYPE),
+                              np.fromstring(sizes, dtype=ID_TYPE),
+                              symbols)
+
+
+cdef class GPTree(object):
+    """
+    Tree stored in prefix order in typed arrays.
+
+    For the node at position i:
+     - nodes[i] is its symbol id
+     - sizes[i] is the number of nodes of the subtree rooted at i
+       (the subtree spans positions i to i + sizes[i] - 1)
+     - depths[i] is its depth (0 for the root node)
+     - parents[i] is the position of its parent (-1 for the root node)
+
+    A GPTree must be considered as immutable: the operations
+    build new trees.
+    """
+
+    def __init__(self, np.ndarray nodes, np.ndarray sizes,
+                 np.ndarray depths, np.ndarray parents, SymbolTable symbols):
+        """
+        Use `GPTree.from_list` to build a tree from its nested list.
+        """
+        self.nodes = nodes
+        self.sizes = sizes
+        self.depths = depths
+        self.parents = parents
+        self.symbols = symbols
+        self._hashed = False
+
+    @staticmethod
+    def from_list(list tree, SymbolTable symbols):
+        """
+        Build the compact version of a nested list tree.
+
+        :param tree: the nested list representing a tree
+        :param symbols: symbol table used to intern the nodes
+        :return: the GPTree
+        """
+        if not tree:
+            raise EmptyList, "Tree should not be empty."
+
+        cdef list nodes = []
+        cdef list depths = []
+        cdef list parents = []
+        cdef list stack = [(tree, -1, 0)]
+        cdef int position, depth, i, n
+
+        while stack:
+            elem, parent, depth = stack.pop()
+            position = len(nodes)
+            parents.append(parent)
+            depths.append(depth)
+
+            if type(elem) is list:
+                nodes.append(symbols.intern(elem[0]))
+                # push in reverse order to pop the children in prefix order
+                for i in xrange(len(elem) - 1, 0, -1):
+                    stack.append((elem[i], position, depth + 1))
+            elif type(elem) is tuple:
+                nodes.append(symbols.intern(elem))
+            else:
+                raise NotAList, "Tree should be a nested list of tuples."
+
+        n = len(nodes)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] a_parents = np.array(parents, dtype=ID_TYPE)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] a_sizes = np.ones(n, dtype=ID_TYPE)
+
+        # children are always after their parent
+        for i in xrange(n - 1, 0, -1):
+            a_sizes[a_parents[i]] += a_sizes[i]
+
+        return GPTree(np.array(nodes, dtype=ID_TYPE),
+                      a_sizes,
+                      np.array(depths, dtype=ID_TYPE),
+                      a_parents,
+                      symbols)
+
+    @staticmethod
+    def from_prefix(np.ndarray nodes, np.ndarray sizes, SymbolTable symbols):
+        """
+        Build a tree from its prefix ordered ids and subtree sizes only
+        (depths and parents are deduced from them).
+
+        :param nodes: symbol ids in prefix order
+        :param sizes: subtree sizes in prefix order
+        :param symbols: symbol table of the ids
+        :return: the GPTree
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] a_sizes = sizes.astype(ID_TYPE)
+        cdef int n = a_sizes.shape[0]
+        cdef np.ndarray[ID_TYPE_t, ndim=1] a_depths = np.zeros(n, dtype=ID_TYPE)
+        cdef np.ndarray[ID_TYPE_t, ndim=1] a_parents = np.empty(n, dtype=ID_TYPE)
+        cdef list opened = [] # (position, end) of the ancestors
+        cdef int i
+
+        for i in xrange(n):
+            while opened and opened[-1][1] <= i:
+                opened.pop()
+            if opened:
+                a_parents[i] = opened[-1][0]
+            else:
+                a_parents[i] = -1
+            a_depths[i] = len(opened)
+            opened.append((i, i + a_sizes[i]))
+
+        return GPTree(nodes.astype(ID_TYPE), a_sizes, a_depths, a_parents, symbols)
+
+    cpdef list to_list(self):
+        """
+        Build the nested list version of the tree.
+
+        Nodes without children are returned as single tuples.
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] nodes = self.nodes
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = self.sizes
+        cdef int n = nodes.shape[0]
+        cdef int i, child
+        cdef list built = [None] * n
+        cdef list sub
+        cdef list table = self.symbols._nodes
+
+        # children are built before their parent
+        for i in xrange(n - 1, -1, -1):
+            if sizes[i] == 1:
+                built[i] = table[nodes[i]]
+            else:
+                sub = [table[nodes[i]]]
+                child = i + 1
+                while child < i + sizes[i]:
+                    sub.append(built[child])
+                    built[child] = None
+                    child = child + sizes[child]
+                built[i] = sub
+
+        if n == 1:
+            return [built[0]]
+        return built[0]
+
+    cpdef int depth(self):
+        """
+        Returns the depth of the tree, with the same convention than
+        `crossutil.GetDepthFromIndicesMapping`.
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = self.sizes
+        cdef np.ndarray[ID_TYPE_t, ndim=1] depths = self.depths
+        cdef int i
+        cdef int deepest = 1
+
+        for i in xrange(1, sizes.shape[0]):
+            if sizes[i] > 1 and depths[i] > deepest:
+                deepest = depths[i]
+        return deepest + 1
+
+    cpdef np.ndarray heights(self):
+        """
+        Returns the height of each subtree: the depth of its deepest node
+        relatively to its root (0 for a leaf).
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] parents = self.parents
+        cdef np.ndarray[ID_TYPE_t, ndim=1] heights = np.zeros(parents.shape[0], dtype=ID_TYPE)
+        cdef int i
+
+        # children are always after their parent
+        for i in xrange(parents.shape[0] - 1, 0, -1):
+            if heights[i] + 1 > heights[parents[i]]:
+                heights[parents[i]] = heights[i] + 1
+        return heights
+
+    cpdef list children(self, int position):
+        """
+        Returns the positions of the children of the node.
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = self.sizes
+        cdef int child = position + 1
+        cdef int end = position + sizes[position]
+        cdef list result = []
+
+        while child < end:
+            result.append(child)
+            child = child + sizes[child]
+        return result
+
+    cpdef int slot(self, int position):
+        """
+        Returns the rank of the node in the children of its parent
+        (0 for the first child) or -1 for the root node.
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = self.sizes
+        cdef np.ndarray[ID_TYPE_t, ndim=1] parents = self.parents
+        cdef int child, rank
+
+        if position == 0:
+            return -1
+
+        child = parents[position] + 1
+        rank = 0
+        while child != position:
+            child = child + sizes[child]
+            rank = rank + 1
+        return rank
+
+    cpdef list path(self, int position):
+        """
+        Returns the path of the node in the nested list, e.g. [1, 2] for
+        tree[1][2] (see `crossutil.IndexLstToIndexStr2`).
+        """
+        cdef np.ndarray[ID_TYPE_t, ndim=1] parents = self.parents
+        cdef list result = []
+
+        while position > 0:
+            result.append(self.slot(position) + 1)
+            position = parents[position]
+        result.reverse()
+        return result
+
+    cpdef GPTree subtree(self, int position):
+        """
+        Returns the subtree rooted at the node as a new tree.
+        """
+        cdef int end = position + self.sizes[position]
+        cdef np.ndarray parents = self.parents[position:end] - position
+        parents[0] = -1
+
+        return GPTree(self.nodes[position:end].copy(),
+                      self.sizes[position:end].copy(),
+                      self.depths[position:end] - self.depths[position],
+                      parents,
+                      self.symbols)
+
+    cpdef GPTree replace(self, int position, GPTree fragment):
+        """
+        Returns a new tree where the subtree rooted at position has been
+        replaced by the fragment.
+        The subtree sizes, depths and parents are updated without walking
+        the tree again.
+
+        :param position: position of the subtree to replace
+        :param fragment: tree to insert (must share the symbol table)
+        """
+        assert fragment.symbols is self.symbols, \
+                "Trees must share the same symbol table"
+
+        cdef np.ndarray[ID_TYPE_t, ndim=1] old_parents = self.parents
+        cdef int end = position + self.sizes[position]
+        cdef int delta = fragment.sizes[0] - self.sizes[position]
+        cdef int ancestor
+
+        cdef np.ndarray nodes = np.concatenate((self.nodes[:position],
+                                                fragment.nodes,
+                                                self.nodes[end:]))
+        cdef np.ndarray depths = np.concatenate((self.depths[:position],
+                                                 fragment.depths + self.depths[position],
+                                                 self.depths[end:]))
+
+        # parents after the replaced subtree are shifted when
+        # they are themselves after it
+        cdef np.ndarray tail = self.parents[end:].copy()
+        tail[tail >= end] += delta
+        cdef np.ndarray inserted = fragment.parents + position
+        inserted[0] = old_parents[position]
+        cdef np.ndarray parents = np.concatenate((self.parents[:position],
+                                                  inserted,
+                                                  tail))
+
+        cdef np.ndarray[ID_TYPE_t, ndim=1] sizes = np.concatenate(
+                                                (self.sizes[:position],
+                                                 fragment.sizes,
+                                                 self.sizes[end:]))
+        ancestor = old_parents[position]
+        while ancestor >= 0:
+            sizes[ancestor] += delta
+            ancestor = old_parents[ancestor]
+
+        return GPTree(nodes, sizes, depths, parents, self.symbols)
+
+    property nbytes:
+        """Memory used by the arrays of the tree"""
+        def __get__(self):
+            return self.nodes.nbytes + self.sizes.nbytes \
+                    + self.depths.nbytes + self.parents.nbytes
+
+    def __len__(self):
+        return self.nodes.shape[0]
+
+    def __hash__(self):
+        """
+        Structural hash of the tree (computed once).
+        """
+        if not self._hashed:
+            self._hash = hash(self.nodes.tostring())
+            self._hashed = True
+        return self._hash
+
+    def __richcmp__(GPTree self, other, int op):
+        cdef bint equal
+
+        if op not in (2, 3):
+            return NotImplemented
+        equal = isinstance(other, GPTree) \
+                and self.symbols is (<GPTree>other).symbols \
+                and hash(self) == hash(other) \
+                and np.array_equal(self.nodes, (<GPTree>other).nodes) \
+                and np.array_equal(self.sizes, (<GPTree>other).sizes)
+        if op == 2:
+            return equal
+        return not equal
+
+    def __reduce__(self):
+        return (_rebuild_gptree,
+                (self.nodes.tostring(), self.sizes.tostring(), self.symbols))
+
+    def __repr__(self):
+        return 'GPTree(%d nodes, depth %d)' % (len(self), self.depth())
+
+
+cdef class TreeBuffer(object):
+    """
+    Several trees stored one after the other in the same prefix arrays.
+
+    The tree number i spans the positions offsets[i] to offsets[i+1] - 1
+    of nodes and sizes (see `GPTree`).
+    """
+
+    def __init__(self, np.ndarray nodes, np.ndarray sizes,
+                 np.ndarray offsets, SymbolTable symbols):
+        """
+        :param nodes: symbol ids of all the trees in prefix order
+        :param sizes: subtree sizes of all the trees in prefix order
+        :param offsets: start of each tree, followed by the total number of nodes
+        :param symbols: symbol table of the ids
+        """
+        self.nodes = nodes
+        self.sizes = sizes
+        self.offsets = offsets
+        self.symbols = symbols
+
+    cpdef GPTree tree(self, int index):
+        """Returns the GPTree of the tree number index."""
+        cdef long start = self.offsets[index]
+        cdef long end = self.offsets[index + 1]
+        return GPTree.from_prefix(self.nodes[start:end], self.sizes[start:end], self.symbols)
+
+    cpdef list to_list(self, int index):
+        """Returns the nested list of the tree number index."""
+        return self.tree(index).to_list()
+
+    def to_lists(self):
+        """Returns the nested lists of all the trees."""
+        return [self.to_list(i) for i in xrange(len(self))]
+
+    property nbytes:
+        """Memory used by the arrays of the buffer"""
+        def __get__(self):
+            return self.nodes.nbytes + self.sizes.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, int index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError, "tree index out of range"
+        return self.tree(index)
+
+    def __reduce__(self):
+        return (TreeBuffer, (self.nodes, self.sizes, self.offsets, self.symbols))
+
+    def __repr__(self):
+        return 'TreeBuffer(%d trees, %d nodes)' % (len(self), self.nodes.shape[0])
@@ -0,0 +1,23 @@
+cimport numpy as np
+from pystepx.tree.gptree cimport SymbolTable, GPTree
+
+cdef class Grammar(SymbolTable):
+    cdef readonly dict rules
+    cdef readonly np.ndarray types
+    cdef readonly np.ndarray arities
+    cdef readonly list names
+    cdef readonly list functions
+    cdef readonly list terminals
+    cdef readonly list allowed
+    cdef list _min_sizes
+
+    cdef _compile_symbol(self, int symbol)
+    cdef _compile_arrays(self)
+    cpdef int intern(self, tuple node) except -1
+    cpdef int nb_slots(self, int symbol)
+    cpdef np.ndarray get_functions(self, int symbol, int slot)
+    cpdef np.ndarray get_terminals(self, int symbol, int slot)
+    cpdef bint is_allowed(self, int parent, int slot, int symbol)
+    cpdef min_size(self, int symbol)
+    cpdef GPTree encode(self, list tree)
+    cpdef list decode(self, GPTree tree)
@@ -0,0 +1,223 @@
+# cython: profile=True
+
+"""
+:mod:`pystepx.tree.grammar` -- Compiled tree rules
+==================================================
+
+The tree rules are given as a dictionary indexed by the name of the parent
+node, giving for each child slot the list of the allowed function nodes and
+the list of the allowed terminal nodes::
+
+    treeRules = {'root':[(defaultFunctionSet,defaultTerminalSet)],
+                 '+':[(defaultFunctionSet,defaultTerminalSet),(defaultFunctionSet,defaultTerminalSet)],
+                 ...}
+
+`Grammar` compiles this dictionary once: each node of the rules gets a small
+integer id (always the same for the same rules), the type, arity and name of
+the nodes are stored in parallel arrays, and the allowed children of each
+(node, slot) are stored as arrays of ids.
+The operators then work with integer indexed tables instead of looking for
+the node name in the rules dictionary at each step.
+"""
+"""
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+@author: by Romain Giot
+@version: 1.30
+@copyright: (c) 2010 Romain Giot under the mit license
+http://www.opensource.org/licenses/mit-license.html
+@contact: giot.romain at gmail.com
+"""
+
+import numpy as np
+cimport numpy as np
+
+from pystepx.tree.gptree import ID_TYPE
+from pystepx.tree.gptree cimport SymbolTable, GPTree
+from pystepx.tree.treeconstants import NODE_TYPE, NB_CHILDREN, NODE_NAME
+
+
+cdef np.ndarray _EMPTY = np.zeros(0, dtype=ID_TYPE)
+
+
+def _rebuild_grammar(rules, nodes):
+    """Unpickle helper of `Grammar`"""
+    return Grammar(rules, nodes)
+
+
+cdef class Grammar(SymbolTable):
+    """
+    Tree rules compiled in integer indexed tables.
+
+    For the node of id i:
+     - types[i], arities[i] and names[i] are the members of its tuple
+     - functions[i][slot] (resp. terminals[i][slot]) is the array of the ids
+       of the function (resp. terminal) nodes allowed as child number slot
+     - allowed[i][slot] is the set of all the ids allowed as child number slot
+
+    Nodes without rules (the terminals) have no slots.
+    """
+
+    def __init__(self, dict rules, nodes=None):
+        """
+        Compile the rules.
+
+        :param rules: the tree rules
+        :param nodes: optional list of nodes to intern first, in the order
+                      of their ids (the other nodes of the rules are interned
+                      after them, in sorted order)
+        """
+        cdef set symbols = set()
+        cdef int symbol
+
+        self._ids = {}
+        self._nodes = []
+        self.rules = rules
+        self.names = []
+        self.functions = []
+        self.terminals = []
+        self.allowed = []
+        self._min_sizes = None
+        self.types = _EMPTY
+        self.arities = _EMPTY
+
+        for slots in rules.itervalues():
+            for function_set, terminal_set in slots:
+                symbols.update(function_set)
+                symbols.update(terminal_set)
+
+        # Give all the ids before compiling the slots which refer to them
+        for node in list(nodes or []) + sorted(symbols):
+            if node not in self._ids:
+                self._ids[node] = len(self._nodes)
+                self._nodes.append(node)
+
+        for symbol in xrange(len(self._nodes)):
+            self._compile_symbol(symbol)
+        self._compile_arrays()
+
+    cdef _compile_symbol(self, int symbol):
+        """Build the tables of the slots of the node."""
+        cdef tuple node = self._nodes[symbol]
+        cdef list functions = []
+        cdef list terminals = []
+        cdef list allowed = []
+
+        for function_set, terminal_set in self.rules.get(node[NODE_NAME], []):
+            functions.append(np.array([self.intern(child) for child in function_set],
+                                      dtype=ID_TYPE))
+            terminals.append(np.array([self.intern(child) for child in terminal_set],
+                                      dtype=ID_TYPE))
+            allowed.append(frozenset(functions[-1]) | frozenset(terminals[-1]))
+
+        self.names.append(node[NODE_NAME])
+        self.functions.append(functions)
+        self.terminals.append(terminals)
+        self.allowed.append(allowed)
+
+    cdef _compile_arrays(self):
+        """Build the parallel arrays of types and arities."""
+        self.types = np.array([node[NODE_TYPE] for node in self._nodes], dtype=ID_TYPE)
+        self.arities = np.array([node[NB_CHILDREN] for node in self._nodes], dtype=ID_TYPE)
+
+    cpdef int intern(self, tuple node) except -1:
+        """
+        Returns the id of the node.
+        Nodes which do not appear in the rules (generally the root node)
+        get a new id the first time they are met.
+        """
+        cdef int symbol
+
+        try:
+            return self._ids[node]
+        except KeyError:
+            pass
+
+        symbol = SymbolTable.intern(self, node)
+        self._compile_symbol(symbol)
+        self._compile_arrays()
+        return symbol
+
+    cpdef int nb_slots(self, int symbol):
+        """Returns the number of child slots defined by the rules of the node."""
+        return len(self.functions[symbol])
+
+    cpdef np.ndarray get_functions(self, int symbol, int slot):
+        """Returns the ids of the function nodes allowed in the slot of the node."""
+        return self.functions[symbol][slot]
+
+    cpdef np.ndarray get_terminals(self, int symbol, int slot):
+        """Returns the ids of the terminal nodes allowed in the slot of the node."""
+        return self.terminals[symbol][slot]
+
+    cpdef bint is_allowed(self, int parent, int slot, int symbol):
+        """
+        Returns True if the node can be the child number slot of the parent.
+        """
+        cdef list slots = self.allowed[parent]
+        if slot < 0 or slot >= len(slots):
+            return False
+        return symbol in slots[slot]
+
+    cpdef min_size(self, int symbol):
+        """
+        Returns the number of nodes of the smallest subtree whose top node is
+        the node (infinite when the rules never end the subtree).
+        The nodes of null arity are leaves, the other ones always get their
+        children.
+        """
+        cdef list sizes
+        cdef int node
+        cdef bint changed = True
+
+        if self._min_sizes is None or len(self._min_sizes) != len(self._nodes):
+            # fixed point from infinite sizes
+            sizes = [float('inf')] * len(self._nodes)
+            while changed:
+                changed = False
+                for node in xrange(len(self._nodes)):
+                    size = 1
+                    for slot in xrange(len(self.functions[node]) if self.arities[node] > 0 else 0):
+                        if len(self.terminals[node][slot]) > 0:
+                            size += 1
+                        else:
+                            size += min([sizes[child] for child in self.functions[node][slot]] \
+                                        or [float('inf')])
+                    if size < sizes[node]:
+                        sizes[node] = size
+                        changed = True
+            self._min_sizes = sizes
+        return self._min_sizes[symbol]
+
+    def get_id(self, tuple node):
+        """Returns the id of the node (an alias of `intern`)."""
+        return self.intern(node)
+
+    cpdef GPTree encode(self, list tree):
+        """Returns the GPTree version of the nested list tree."""
+        return GPTree.from_list(tree, self)
+
+    cpdef list decode(self, GPTree tree):
+        """Returns the nested list version of the GPTree."""
+        return tree.to_list()
+
+    def __reduce__(self):
+        return (_rebuild_grammar, (self.rules, self._nodes))
+
+
+cpdef Grammar compile_rules(dict rules):
+    """
+    Returns the compiled version of the rules.
+    The grammar is not cached: it is kept by the operators and the tree
+    builders, which compile it again in their set_tree_rules (so the rules
+    modified in place are taken into account).
+
+    :param rules: the tree rules
+    """
+    return Grammar(rules)
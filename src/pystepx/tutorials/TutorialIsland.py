@@ -9,16 +9,13 @@ instead of only one.
 import logging
 
 from pystepx.island.pystepislands import PySTEPXIsland
-import subprocess
-import time
 
 class Tutorial1Island(object):
     """Manage the tutorial example in an island mode.
 
-    to launch 4 islands in local, type:
-    ipcluster local -n 4
-
-    It's up to you to launch the engine befoir launching gp.
+    The 4 islands are run by local processes.
+    To run them on an IPython cluster, launch it (ipcluster start --n=4)
+    and give an IPythonBackend to PySTEPXIsland.
     """
 
     def __init__(self):
@@ -26,12 +23,8 @@ class Tutorial1Island(object):
         Each island must have the code in its classpath
         """
 
-        #Launch cluster
-        self._process = subprocess.Popen("ipcluster start --n=4", shell=True, stdout=subprocess.PIPE)
-        time.sleep(10)
-
-
-        init_script = """from pystepx.tutorials.functions_tutorial_island import *;"""
+        init_script = """from pystepx.tutorials.functions_tutorial_island import *;
+gp_engine = build_engine()"""
 
         self._pystepx = PySTEPXIsland(nb_islands=4, init_script=init_script)
 
@@ -50,7 +43,6 @@ def main():
     logging.info('Launch tutorial 1 islands')
     t = Tutorial1Island()
     t.run()
-    subprocess.Popen("ipcluster stop", shell=True, stdout=subprocess.PIPE)
 
 
 if __name__ == "__main__":
@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 """
-Code to launch on all the islands.
+Code to launch on all the islands: the init script of the islands calls
+build_engine to create the engine of the island.
 """
 import logging
 import math
@@ -104,26 +105,33 @@ ideal_results = []
 for nb in xrange(nb_eval):
     ideal_results.append([all_x[nb]**3 + all_x[nb]**2 + math.cos(all_x[nb])])
 
-evolve = evolver.DistributedEvolver(popsize=50, crossover_prob=0.25,
-        mutation_prob=0.25)
-
-gp_engine = PySTEPX()
-gp_engine.set_evolver(evolve)
-gp_engine.set_tree_rules(treeRules)
-gp_engine.set_functions(functions)
-gp_engine.set_terminals(terminals)
-
-
-fte = evalfitness.FitnessTreeEvaluation()
-fte.set_terminals(terminals)
-fte.set_functions(functions)
-fte.check_configuration()
-ffe = evalfitness.FinalFitness(ideal_results, nb_eval)
-
-def FitnessFunction(my_tree):
-    return ffe.FinalFitness(
-        fte.EvalTreeForAllInputSets(my_tree, xrange(nb_eval)))
-gp_engine.set_fitness_function(FitnessFunction)
+def build_engine(max_nb_runs=100, fitness_criterion=0.0000001):
+    """
+    Build the engine of an island. Each island calls it, so the islands
+    sharing a process do not share their engine.
+    """
+    evolve = evolver.DistributedEvolver(popsize=50, crossover_prob=0.25,
+            mutation_prob=0.25, max_nb_runs=max_nb_runs,
+            fitness_criterion=fitness_criterion)
+
+    gp_engine = PySTEPX()
+    gp_engine.set_evolver(evolve)
+    gp_engine.set_tree_rules(treeRules)
+    gp_engine.set_functions(functions)
+    gp_engine.set_terminals(terminals)
+
+
+    fte = evalfitness.FitnessTreeEvaluation()
+    fte.set_terminals(terminals)
+    fte.set_functions(functions)
+    fte.check_configuration()
+    ffe = evalfitness.FinalFitness(ideal_results, nb_eval)
+
+    def FitnessFunction(my_tree):
+        return ffe.FinalFitness(
+            fte.EvalTreeForAllInputSets(my_tree, xrange(nb_eval)))
+    gp_engine.set_fitness_function(FitnessFunction)
+    return gp_engine
 
 if __name__ == "__main__":
-    gp_engine.evolve()
+    build_engine().evolve()
@@ -64,3 +64,30 @@ class WritePop(BaseWritePop):
         cur.close()
         
 
+    def get_individuals(self, tablename, keys):
+        """Returns the required individuals, read in one query.
+
+        @param tablename: Source table
+        @param keys: ids of the individuals (they can be repeated)
+
+        @return: a dictionary giving the (tree, tree mapping, tree depth,
+        evaluated, fitness) tuple of each id
+        """
+
+        result = {}
+        if len(keys) == 0:
+            return result
+
+        cur = self.get_connexion().cursor()
+        select = """
+        SELECT tree, tree_mapping, treedepth, evaluated, fitness, o_id
+        FROM %s
+        WHERE o_id in (%s)
+        """ % (tablename, ",".join(set([str(int(key)) for key in keys])))
+        cur.execute(select)
+
+        for myresult in cur:
+            result[myresult[5]] = self.get_tree_objects(myresult)
+        cur.close()
+
+        return result
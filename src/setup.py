@@ -39,6 +39,8 @@ ext_modules = [
    Extension("pystepx.baseevolver",["pystepx/baseevolver.pyx"]),
    Extension("pystepx.tree.treeconstants",["pystepx/tree/treeconstants.pyx"]),
    Extension("pystepx.tree.buildtree",["pystepx/tree/buildtree.pyx"]),
+   Extension("pystepx.tree.gptree",["pystepx/tree/gptree.pyx"]),
+   Extension("pystepx.tree.grammar",["pystepx/tree/grammar.pyx"]),
    Extension("pystepx.tree.numpyfunctions",["pystepx/tree/numpyfunctions.pyx"]),
    Extension("pystepx.fitness.evalfitness",["pystepx/fitness/evalfitness.pyx"]),
    Extension("pystepx.fitness.fitnessutil",["pystepx/fitness/fitnessutil.pyx"]),